@@ -0,0 +1,143 @@
+"""
+Benchmark the memory used by 100k Appointments and the cost of hashing,
+comparing and conflict checking them, against the former layout of an
+Appointment (a __dict__ holding a day string, time objects and a list of
+participants).
+"""
+
+import os
+import sys
+import time
+import datetime
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Classes"))
+
+from Appointment import Appointment, _DAYS
+from Calendar import Calendar
+
+
+class _DictAppointment(object):
+    """The fields of an Appointment as they were kept before __slots__."""
+
+    def __init__(self, name, day, start, end, participants):
+        self._name = name
+        self._day = day
+        self._start = start
+        self._end = end
+        self._participants = participants
+        self._is_Appointment = True
+
+    def _key(self):
+        return (self._name, self._day, self._start, self._end,
+                tuple(self._participants))
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __eq__(self, other):
+        return self._key()[:4] == other._key()[:4] and \
+            set(self._participants) == set(other._participants)
+
+
+def _fields(i):
+    """Return the constructor arguments of Appointment number i."""
+    start = i % 40
+    return ("a" + str(i), _DAYS[i % 7], start, start + 1 + i % 7,
+            [i % 5, i % 5 + 1 + i % 3])
+
+
+def _size(objects):
+    """
+    Return the bytes held by objects and everything they reference, counting
+    objects shared between them once.
+    """
+    seen, stack, total = set(), list(objects), 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if hasattr(obj, "__dict__"):
+            stack.append(obj.__dict__)
+        for name in getattr(type(obj), "__slots__", ()):
+            stack.append(getattr(obj, name))
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+
+    return total
+
+
+def _times(start, end):
+    """Return time objects for half-hour slots start and end."""
+    return (datetime.time(start // 2, 30 * (start % 2)),
+            datetime.time(end // 2, 30 * (end % 2)))
+
+
+def bench_memory(num_appointments=100000):
+    """Return bytes per Appointment of both layouts."""
+    slotted = [Appointment._from_trusted(name, _DAYS.index(day), start, end,
+                                            frozenset(participants))
+                for name, day, start, end, participants
+                in map(_fields, range(num_appointments))]
+    dicts = []
+    for name, day, start, end, participants in map(
+            _fields, range(num_appointments)):
+        dicts.append(_DictAppointment(
+            name, day, *(_times(start, end) + (participants,))))
+
+    #names are the same strings in both, so leave them out
+    names = sum([sys.getsizeof(appt._name) for appt in slotted])
+    return ((_size(slotted) - names) / float(num_appointments),
+            (_size(dicts) - names) / float(num_appointments))
+
+
+def bench_operations(num_appointments=100000):
+    """
+    Return seconds taken to build a set of num_appointments Appointments,
+    to look each one up in it and to build a conflict free Calendar of a
+    tenth of them.
+    """
+    appointments = [Appointment(name, day, "%d:%02d%s" % (
+                        (start // 2) % 12 or 12, 30 * (start % 2),
+                        "am" if start < 24 else "pm"), "%d:%02d%s" % (
+                        (end // 2) % 12 or 12, 30 * (end % 2),
+                        "am" if end < 24 else "pm"), participants)
+                    for name, day, start, end, participants
+                    in map(_fields, range(num_appointments))]
+
+    start_time = time.time()
+    appointment_set = set(appointments)
+    set_time = time.time() - start_time
+
+    start_time = time.time()
+    for appointment in appointments:
+        appointment in appointment_set
+    lookup_time = time.time() - start_time
+
+    start_time = time.time()
+    calendar = Calendar()
+    for appointment in appointments[:num_appointments // 10]:
+        if not calendar._is_appointment_conflicting(appointment):
+            calendar += appointment
+    calendar_time = time.time() - start_time
+
+    return set_time, lookup_time, calendar_time
+
+
+def main():
+    """Run the benchmarks."""
+    slotted, dicts = bench_memory()
+    print "bytes per Appointment:   %6.0f (__slots__) vs %6.0f (__dict__)" % (
+        slotted, dicts)
+    set_time, lookup_time, calendar_time = bench_operations()
+    print "set() of 100k:           %.3f s" % set_time
+    print "100k membership tests:   %.3f s" % lookup_time
+    print "Calendar of 10k:         %.3f s" % calendar_time
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark committed Operations per second of a 5 node cluster for different
+Proposer batch sizes.
+"""
+
+import time
+
+from cluster import Cluster
+from Appointment import Appointment
+from Operation import Operation
+
+DAYS = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday",
+        "Saturday"]
+
+
+def make_operations(num_operations):
+    """Return num_operations non-conflicting add Operations."""
+    operations = []
+    for i in range(num_operations):
+        hour = i % 10 + 1
+        operations.append(Operation("add", Appointment(
+            "appt" + str(i), DAYS[i // 10 % 7], str(hour) + ":00am",
+            str(hour) + ":30am", [i // 70])))
+    return operations
+
+
+def bench(batch_size, num_operations=2000, num_nodes=5, **proposer_kwargs):
+    """Return committed Operations per second for the given batch_size."""
+    cluster = Cluster(
+        num_nodes, batch_size=batch_size, batch_window=0.002,
+        **proposer_kwargs)
+    cluster.start()
+    operations = make_operations(num_operations)
+
+    start = time.time()
+    for operation in operations:
+        cluster.propose(0, operation)
+    cluster.wait_for_commits(0, num_operations)
+    elapsed = time.time() - start
+
+    cluster.stop()
+    return num_operations / elapsed
+
+
+def main():
+    """Run the benchmarks."""
+    for multi_paxos, pipeline_depth in ((False, 1), (False, 8), (True, 8)):
+        for batch_size in (1, 8, 64):
+            ops = bench(
+                batch_size, multi_paxos=multi_paxos,
+                pipeline_depth=pipeline_depth)
+            print "multi_paxos=%-5s pipeline_depth=%d batch_size=%-3d " \
+                "%8.0f ops/s" % (multi_paxos, pipeline_depth, batch_size, ops)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Benchmark committed Operations per second of a 5 node cluster when two
+Proposers propose concurrently and so duel over the same log slots.
+"""
+
+import time
+
+from cluster import Cluster
+from bench_batching import make_operations
+
+
+def bench(num_proposers, num_operations=1000, num_nodes=5, **proposer_kwargs):
+    """
+    Return committed Operations per second and the number of nacks sent when
+    the Operations are split evenly between num_proposers Proposers.
+    """
+    cluster = Cluster(num_nodes, **proposer_kwargs)
+    cluster.start()
+    operations = make_operations(num_operations)
+
+    start = time.time()
+    for i, operation in enumerate(operations):
+        cluster.propose(i % num_proposers, operation)
+    cluster.wait_for_commits(num_nodes - 1, num_operations)
+    elapsed = time.time() - start
+
+    cluster.stop()
+    return num_operations / elapsed, cluster._message_counts.get("nack", 0)
+
+
+def main():
+    """Run the benchmarks."""
+    for multi_paxos in (False, True):
+        for num_proposers in (1, 2):
+            ops, nacks = bench(
+                num_proposers, multi_paxos=multi_paxos, pipeline_depth=8)
+            print "multi_paxos=%-5s proposers=%d %8.0f ops/s %6d nacks" % (
+                multi_paxos, num_proposers, ops, nacks)
+
+if __name__ == "__main__":
+    main()
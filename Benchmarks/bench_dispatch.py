@@ -0,0 +1,103 @@
+"""
+Benchmark CPU usage of an idle Proposer/Acceptor pair and message handling
+latency of a loaded Acceptor.
+"""
+
+import os
+import sys
+import time
+import thread
+import resource
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Classes"))
+
+from Acceptor import Acceptor
+from Proposer import Proposer
+
+IP_TABLE = {0: ["127.0.0.1", 9000, 10000]}
+
+
+def _cpu_time():
+    """Return user + system CPU seconds used by this process so far."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _enqueue(queue, message):
+    """Add message to a Proposer/Acceptor command queue."""
+    if hasattr(queue, "put"):
+        queue.put(message)
+    else:
+        queue.append(message)
+
+
+def bench_idle(duration=3.0):
+    """Return CPU utilisation of an idle Proposer and Acceptor."""
+    proposer, acceptor = Proposer(0, IP_TABLE), Acceptor(IP_TABLE)
+    thread.start_new_thread(proposer.start, ())
+    thread.start_new_thread(acceptor.start, ())
+    time.sleep(0.5)
+
+    cpu, wall = _cpu_time(), time.time()
+    time.sleep(duration)
+    cpu, wall = _cpu_time() - cpu, time.time() - wall
+
+    _stop(proposer, acceptor)
+    return cpu / wall
+
+
+def bench_loaded(num_messages=2000, interval=0.0005):
+    """
+    Return (CPU utilisation, mean latency, 99th percentile latency) of an
+    Acceptor answering num_messages prepares sent every interval seconds.
+    """
+    replies = {}
+
+    class _RecordingTransport(object):
+        """Transport recording when the promise for each slot was sent."""
+        def send(self, message, ID):
+            replies[message[3]] = time.time()
+
+    acceptor = Acceptor(IP_TABLE, _RecordingTransport())
+    thread.start_new_thread(acceptor.start, ())
+    time.sleep(0.5)
+
+    sent = {}
+    cpu, wall = _cpu_time(), time.time()
+    for i in range(num_messages):
+        sent[i] = time.time()
+        _enqueue(acceptor._command_queue, ("prepare", i, i, 0))
+        time.sleep(interval)
+    while len(replies) < num_messages:
+        time.sleep(0.01)
+    cpu, wall = _cpu_time() - cpu, time.time() - wall
+
+    _stop(None, acceptor)
+    latencies = sorted(replies[i] - sent[i] for i in range(num_messages))
+    mean = sum(latencies) / len(latencies)
+    return cpu / wall, mean, latencies[int(len(latencies) * 0.99)]
+
+
+def _stop(proposer, acceptor):
+    """Stop the given Proposer and Acceptor."""
+    for role in (proposer, acceptor):
+        if role is None:
+            continue
+        if hasattr(role, "terminate"):
+            role.terminate()
+        else:
+            role._terminate = True
+    time.sleep(0.2)
+
+
+def main():
+    """Run the benchmarks."""
+    print "idle Proposer + Acceptor CPU: %5.1f%%" % (bench_idle() * 100)
+    cpu, mean, p99 = bench_loaded()
+    print "loaded Acceptor CPU:          %5.1f%%" % (cpu * 100)
+    print "prepare->promise latency:     mean %.3f ms, p99 %.3f ms" % (
+        mean * 1000, p99 * 1000)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark Appointment construction throughput and time parsing, comparing
+the table lookup of Appointment._parse_slot against the former parser,
+which imported re, matched the pattern and converted the string on every
+call.
+"""
+
+import os
+import sys
+import time
+import datetime
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Classes"))
+
+from Appointment import Appointment, _time_to_slot
+
+#in slot order, i.e., from 12:00am to 11:30pm
+TIME_STRINGS = ["%d:%02d%s" % (hour, minutes, meridiem)
+                for meridiem in ("am", "pm") for hour in [12] + range(1, 12)
+                for minutes in (0, 30)]
+
+
+def _regex_parse_slot(time_string):
+    """The former parser of Appointment._parse_time, returning a slot."""
+    import re
+    pattern = r"\d{1,2}:\d\d(am|pm)"
+    if not re.match(pattern, time_string):
+        raise ValueError("time parameters must be of form "
+                            "(digit){1,2}:(digit){2}(am|pm)..")
+
+    hour, minutes = time_string[:-2].split(":")
+    meridiem = time_string[-2:]
+    hour, minutes = int(hour), int(minutes)
+    if hour < 0 or hour > 12:
+        raise ValueError("hour digits must be between 0 and 12.")
+    if minutes % 30 != 0:
+        raise ValueError("minute digits must be 00 or 30.")
+    if meridiem == "pm" and hour != 12:
+        hour += 12
+    if meridiem == "am":
+        hour %= 12
+    return _time_to_slot(datetime.time(hour, minutes))
+
+
+def bench_parse(parse, num_calls=200000):
+    """Return calls per second of parse over the legal time strings."""
+    strings = TIME_STRINGS * (num_calls // len(TIME_STRINGS))
+    start_time = time.time()
+    for time_string in strings:
+        parse(time_string)
+    return len(strings) / (time.time() - start_time)
+
+
+def bench_construct(num_appointments=100000):
+    """Return Appointments constructed per second from time strings."""
+    fields = [("a" + str(i), "Monday", TIME_STRINGS[i % 40],
+                TIME_STRINGS[i % 40 + 1 + i % 7], [i % 5])
+                for i in range(num_appointments)]
+    start_time = time.time()
+    for name, day, start, end, participants in fields:
+        Appointment(name, day, start, end, participants)
+    return num_appointments / (time.time() - start_time)
+
+
+def main():
+    """Run the benchmarks."""
+    before, after = bench_parse(_regex_parse_slot), bench_parse(
+        Appointment._parse_slot)
+    print "time strings parsed/s:      %9.0f (regex) vs %9.0f (table)" % (
+        before, after)
+
+    #construct with the former parser swapped in, then with the table
+    parse_slot = Appointment._parse_slot
+    Appointment._parse_slot = staticmethod(_regex_parse_slot)
+    before = bench_construct()
+    Appointment._parse_slot = staticmethod(parse_slot)
+    after = bench_construct()
+    print "Appointments constructed/s: %9.0f (regex) vs %9.0f (table)" % (
+        before, after)
+
+if __name__ == "__main__":
+    main()
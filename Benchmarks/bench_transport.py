@@ -0,0 +1,67 @@
+"""
+Benchmark the cost of broadcasting one Paxos message to a 5 Node IP table
+with a socket per datagram versus the shared UDPTransport socket.
+"""
+
+import os
+import sys
+import time
+import pickle
+import socket
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Classes"))
+
+from Transport import UDPTransport
+
+MESSAGE = ("accept", 1234, "\x00PB\x01" + "x" * 40, 17)
+
+
+def _sinks(num_nodes):
+    """Return num_nodes bound UDP sockets and an IP table addressing them."""
+    sinks, ip_table = [], {}
+    for i in range(num_nodes):
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.bind(("127.0.0.1", 0))
+        sinks.append(sink)
+        ip_table[i] = ["127.0.0.1", 9000 + i, sink.getsockname()[1]]
+    return sinks, ip_table
+
+
+def bench_socket_per_datagram(ip_table, num_broadcasts):
+    """Return seconds per broadcast opening a socket for every datagram."""
+    start = time.time()
+    for i in range(num_broadcasts):
+        for ID, IP_info in ip_table.items():
+            transmission = pickle.dumps(MESSAGE)
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.sendto(transmission, (IP_info[0], IP_info[2]))
+            s.close()
+    return (time.time() - start) / num_broadcasts
+
+
+def bench_transport(ip_table, num_broadcasts):
+    """Return seconds per broadcast through a UDPTransport."""
+    transport = UDPTransport(ip_table)
+    start = time.time()
+    for i in range(num_broadcasts):
+        transport.broadcast(MESSAGE)
+    elapsed = time.time() - start
+    transport.close()
+    return elapsed / num_broadcasts
+
+
+def main(num_nodes=5, num_broadcasts=20000):
+    """Run the benchmarks."""
+    sinks, ip_table = _sinks(num_nodes)
+    #socket(), sendto() and close() per peer versus one sendto() per peer
+    print "socket per datagram: %6.1f us/broadcast, %d syscalls" % (
+        bench_socket_per_datagram(ip_table, num_broadcasts) * 1e6,
+        3 * num_nodes)
+    print "shared UDPTransport: %6.1f us/broadcast, %d syscalls" % (
+        bench_transport(ip_table, num_broadcasts) * 1e6, num_nodes)
+    for sink in sinks:
+        sink.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Benchmark committed Operations per second of a 5 node cluster whose Acceptors
+log to a WriteAheadLog, fsyncing every record versus group commit.
+"""
+
+import time
+import shutil
+import tempfile
+
+from cluster import Cluster
+from bench_batching import make_operations
+
+
+def bench(wal_group_size, num_operations=1000, num_nodes=5):
+    """
+    Return committed Operations per second with the given wal_group_size, or
+    without WriteAheadLogs if wal_group_size is None.
+    """
+    wal_dir = None
+    if wal_group_size is not None:
+        wal_dir = tempfile.mkdtemp()
+
+    cluster = Cluster(
+        num_nodes, wal_dir=wal_dir, wal_group_size=wal_group_size or 1,
+        multi_paxos=True, pipeline_depth=8)
+    cluster.start()
+    operations = make_operations(num_operations)
+
+    start = time.time()
+    for operation in operations:
+        cluster.propose(0, operation)
+    cluster.wait_for_commits(0, num_operations)
+    elapsed = time.time() - start
+
+    cluster.stop()
+    num_syncs = sum(wal._num_syncs for wal in cluster._wals.values())
+    if wal_dir is not None:
+        shutil.rmtree(wal_dir)
+    return num_operations / elapsed, num_syncs
+
+
+def main():
+    """Run the benchmarks."""
+    for wal_group_size in (None, 1, 64):
+        ops, num_syncs = bench(wal_group_size)
+        print "wal_group_size=%-4s %8.0f ops/s %6d fsyncs" % (
+            wal_group_size, ops, num_syncs)
+
+if __name__ == "__main__":
+    main()
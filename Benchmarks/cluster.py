@@ -0,0 +1,133 @@
+"""
+In-process cluster of Proposer/Acceptor pairs used by the benchmarks.
+
+Messages are pickled and unpickled exactly as on the wire but handed straight
+to the destination's queues by a _LocalTransport instead of a UDPTransport.
+"""
+
+import os
+import sys
+import time
+import pickle
+import thread
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Classes"))
+
+from Acceptor import Acceptor
+from Proposer import Proposer
+from Operation import Operation
+from Batch import Batch
+from WriteAheadLog import WriteAheadLog
+
+_PROPOSER_MESSAGES = ["promise", "promise_all", "ack", "nack"]
+_ACCEPTOR_MESSAGES = ["prepare", "prepare_all", "accept", "commit"]
+
+
+class _LocalTransport(object):
+    """Transport delivering messages of one Node through its Cluster."""
+
+    def __init__(self, cluster, sender_ID):
+        """Construct _LocalTransport object."""
+        self._cluster = cluster
+        self._sender_ID = sender_ID
+
+    def send(self, message, ID):
+        """Deliver message to the Node with ID."""
+        self._cluster._deliver(
+            self._sender_ID, ID,
+            pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+
+    def broadcast(self, message):
+        """Deliver message to every Node, self included."""
+        data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+        for ID in self._cluster._ip_table:
+            self._cluster._deliver(self._sender_ID, ID, data)
+
+
+class Cluster(object):
+    """
+    Cluster class.
+
+    num_nodes:          Number of Proposer/Acceptor pairs.
+    wal_dir:            Directory each Acceptor keeps a WriteAheadLog in,
+                        fsyncing groups of up to wal_group_size records; no
+                        WriteAheadLogs if None.
+    proposer_kwargs:    Keyword arguments passed to every Proposer.
+    message_counts:     Number of messages delivered per message type.
+    """
+
+    def __init__(self, num_nodes, wal_dir=None, wal_group_size=64,
+                    **proposer_kwargs):
+        """Construct Cluster object."""
+        self._ip_table = dict(
+            (i, ["127.0.0.1", 9000 + i, 10000 + i]) for i in range(num_nodes))
+        self._proposers, self._acceptors, self._wals = {}, {}, {}
+        self._message_counts = {}
+
+        for i in range(num_nodes):
+            transport = _LocalTransport(self, i)
+            proposer = Proposer(
+                i, self._ip_table, transport=transport, **proposer_kwargs)
+            wal = None
+            if wal_dir is not None:
+                wal = WriteAheadLog(
+                    os.path.join(wal_dir, "node" + str(i) + ".wal"),
+                    wal_group_size)
+                self._wals[i] = wal
+            acceptor = Acceptor(self._ip_table, transport, wal)
+            self._proposers[i], self._acceptors[i] = proposer, acceptor
+
+    def _deliver(self, sender_ID, receiver_ID, data):
+        """Decode data as a Node would and queue it at receiver_ID."""
+        message = []
+        for field in pickle.loads(data) + (sender_ID,):
+            if Operation.is_serialized(field):
+                field = Operation.deserialize(field, trusted=True)
+            elif Batch.is_serialized(field):
+                field = Batch.deserialize(field, trusted=True)
+            message.append(field)
+        message = tuple(message)
+        self._message_counts[message[0]] = \
+            self._message_counts.get(message[0], 0) + 1
+
+        if message[0] in _PROPOSER_MESSAGES:
+            self._proposers[receiver_ID]._command_queue.put(message)
+        elif message[0] in _ACCEPTOR_MESSAGES:
+            if message[0] in ("prepare", "prepare_all"):
+                if sender_ID != receiver_ID:
+                    self._proposers[receiver_ID]._observe_ballot(message[1])
+            self._acceptors[receiver_ID]._command_queue.put(message)
+
+    def start(self):
+        """Start every Proposer and Acceptor."""
+        for i in self._ip_table:
+            thread.start_new_thread(self._proposers[i].start, ())
+            thread.start_new_thread(self._acceptors[i].start, ())
+
+    def stop(self):
+        """Stop every Proposer and Acceptor."""
+        for i in self._ip_table:
+            self._proposers[i].terminate()
+            self._acceptors[i].terminate()
+        time.sleep(0.1)
+        for wal in self._wals.values():
+            wal.close()
+
+    def propose(self, leader_ID, operation):
+        """Hand operation to the Proposer of leader_ID."""
+        self._proposers[leader_ID]._command_queue.put(
+            ("propose", operation, 0, leader_ID))
+
+    def wait_for_commits(self, node_ID, num_operations):
+        """
+        Block until Node node_ID learned num_operations committed Operations;
+        return the committed log as a dict of slot to Batch.
+        """
+        log, learned = {}, 0
+        while learned < num_operations:
+            log_slot, batch = self._acceptors[node_ID]._commits_queue.get()
+            if log_slot not in log:
+                log[log_slot] = batch
+                learned += len(batch)
+        return log
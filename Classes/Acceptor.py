@@ -1,45 +1,170 @@
 """Acceptor class for Paxos Calendar."""
 
-import pickle
-import socket
 import time
-from Calendar import Calendar
+import Queue
+import bisect
+import thread
+from Batch import Batch
+from EventLoop import EventLoop
+from Transport import UDPTransport
 
 class Acceptor(object):
     """
     Acceptor class.
 
-    maxPrepare:     The maximum proposal number this Acceptor has encountered;
-                    initialized at -1 so a node can have id = 0.
+    maxPrepares:    Highest proposal number promised per log slot; slots
+                    without an entry have promised -1 so a node can have
+                    id = 0.
+    watermark_slot, Multi-Paxos prepares promise watermark_ballot for every
+    watermark_ballot: slot from watermark_slot on at once; initialized at 0
+                    and -1. The ballot promised for a slot is the higher of
+                    its maxPrepares entry and the watermark covering it.
+    watermarks:     Sorted (from_slot, ballot) list of every watermark still
+                    covering some slot, the last one being the current one;
+                    a slot is covered by the last watermark starting at or
+                    before it, so moving the watermark up costs no per-slot
+                    entries for the slots it skips.
     accNum:         Number of highest-numbered proposal this Acceptor object
                     has accepted thus far; initialized as None.
     accVal:         Value of highest-numbered proposal this Acceptor object
                     has accepted thus far; initialized as None.
+    last_accepted:  Highest log slot a value was accepted for; -1 if none.
+    lease:          (ID, expiry) of the leader this Acceptor granted a lease
+                    to: until expiry it nacks the prepares of every other
+                    Proposer, so while a majority grants the lease only the
+                    leader commits new values and may serve reads alone.
+    compacted_slot: Slots below it are chosen and folded into the Node's
+                    snapshot; their state is dropped and prepares/accepts for
+                    them nacked so the Proposer moves on to later slots.
 
-    Acceptor has to keep track of its maxPrepare, accNum and accVal in case of
-    a crash and must be able to write them to stable storage.
+    transport:      Transport shared with the Node; a UDPTransport is made
+                    from ip_table if None.
+    wal:            WriteAheadLog every promise, accNum/accVal and commit
+                    change is appended to, or None to keep state in memory.
+    deferred:       (transmission, ID) replies held back until the records
+                    they depend on are made durable by the next WAL sync.
+    lock:           Held while a message is served, so e.g. the Node can
+                    save this Acceptor's state from another thread.
+
+    Acceptor has to keep track of its promises, accNum and accVal in case of
+    a crash and must be able to write them to stable storage; with a wal, no
+    promise or ack leaves before its state is on disk. Records of a burst of
+    queued messages share one fsync (group commit).
     """
 
-    def __init__(self, ip_table):
+    def __init__(self, ip_table, transport=None, wal=None):
         """Construct Acceptor object."""
-        self._maxPrepare = -1
-        from collections import defaultdict
+        self._maxPrepares = {}
+        self._watermark_slot = 0
+        self._watermark_ballot = -1
+        self._watermarks = []
         self._accNums = {}
         self._accVals = {}
-        self._command_queue = []
-        self._commits_queue = []
+        self._last_accepted = -1
+        self._lease = (None, 0.0)
+        self._compacted_slot = 0
+        self._command_queue = Queue.Queue()
+        self._commits_queue = Queue.Queue()
         self._ip_table = ip_table
+        if transport is None:
+            transport = UDPTransport(ip_table)
+        self._transport = transport
+        self._wal = wal
+        self._deferred = []
+        self._lock = thread.allocate_lock()
         self._terminate = False
         self._is_Acceptor = True
 
-    def _send_UDP_message(self, data, IP, UDP_PORT):
-        """Send pickled data through UDP socket bound to (IP, UDP_PORT)."""
-        import pickle
-        import socket
-        transmission = pickle.dumps(data)
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.sendto(transmission, (IP, UDP_PORT))
-        s.close()
+    def _log(self, record):
+        """Append record to the WAL, if any."""
+        if self._wal is not None:
+            self._wal.append(record)
+
+    def _send(self, transmission, ID):
+        """Send transmission to Node with ID once logged state is durable."""
+        if self._wal is None:
+            self._transport.send(transmission, ID)
+        else:
+            self._deferred.append((transmission, ID))
+
+    def _sync(self):
+        """Make logged records durable, then release deferred replies."""
+        if self._wal is not None:
+            self._wal.sync()
+        deferred, self._deferred = self._deferred, []
+        for transmission, ID in deferred:
+            self._transport.send(transmission, ID)
+
+    def _replay(self, record):
+        """
+        Reapply a WAL record to this Acceptor.
+
+        Replay only moves state forward, so records already reflected in a
+        saved snapshot are harmless.
+        """
+        if record[0] == "prepare":
+            m, log_slot = record[1:]
+            if m > self._promised(log_slot):
+                self._maxPrepares[log_slot] = m
+        elif record[0] == "prepare_all":
+            m, log_slot = record[1:]
+            if m > self._watermark_ballot:
+                self._raise_watermark(m, log_slot)
+        elif record[0] == "compact":
+            self._compact(record[1])
+        elif record[0] == "accept":
+            m, serial_v, log_slot = record[1:]
+            if log_slot < self._compacted_slot:
+                return
+            if self._accNums.get(log_slot) is None or \
+                    m >= self._accNums[log_slot]:
+                self._accNums[log_slot] = m
+                self._accVals[log_slot] = Batch.deserialize(
+                    serial_v, trusted=True)
+                self._last_accepted = max(self._last_accepted, log_slot)
+
+    def _promised(self, log_slot):
+        """Return the highest proposal number promised for log_slot."""
+        m = self._maxPrepares.get(log_slot, -1)
+        if log_slot >= self._watermark_slot:
+            m = max(m, self._watermark_ballot)
+        elif self._watermarks and log_slot >= self._watermarks[0][0]:
+            index = bisect.bisect_right(
+                self._watermarks, (log_slot, float("inf"))) - 1
+            m = max(m, self._watermarks[index][1])
+        return m
+
+    def _raise_watermark(self, m, log_slot):
+        """Promise m for every slot from log_slot on."""
+        #older watermarks keep covering the slots below log_slot
+        while self._watermarks and self._watermarks[-1][0] >= log_slot:
+            self._watermarks.pop()
+        self._watermarks.append((log_slot, m))
+
+        for slot in self._maxPrepares.keys():
+            if slot >= log_slot and self._maxPrepares[slot] <= m:
+                del self._maxPrepares[slot]
+        self._watermark_slot, self._watermark_ballot = log_slot, m
+
+    def _grant_lease(self, ID, expiry):
+        """
+        Grant the Node with ID a lease until expiry, unless another Node's
+        lease runs still; return whether it was granted. Called from the
+        Node's leader election.
+        """
+        holder, holder_expiry = self._lease
+        if holder is not None and holder != ID and \
+                time.time() < holder_expiry:
+            return False
+        if holder == ID:
+            expiry = max(expiry, holder_expiry)
+        self._lease = (ID, expiry)
+        return True
+
+    def _leased_to_other(self, ID):
+        """Determine if a lease granted to another Node than ID runs."""
+        holder, expiry = self._lease
+        return holder is not None and holder != ID and time.time() < expiry
 
     def _recv_prepare(self, message):
         """
@@ -49,21 +174,70 @@ class Acceptor(object):
         """
 
         m, log_slot, sender_ID = message[1:]
-        
-        if log_slot not in self._accNums.keys():
+        if log_slot < self._compacted_slot or \
+                self._leased_to_other(sender_ID):
+            self._send_nack(sender_ID, self._promised(log_slot), log_slot, m)
+            return
+
+        if log_slot not in self._accNums:
             self._accNums[log_slot] = None
-        if log_slot not in self._accVals.keys():
+        if log_slot not in self._accVals:
             self._accVals[log_slot] = None
 
-        if m > self._maxPrepare:
-            self._maxPrepare = m
-            IP, UDP_PORT = self._ip_table[sender_ID][0], self._ip_table[sender_ID][2]
-            self._send_promise(IP, UDP_PORT, self._accNums[log_slot], self._accVals[log_slot], log_slot)
+        if m > self._promised(log_slot):
+            self._maxPrepares[log_slot] = m
+            self._log(("prepare", m, log_slot))
+            self._send_promise(sender_ID, self._accNums[log_slot], self._accVals[log_slot], log_slot, m)
+        elif m < self._promised(log_slot):
+            self._send_nack(sender_ID, self._promised(log_slot), log_slot, m)
+
+    def _recv_prepare_all(self, message):
+        """
+        Handle reception of a Multi-Paxos prepare message covering log_slot
+        and every slot after it.
+
+        Prepare messages of form ("prepare_all", m, log_slot, sender_ID)
+        """
+
+        m, log_slot, sender_ID = message[1:]
+        if log_slot < self._compacted_slot or \
+                self._leased_to_other(sender_ID):
+            self._send_nack(sender_ID, self._promised(log_slot), log_slot, m)
+            return
+
+        #every slot from log_slot on must not have promised more than m
+        promised = [n for slot, n in self._maxPrepares.items()
+                    if slot >= log_slot]
+        highest = max(promised + [self._watermark_ballot])
+        if m < highest:
+            self._send_nack(sender_ID, highest, log_slot, m)
+        elif m > highest:
+            self._raise_watermark(m, log_slot)
+            self._log(("prepare_all", m, log_slot))
+            accepted = tuple(
+                (slot, self._accNums[slot],
+                    Batch.serialize(self._accVals[slot]))
+                for slot in sorted(self._accVals.keys())
+                if slot >= log_slot and self._accVals[slot] is not None)
+            transmission = ("promise_all", m, accepted, log_slot)
+            self._send(transmission, sender_ID)
 
-    def _send_promise(self, IP, PORT, accNum, accVal, log_slot):
-        """Send promise message with given accNum, accVal to given IP, PORT."""
-        transmission = ("promise", accNum, Calendar.serialize(accVal), log_slot)
-        self._send_UDP_message(transmission, IP, PORT)
+    def _send_promise(self, ID, accNum, accVal, log_slot, m):
+        """
+        Send promise for ballot m with given accNum, accVal to Node with ID.
+        """
+        transmission = (
+            "promise", accNum, Batch.serialize(accVal), log_slot, m)
+        self._send(transmission, ID)
+
+    def _send_nack(self, ID, highest, log_slot, m):
+        """
+        Tell Node with ID its ballot m for log_slot lost to ballot highest,
+        or that log_slot is below compacted_slot and chosen already.
+
+        Nack messages of form ("nack", highest, log_slot, compacted_slot, m)
+        """
+        self._send(("nack", highest, log_slot, self._compacted_slot, m), ID)
 
     def _recv_accept(self, message):
         """
@@ -71,23 +245,28 @@ class Acceptor(object):
         """
 
         m, v, log_slot, sender_ID = message[1:]
+        if log_slot < self._compacted_slot:
+            self._send_nack(sender_ID, self._promised(log_slot), log_slot, m)
+            return
 
-        if log_slot not in self._accNums.keys():
+        if log_slot not in self._accNums:
             self._accNums[log_slot] = None
-        if log_slot not in self._accVals.keys():
+        if log_slot not in self._accVals:
             self._accVals[log_slot] = None
 
-
-        if m >= self._maxPrepare:
+        if m >= self._promised(log_slot):
             self._accNums[log_slot] = m
             self._accVals[log_slot] = v
-            IP, UDP_PORT = self._ip_table[sender_ID][0], self._ip_table[sender_ID][2]
-            self._send_ack(IP, UDP_PORT, self._accNums[log_slot], self._accVals[log_slot], log_slot)
+            self._last_accepted = max(self._last_accepted, log_slot)
+            self._log(("accept", m, Batch.serialize(v), log_slot))
+            self._send_ack(sender_ID, self._accNums[log_slot], self._accVals[log_slot], log_slot)
+        else:
+            self._send_nack(sender_ID, self._promised(log_slot), log_slot, m)
 
-    def _send_ack(self, IP, PORT, accNum, accVal, log_slot):
-        """Send ack with given accNum, accVal to given IP, PORT."""
-        transmission = ("ack", accNum, Calendar.serialize(accVal), log_slot)
-        self._send_UDP_message(transmission, IP, PORT)
+    def _send_ack(self, ID, accNum, accVal, log_slot):
+        """Send ack with given accNum, accVal to Node with ID."""
+        transmission = ("ack", accNum, Batch.serialize(accVal), log_slot)
+        self._send(transmission, ID)
 
     def _recv_commit(self, message):
         """
@@ -95,34 +274,121 @@ class Acceptor(object):
         """
 
         v, log_slot = message[1], message[2]
-        self._commits_queue.append((log_slot, v))
+        #a chosen value can be relearned from peers, so don't wait for sync
+        self._log(("commit", Batch.serialize(v), log_slot))
+        self._commits_queue.put((log_slot, v))
+
+    def _compact(self, log_slot):
+        """Drop accNum and accVal of every slot below log_slot."""
+        if log_slot <= self._compacted_slot:
+            return
+
+        self._compacted_slot = log_slot
+        index = bisect.bisect_right(
+            self._watermarks, (log_slot, float("inf"))) - 1
+        if index > 0:
+            del self._watermarks[:index]
+        for slot in self._maxPrepares.keys():
+            if slot < log_slot:
+                del self._maxPrepares[slot]
+        for slot in self._accNums.keys():
+            if slot < log_slot:
+                del self._accNums[slot]
+        for slot in self._accVals.keys():
+            if slot < log_slot:
+                del self._accVals[slot]
+
+    def _recv_compact(self, message):
+        """
+        Handle a compaction request queued by the Node after a snapshot.
+
+        Compact messages of form ("compact", log_slot)
+        """
+        self._compact(message[1])
+        self._log(("compact", message[1]))
+
+    def _handle(self, message):
+        """Serve a single message taken from the queue."""
+        message_command_type = message[0]
+        debug_str = "Acceptor; "
+        if message_command_type == "prepare":
+            #print debug_str + "type: prepare with slot = " + str(message[2]) + ", m = " + str(message[1])
+            self._recv_prepare(message)
+        elif message_command_type == "prepare_all":
+            self._recv_prepare_all(message)
+        elif message_command_type == "accept":
+            #print debug_str + "type: accept with slot = " + str(message[3]) + ", m = " + str(message[1])
+            self._recv_accept(message)
+        elif message_command_type == "commit":
+            #print debug_str + "type: commit " + str(message[2])
+            self._recv_commit(message)
+        elif message_command_type == "compact":
+            self._recv_compact(message)
 
     def start(self):
         """Start the Acceptor; serve messages in its queue."""
-        stap = []
+        #block until a message arrives; None is queued by terminate()
         while True:
-            if self._command_queue:
-                message = self._command_queue.pop()
-                message_command_type = message[0]
-                debug_str = "Acceptor; "
-                if message_command_type == "prepare":
-                    #print debug_str + "type: prepare with slot = " + str(message[2]) + ", m = " + str(message[1])
-                    self._recv_prepare(message)
-                elif message_command_type == "accept":
-                    #print debug_str + "type: accept with slot = " + str(message[3]) + ", m = " + str(message[1])
-                    self._recv_accept(message)
-                elif message_command_type == "commit":
-                    #print debug_str + "type: commit " + str(message[2])
-                    self._recv_commit(message)
-
-            if self._terminate:
+            message = self._command_queue.get()
+            if message is None:
                 break
 
-            time.sleep(.001)
+            with self._lock:
+                self._handle(message)
+
+            #sync once the burst of queued messages is drained or group's full
+            if self._command_queue.empty() or \
+                    (self._wal is not None and self._wal.is_full()):
+                self._sync()
+
+    def run(self):
+        """Serve the queue like start(), as a coroutine for an EventLoop."""
+        while True:
+            yield EventLoop.queued(self._command_queue)
+            while not self._command_queue.empty():
+                message = self._command_queue.get_nowait()
+                if message is None:
+                    return
+
+                with self._lock:
+                    self._handle(message)
+                if self._wal is not None and self._wal.is_full():
+                    self._sync()
+            self._sync()
+
+    def terminate(self):
+        """Stop the Acceptor started with start() and the Node's learner."""
+        self._terminate = True
+        self._command_queue.put(None)
+        self._commits_queue.put(None)
+
+    def __getstate__(self):
+        """Pickle Acceptor state without its (unpicklable) queues/transport."""
+        state = self.__dict__.copy()
+        del state["_command_queue"]
+        del state["_commits_queue"]
+        del state["_transport"]
+        del state["_wal"]
+        del state["_deferred"]
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        """Unpickle Acceptor state with fresh queues and transport."""
+        self.__dict__.update(state)
+        self._command_queue = Queue.Queue()
+        self._commits_queue = Queue.Queue()
+        self._transport = UDPTransport(self._ip_table)
+        self._wal = None
+        self._deferred = []
+        self._lock = thread.allocate_lock()
+        self._terminate = False
 
     def __str__(self):
         """Implement str(Acceptor)."""
-        ret_str = "Acceptor\n\tMaxPrepare: " + str(self._maxPrepare)
+        ret_str = "Acceptor\n\tMaxPrepares: " + str(self._maxPrepares)
+        ret_str += "\n\tWatermark: " + str(self._watermark_ballot) + \
+            " from slot " + str(self._watermark_slot)
         ret_str += "\n\tAccNum: " + str(self._accNums)
         ret_str += "\n\tAccVal: " + str(self._accVals)
         return ret_str
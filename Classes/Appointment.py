@@ -2,22 +2,61 @@
 Appointment class for Distributed Calendar implemented with Paxos Algorithm.
 """
 
+import re
 from datetime import time
 
+_DAYS = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday",
+        "Saturday"]
+_DAY_IDS = dict((day.lower(), i) for i, day in enumerate(_DAYS))
+_SLOT_TIMES = [time(i // 2, 30 * (i % 2)) for i in range(48)]
+_TIME_PATTERN = re.compile(r"\d{1,2}:\d\d(am|pm)")
+
+
+def _time_string_slots():
+    """
+    Return a dict mapping every legal time string, e.g. "9:30am" or
+    "09:30am", to its half-hour slot index.
+    """
+    slots = {}
+    for hour in range(13):
+        for hour_string in set([str(hour), "%02d" % hour]):
+            for minutes in (0, 30):
+                for meridiem, offset in (("am", 0), ("pm", 12)):
+                    slots[hour_string + ":%02d" % minutes + meridiem] = \
+                        (hour % 12 + offset) * 2 + minutes // 30
+    return slots
+
+_TIME_SLOTS = _time_string_slots()
+
+
+def _time_to_slot(t):
+    """Return the half-hour slot index (0-47) of time object t."""
+    return t.hour * 2 + t.minute // 30
+
+
 class Appointment(object):
     """
     Appointment class.
 
     name:           name of the appointment enforced as a string.
-    day:            day of the appointment enforced as a string
-                    matching some day of the week.
-    start:          start time of the appointment enforced as a string of the
-                    form (digit){1,2}:(digit){2}(am|pm).
-    end:            end time of the appointment enforced as a string of the
+    day:            day of the appointment as an index into _DAYS (0 is
+                    Sunday); given as a string matching some day of the week.
+    start:          start time of the appointment as a half-hour slot index
+                    (0 is 12:00am, 47 is 11:30pm); given as a string of the
                     form (digit){1,2}:(digit){2}(am|pm).
-    participants:   list of participants in the appointment.
+    end:            end time of the appointment as a half-hour slot index;
+                    given like start.
+    participants:   frozenset of the participants in the appointment; given
+                    as a list.
+    hash:           hash of the fields above, computed once.
+
+    Appointments are immutable and keep their fields in __slots__, so they
+    carry no __dict__ and hashing or comparing them allocates nothing.
     """
 
+    __slots__ = ("_name", "_day", "_start", "_end", "_participants", "_hash")
+    _is_Appointment = True
+
     def __init__(self, name, day, start_time, end_time, participants):
         """Initialize an Appointment object."""
         #enforce name and day as strings
@@ -26,15 +65,12 @@ class Appointment(object):
         if not isinstance(day, str):
             raise TypeError("day parameter must be of type string.")
 
-        days = ["sunday", "monday", "tuesday", "wednesday", "thursday",
-        "friday", "saturday"]
-
         #enforce day as a valid day of the week
-        if day.lower() not in days:
+        if day.lower() not in _DAY_IDS:
             raise ValueError("day parameter must be a day of the week.")
 
-        start = Appointment._parse_time(start_time)
-        end = Appointment._parse_time(end_time)
+        start = Appointment._parse_slot(start_time)
+        end = Appointment._parse_slot(end_time)
 
         if not (start < end):
             raise ValueError(
@@ -53,30 +89,47 @@ class Appointment(object):
         if not participants:
             raise ValueError("There must be at least 1 participant")
 
+        self._set_fields(name, _DAY_IDS[day.lower()], start, end,
+                            frozenset(participants))
+
+    def _set_fields(self, name, day, start, end, participants):
+        """Set the fields of this Appointment and cache its hash."""
         self._name = name
-        self._day = day[0].upper() + day[1:].lower()
+        self._day = day
         self._start = start
         self._end = end
         self._participants = participants
-        self._is_Appointment = True
+        self._hash = hash(self._key())
+
+    @staticmethod
+    def _from_trusted(name, day, start, end, participants):
+        """
+        Build an Appointment without validation from already canonical fields,
+        i.e., a day index, half-hour slot indices and a frozenset of
+        participants, as produced by a peer.
+        """
+        appointment = Appointment.__new__(Appointment)
+        appointment._set_fields(name, day, start, end, participants)
+        return appointment
+
+    def __getstate__(self):
+        """Pickle the fields of this Appointment; it has no __dict__."""
+        return self._key()
+
+    def __setstate__(self, state):
+        """Restore a pickled Appointment."""
+        self._set_fields(*state)
 
     def __eq__(self, other):
         """Determine if two Appointment objects are equivalent."""
         if not hasattr(other, "_is_Appointment"):
             raise TypeError("both operands must be Appointment objects.")
 
-        c_name = self._name == other._name
-        c_day = self._day == other._day
-        c_start = self._start == other._start
-        c_end = self._end == other._end
-        
-        #if the length of the union of the participants is equal to the length
-        #of the intersection, they are the same participants
-        intersection = set(self._participants) & set(other._participants)
-        union = set(self._participants) | set(other._participants)
-        c_participants = len(union) == len(intersection)
-
-        return c_name and c_day and c_start and c_end and c_participants
+        #participants are equal as sets, like the hash
+        return self is other or (self._hash == other._hash and
+            self._name == other._name and self._day == other._day and
+            self._start == other._start and self._end == other._end and
+            self._participants == other._participants)
 
     def __ne__(self, other):
         """Determine if two Appointment objects are not equivalent."""
@@ -85,27 +138,39 @@ class Appointment(object):
     def _key(self):
         """Key for Appointment hashing; simple tuple."""
         return (self._name, self._day, self._start, self._end,
-                                            tuple(self._participants))
+                                            self._participants)
 
     def __hash__(self):
         """Hash Appointment object; used so we can call set(Appointment)."""
-        return hash(self._key())
+        return self._hash
 
     @staticmethod
     def _parse_time(time_string):
         """Return a time object from given string or raise exception."""
-        if isinstance(time_string, time):
-            from copy import deepcopy
-            return deepcopy(time_string)
-        #enforce string type
-        if not type(time_string) == str:
+        return _SLOT_TIMES[Appointment._parse_slot(time_string)]
+
+    @staticmethod
+    def _parse_slot(time_string):
+        """
+        Return the half-hour slot index of given string or time object or
+        raise exception; legal strings are looked up in a precomputed table.
+        """
+        if type(time_string) == str:
+            slot = _TIME_SLOTS.get(time_string)
+            if slot is not None:
+                return slot
+        elif isinstance(time_string, time):
+            #Appointments keep times as half-hour slots
+            if time_string.minute % 30 != 0 or time_string.second or \
+                    time_string.microsecond or time_string.tzinfo:
+                raise ValueError("time objects must be on a half hour.")
+            return _time_to_slot(time_string)
+        else:
             raise TypeError("time parameters must be of type string.")
 
-        #regex to determine if times provided are in correct format,
-        #i.e., [digit][digit]:[digit][digit](am|pm)
-        import re
-        pattern = r"\d{1,2}:\d\d(am|pm)"
-        if not re.match(pattern, time_string):
+        #every legal string is in the table; find out what's wrong with it,
+        #first whether it's of form [digit][digit]:[digit][digit](am|pm)
+        if not _TIME_PATTERN.match(time_string):
             raise ValueError(
                 "time parameters must be of form "
                 "(digit){1,2}:(digit){2}(am|pm)..")
@@ -135,8 +200,7 @@ class Appointment(object):
         if meridiem != "am" and meridiem != "pm":
             raise ValueError("meridiem must be 'am' or 'pm'")
 
-        #return time object
-        return time(hour, minutes)
+        return _time_to_slot(time(hour, minutes))
 
     @staticmethod
     def _is_conflicting(appt1, appt2):
@@ -157,10 +221,10 @@ class Appointment(object):
             return False
 
         #if there are no overlapping participants, they are not in conflict
-        if not set(appt1._participants) & set(appt2._participants):
+        if appt1._participants.isdisjoint(appt2._participants):
             return False
 
-        #grab time objects from Appointment object
+        #grab half-hour slots from Appointment object
         start1, end1 = appt1._start, appt1._end
         start2, end2 = appt2._start, appt2._end
 
@@ -176,31 +240,33 @@ class Appointment(object):
         return True
 
     def __deepcopy__(self, memo):
-        """Implement copy.deepcopy for appointment object."""
-        from copy import deepcopy
-        return Appointment(
-            deepcopy(self._name), deepcopy(self._day), deepcopy(self._start),
-            deepcopy(self._end), deepcopy(self._participants))
+        """
+        Implement copy.deepcopy for appointment object; every field is
+        immutable so the copy shares them.
+        """
+        return Appointment._from_trusted(*self._key())
 
     def __str__(self):
         """Convert event object to human readable string representation."""
         #add name
         appointment_str = "Appointment \"" + self._name + "\" on "
         #add day
-        appointment_str += self._day[0].upper() + self._day[1:] + " from "
+        appointment_str += _DAYS[self._day] + " from "
         #add time
-        appointment_str += str(self._start)[:-3] + " to " + str(self._end)[:-3]
+        appointment_str += str(_SLOT_TIMES[self._start])[:-3] + " to " + \
+            str(_SLOT_TIMES[self._end])[:-3]
         appointment_str += " with "
-        #add participants
-        if len(self._participants) > 2:
+        #add participants in ascending order
+        participants = sorted(self._participants)
+        if len(participants) > 2:
             appointment_str += "".join(
-                [str(i) + ", " for i in self._participants[:-1]])
-            appointment_str += "and " + str(self._participants[-1])
-        elif len(self._participants) == 2:
-            appointment_str += str(self._participants[0]) + " and "
-            appointment_str += str(self._participants[1])
+                [str(i) + ", " for i in participants[:-1]])
+            appointment_str += "and " + str(participants[-1])
+        elif len(participants) == 2:
+            appointment_str += str(participants[0]) + " and "
+            appointment_str += str(participants[1])
         else:
-            appointment_str += str(self._participants[0])
+            appointment_str += str(participants[0])
 
         return appointment_str
 
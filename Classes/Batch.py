@@ -0,0 +1,175 @@
+"""Batch class; a group of Operations agreed upon in a single log slot."""
+
+import struct
+from Operation import Operation
+from Calendar import _pack_varint, _unpack_varint, _pack_appointment
+from Calendar import _unpack_appointment
+
+_SERIAL_MAGIC = "\x00PB"
+_SERIAL_VERSION = 1
+
+
+class Batch(object):
+    """
+    Batch class.
+
+    operations:     nonempty list of Operation objects applied in order when
+                    the learner reaches the log slot holding this Batch;
+                    empty only for the no-op Batch made by noop().
+
+    The leader's Proposer groups pending Operations into a Batch so a single
+    Synod instance commits many Calendar changes. A Batch is not changed once
+    built, so its serialized form is cached (serial) the first time it is
+    serialized or when it is deserialized; the cache isn't pickled.
+    """
+
+    def __init__(self, operations):
+        """Construct Batch object."""
+        if not isinstance(operations, list):
+            raise TypeError("operations must be a list")
+        if not operations:
+            raise ValueError("operations must not be empty")
+        for operation in operations:
+            if not hasattr(operation, "_is_Operation"):
+                raise TypeError(
+                    "operations must contain only Operation objects")
+
+        self._operations = operations
+        self._serial = None
+        self._is_Batch = True
+
+    @staticmethod
+    def noop():
+        """
+        Return a Batch of no Operations; a leader proposes it to fill a slot
+        left empty, e.g. by a Proposer that crashed before filling it.
+        """
+        batch = Batch.__new__(Batch)
+        batch._operations = []
+        batch._serial = None
+        batch._is_Batch = True
+        return batch
+
+    def __getstate__(self):
+        """Leave the cached serialized form out of pickles."""
+        state = dict(self.__dict__)
+        state["_serial"] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restore a pickled Batch; older pickles have no cache."""
+        self.__dict__.update(state)
+        self._serial = None
+
+    def __len__(self):
+        """Implement len(Batch)."""
+        return len(self._operations)
+
+    def __iter__(self):
+        """Implement iterator for Batch."""
+        for operation in self._operations:
+            yield operation
+
+    def apply(self, calendar):
+        """
+        Apply every Operation of this Batch to Calendar object calendar in
+        place and in order.
+
+        Return the list of Operations that had to be dropped.
+        """
+        return [op for op in self._operations if not op.apply(calendar)]
+
+    @staticmethod
+    def serialize(batch):
+        """
+        Return a compact binary representation of batch for the wire.
+
+        Layout (version 1): magic, version byte, interned name table as in
+        Calendar.serialize, varint count of Operations each packed as a kind
+        byte followed by its Appointment packed as in Calendar.serialize.
+        """
+        if batch is None:
+            return None
+        if getattr(batch, "_serial", None) is not None:
+            return batch._serial
+
+        chunks = [_SERIAL_MAGIC, chr(_SERIAL_VERSION)]
+        names, name_ids = [], {}
+        for operation in batch._operations:
+            name = operation._appointment._name
+            if name not in name_ids:
+                name_ids[name] = len(names)
+                names.append(name)
+
+        _pack_varint(len(names), chunks)
+        for name in names:
+            _pack_varint(len(name), chunks)
+            chunks.append(name)
+
+        _pack_varint(len(batch._operations), chunks)
+        for operation in batch._operations:
+            appointment = operation._appointment
+            chunks.append(chr(Operation._kinds.index(operation._kind)))
+            _pack_appointment(appointment, name_ids[appointment._name], chunks)
+
+        batch._serial = "".join(chunks)
+        return batch._serial
+
+    @staticmethod
+    def is_serialized(serial_msg):
+        """Determine if serial_msg looks like the output of serialize."""
+        return type(serial_msg) == str and serial_msg[:3] == _SERIAL_MAGIC
+
+    @staticmethod
+    def deserialize(serial_msg, trusted=False):
+        """
+        Return a Batch object parsed from the output of serialize.
+
+        If trusted is True the Appointments are rebuilt without re-validation.
+
+        Raise ValueError if serial_msg is not a valid serialized Batch.
+        """
+        if not Batch.is_serialized(serial_msg):
+            raise ValueError("serial_msg is not a serialized Batch")
+
+        if ord(serial_msg[3]) != _SERIAL_VERSION:
+            raise ValueError(
+                "Unsupported Batch serialization version " +
+                str(ord(serial_msg[3])))
+
+        try:
+            offset = 4
+            num_names, offset = _unpack_varint(serial_msg, offset)
+            names = []
+            for i in range(num_names):
+                length, offset = _unpack_varint(serial_msg, offset)
+                if offset + length > len(serial_msg):
+                    raise ValueError("truncated name table")
+                names.append(serial_msg[offset:offset + length])
+                offset += length
+
+            num_operations, offset = _unpack_varint(serial_msg, offset)
+            operations = []
+            for i in range(num_operations):
+                kind = Operation._kinds[ord(serial_msg[offset])]
+                appointment, offset = _unpack_appointment(
+                    serial_msg, offset + 1, names, trusted)
+                operations.append(Operation(kind, appointment))
+        except (IndexError, struct.error):
+            raise ValueError("serial_msg is a malformed serialized Batch")
+
+        if offset != len(serial_msg):
+            raise ValueError("serial_msg has trailing bytes")
+
+        batch = Batch(operations) if operations else Batch.noop()
+        batch._serial = serial_msg
+        return batch
+
+    def __str__(self):
+        """Implement str(Batch)."""
+        return "Batch:\n" + "".join(
+            ['\t' + str(operation) + '\n' for operation in self._operations])
+
+    def __repr__(self):
+        """Implement repr(Batch)."""
+        return self.__str__()
@@ -3,93 +3,281 @@
 import time
 import pickle
 import thread
-import socket
-import select
+import itertools
+from EventLoop import EventLoop
 
-def _send_election_messages(node):
+#every round of a Node tags its messages with a new round id
+_round_ids = itertools.count()
+
+def _send_election_messages(node, transport, round_id, delay=0.10):
     """Send election messages to all Node's with higher IDs than this one."""
     #send election message to all higher ID processes
-    time.sleep(0.10)
-    for ID, ip_info in node._ip_table.items():
-        IP, TCP_PORT, UDP_PORT = ip_info
+    time.sleep(delay)
+    for ID in node._ip_table.keys():
         if ID > node._node_id:
-            thread.start_new_thread(
-                _send_message, (node._node_id, IP, TCP_PORT, "Election"))
+            _send_message(transport, node._node_id, ID, "Election", round_id)
 
-def _send_okay_message(node, ID):
-    """Send OKAY message to the Node object with IP, PORT."""
-    IP, TCP_PORT, UDP_PORT = node._ip_table[ID]
-    thread.start_new_thread(
-        _send_message, (node._node_id, IP, TCP_PORT, "OKAY"))
+def _send_okay_message(node, transport, ID, round_id):
+    """Send OKAY message answering round round_id to the Node with ID."""
+    _send_message(transport, node._node_id, ID, "OKAY", round_id)
 
-def _send_coordinator_messages(node):
-    """Send Coordinator nmessage to all Node's except this one."""
-    for ID, ip_info in node._ip_table.items():
-        IP, TCP_PORT, UDP_PORT = ip_info
+def _send_heartbeats(node, transport):
+    """Tell all Node's except this one that it still leads."""
+    data = node._heartbeat_data()
+    for ID in node._ip_table.keys():
+        if ID != node._node_id:
+            _send_message(transport, node._node_id, ID, "Heartbeat", data)
 
+def _send_coordinator_messages(node, transport, round_id):
+    """Send Coordinator nmessage to all Node's except this one."""
+    for ID in node._ip_table.keys():
         #Don't send to self
         if ID != node._node_id:
-            thread.start_new_thread(
-                _send_message, (node._node_id, IP, TCP_PORT, "Coordinator"))
-
-def _send_message(ID, IP, PORT, msg):
-    """Send "Election" message to Node at given IP and PORT."""
-    try:
-        #Open socket for sending
-        send_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        send_socket.connect((IP, PORT))
-
-        #pickle election message to transmit ID for convenience too
-        election_message = pickle.dumps((ID, msg))
-
-        #send election message
-        send_socket.send(election_message)
-        send_socket.close()
-    except socket.error:
-        pass
-
-def bully_algorithm(node, recv_socket, timeout):
-    """Perform Bully Algorithm to elect a leader among the Nodes."""
+            _send_message(
+                transport, node._node_id, ID, "Coordinator", round_id)
+
+def _send_message(transport, sender_ID, ID, msg, round_id):
+    """
+    Send msg to Node with ID through transport (e.g. a TCPTransport);
+    round_id is the round of an election message, or the data a Heartbeat
+    or its acknowledgement carries.
+    """
+    #pickle election message to transmit ID and round for convenience too
+    transport.send((sender_ID, msg, round_id), ID)
+
+def _handle_message(node, transport, ID, message, message_round, round_id):
+    """
+    Handle message of round message_round from the Node with ID during
+    round round_id; return "Coordinator" once the leader is known (a
+    Heartbeat of a higher Node counts), "Election" if election messages
+    must be sent again, "OKAY" if a higher Node will take over and None
+    otherwise.
+
+    An OKAY answers the round of the Election it replies to; one answering
+    an earlier round is stale (e.g. replayed after a reconnection) and
+    ignored.
+    """
+    #If message is Coordinator, we're done
+    if message == "Coordinator":
+        node._set_leader(ID)
+        return message
+
+    #a higher Node already leads
+    if message == "Heartbeat" and ID > node._node_id:
+        node._set_leader(ID)
+        return "Coordinator"
+
+    #Respond to election if message received from lower ID
+    if message == "Election" and ID < node._node_id:
+        _send_okay_message(node, transport, ID, message_round)
+        return message
+
+    #If message is OKAY, wait for a while then do leader election again
+    if message == "OKAY" and message_round == round_id:
+        return message
+
+    return None
+
+def _handle_idle_message(node, transport, ID, message, message_round):
+    """
+    Handle message from the Node with ID between rounds; return True if
+    this Node must start a round.
+
+    The leader's Heartbeats are acknowledged if the Node granted it a read
+    lease, and their acknowledgements are handed to the leader Node.
+    """
+    if message == "Heartbeat" or message == "Coordinator":
+        #the highest Node alive leads, which may be this one
+        if ID < node._node_id:
+            return True
+        if node._leader is not None and ID < node._leader:
+            return False
+
+        node._set_leader(ID)
+        if message == "Heartbeat":
+            ack = node._recv_heartbeat(ID, message_round)
+            if ack is not None:
+                _send_message(
+                    transport, node._node_id, ID, "HeartbeatAck", ack)
+        return False
+
+    if message == "HeartbeatAck":
+        node._recv_heartbeat_ack(ID, message_round)
+        return False
+
+    #answer and take over from a lower Node holding an election
+    if message == "Election" and ID < node._node_id:
+        _send_okay_message(node, transport, ID, message_round)
+        return True
+
+    return False
+
+def _handle_timeout(node, transport, received_okay, round_id):
+    """
+    Handle a timeout without messages; return True if this Node became the
+    leader. A round that got an OKAY but no Coordinator in time ends
+    without a leader, so the next one starts over.
+    """
+    #If this Node hasn't received an OKAY, it is the new leader, send
+    #Coordinator message to everyone else
+    if not received_okay:
+        _send_coordinator_messages(node, transport, round_id)
+        node._set_leader(node._node_id)
+        return True
+    return False
+
+def bully_algorithm(node, transport, timeout):
+    """
+    Perform Bully Algorithm to elect a leader among the Nodes; messages are
+    sent and received through the bound transport.
+    """
+    round_id = next(_round_ids)
+
     #Send initial election messages
-    thread.start_new_thread(_send_election_messages, (node,))
+    thread.start_new_thread(
+        _send_election_messages, (node, transport, round_id))
     
     received_okay = False
+    deadline = time.time() + timeout
     #Wait for messages
     while True:
 
-        #poll on recv_socket waiting for message or timeout
-        r, w, x = select.select([recv_socket], [], [], timeout)
+        #block on transport waiting for message or timeout; messages that
+        #don't settle the round (e.g. Heartbeats) don't extend it
+        received = transport.recv(max(0.0, deadline - time.time()))
 
         #if a message was received, interpret it
-        if r:
-            #Accept any incoming connections and receive their messages,
-            #unpickling the ID-message 2-tuple
-            conn, addr = recv_socket.accept()
-            data = conn.recv(1024)
-            ID, message = pickle.loads(data)
-
-            #If message is Coordinator, we're done
-            if message == "Coordinator":
-                node._leader = ID
+        if received is not None:
+            #unpickle the ID-message-round 3-tuple
+            ID, message, message_round = pickle.loads(received[0])
+            result = _handle_message(
+                node, transport, ID, message, message_round, round_id)
+            if result == "Coordinator":
                 break
+            if result == "Election":
+                thread.start_new_thread(
+                    _send_election_messages, (node, transport, round_id))
+            if result == "OKAY" and not received_okay:
+                #give the higher Node a round of its own to take over
+                received_okay = True
+                deadline = time.time() + 2 * timeout
+
+        #timeout, this Node is either the new leader or has received an OKAY 
+        #from another Node which didn't take over in time
+        else:
+            _handle_timeout(node, transport, received_okay, round_id)
+            break
 
-            #Respond to election if message received from higher ID
-            if message == "Election":
-                if ID < node._node_id:
-                    _send_okay_message(node, ID)
-                    thread.start_new_thread(_send_election_messages, (node,))
-                    continue
+def bully_coroutine(node, transport, timeout):
+    """
+    Perform Bully Algorithm like bully_algorithm, as a coroutine for an
+    EventLoop; election messages are sent by this coroutine after the same
+    delay instead of by new threads.
+    """
+    round_id = next(_round_ids)
+    election_time = time.time() + 0.10
+    received_okay = False
+    deadline = time.time() + timeout
+    while True:
+
+        #wait for a message or timeout, sending due election messages; the
+        #transport only turns readable again for messages arriving later
+        received = transport.recv(0)
+        while received is None and time.time() < deadline:
+            if election_time is not None and time.time() >= election_time:
+                _send_election_messages(node, transport, round_id, 0)
+                election_time = None
 
-            #If message is OKAY, wait for a while then do leader election again
-            if message == "OKAY":
+            wait_until = deadline
+            if election_time is not None:
+                wait_until = min(deadline, election_time)
+            yield EventLoop.readable(
+                transport, max(0.0, wait_until - time.time()))
+            received = transport.recv(0)
+
+        if received is not None:
+            ID, message, message_round = pickle.loads(received[0])
+            result = _handle_message(
+                node, transport, ID, message, message_round, round_id)
+            if result == "Coordinator":
+                break
+            if result == "Election" and election_time is None:
+                election_time = time.time() + 0.10
+            if result == "OKAY" and not received_okay:
                 received_okay = True
-                continue
-        #timeout, this Node is either the new leader or has received an OKAY 
-        #from another Node
+                deadline = time.time() + 2 * timeout
+
         else:
-            #If this Node hasn't received an OKAY, it is the new leader, send
-            #Coordinator message to everyone else
-            if not received_okay:
-                _send_coordinator_messages(node)
-                node._leader = node._node_id
+            _handle_timeout(node, transport, received_okay, round_id)
+            break
+
+def _election_due(node):
+    """Determine if node knows no leader or the leader's lease ran out."""
+    if node._leader is None:
+        return True
+    return node._leader != node._node_id and time.time() >= node._lease_expiry
+
+def _idle_wait(node, next_heartbeat, heartbeat_time):
+    """Return how long node may wait for a message between rounds."""
+    if node._leader == node._node_id:
+        wait = next_heartbeat - time.time()
+    else:
+        wait = node._lease_expiry - time.time()
+    return max(0.0, min(wait, heartbeat_time))
+
+def leader_lease(node, transport, heartbeat_time, timeout):
+    """
+    Keep a leader elected until node terminates: the leader sends Heartbeats
+    every heartbeat_time seconds, each renewing the lease the other Nodes
+    grant it, and a Bully round only runs while no leader is known, its
+    lease ran out or a lower Node must be bullied.
+    """
+    next_heartbeat = 0.0
+    while not node._terminate:
+        if _election_due(node):
+            node._set_leader(None)
+            bully_algorithm(node, transport, timeout)
+            next_heartbeat = 0.0
+            continue
+
+        if node._leader == node._node_id and time.time() >= next_heartbeat:
+            _send_heartbeats(node, transport)
+            next_heartbeat = time.time() + heartbeat_time
+
+        received = transport.recv(
+            _idle_wait(node, next_heartbeat, heartbeat_time))
+        if received is not None:
+            ID, message, message_round = pickle.loads(received[0])
+            if _handle_idle_message(
+                    node, transport, ID, message, message_round):
+                bully_algorithm(node, transport, timeout)
+                next_heartbeat = 0.0
+
+def leader_lease_coroutine(node, transport, heartbeat_time, timeout):
+    """
+    Keep a leader elected like leader_lease, as a coroutine for an
+    EventLoop.
+    """
+    next_heartbeat = 0.0
+    while not node._terminate:
+        if _election_due(node):
+            node._set_leader(None)
+            yield bully_coroutine(node, transport, timeout)
+            next_heartbeat = 0.0
+            continue
+
+        if node._leader == node._node_id and time.time() >= next_heartbeat:
+            _send_heartbeats(node, transport)
+            next_heartbeat = time.time() + heartbeat_time
+
+        yield EventLoop.readable(
+            transport, _idle_wait(node, next_heartbeat, heartbeat_time))
+        received = transport.recv(0)
+        while received is not None:
+            ID, message, message_round = pickle.loads(received[0])
+            if _handle_idle_message(
+                    node, transport, ID, message, message_round):
+                yield bully_coroutine(node, transport, timeout)
+                next_heartbeat = 0.0
                 break
+            received = transport.recv(0)
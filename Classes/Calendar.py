@@ -1,7 +1,85 @@
 """Calendar class to wrap list of Appointments for Paxos Log Entries."""
 
-from Appointment import Appointment
-import datetime
+from Appointment import Appointment, _DAYS, _SLOT_TIMES
+from HashTrie import HashTrie
+from bisect import bisect_left
+import copy
+import struct
+
+_SERIAL_MAGIC = "\x00PC"
+_SERIAL_VERSION = 1
+
+
+def _zigzag(n):
+    """Map a signed int onto a nonnegative int for varint packing."""
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+
+def _unzigzag(n):
+    """Invert _zigzag."""
+    return n // 2 if not n % 2 else -(n + 1) // 2
+
+
+def _pack_varint(n, chunks):
+    """Append nonnegative int n to list chunks as a LEB128 varint."""
+    while n > 0x7f:
+        chunks.append(chr((n & 0x7f) | 0x80))
+        n >>= 7
+    chunks.append(chr(n))
+
+
+def _unpack_varint(data, offset):
+    """Return (value, new_offset) of the varint in data at offset."""
+    value, shift = 0, 0
+    while True:
+        byte = ord(data[offset])
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+
+def _pack_appointment(appointment, name_id, chunks):
+    """
+    Append appointment to list chunks as varint name_id (an index into a name
+    table kept by the caller), day byte, start and end half-hour slot bytes
+    and a varint-prefixed list of zigzag varint participant ids.
+    """
+    _pack_varint(name_id, chunks)
+    chunks.append(struct.pack(
+        "BBB", appointment._day, appointment._start, appointment._end))
+    _pack_varint(len(appointment._participants), chunks)
+    for participant in sorted(appointment._participants):
+        _pack_varint(_zigzag(participant), chunks)
+
+
+def _unpack_appointment(data, offset, names, trusted):
+    """
+    Return (Appointment, new_offset) of the Appointment packed in data at
+    offset by _pack_appointment, resolving its name through list names.
+
+    Skip validation of the Appointment if trusted is True.
+    """
+    name_id, offset = _unpack_varint(data, offset)
+    day, start, end = struct.unpack_from("BBB", data, offset)
+    offset += 3
+    num_participants, offset = _unpack_varint(data, offset)
+    participants = []
+    for j in range(num_participants):
+        participant, offset = _unpack_varint(data, offset)
+        participants.append(_unzigzag(participant))
+
+    name = names[name_id]
+    if trusted:
+        appointment = Appointment._from_trusted(
+            name, day, start, end, frozenset(participants))
+    else:
+        appointment = Appointment(name, _DAYS[day], _SLOT_TIMES[start],
+                                    _SLOT_TIMES[end], participants)
+
+    return appointment, offset
 
 
 class Calendar(object):
@@ -12,7 +90,29 @@ class Calendar(object):
     appointments:               unordered set of Appointment objects; order of
                                 addition of appointment objects are tracked
                                 however for indexing, i.e.,
-                                Calendar[0] == [first appointment added]
+                                Calendar[0] == [first appointment added];
+                                a HashTrie mapping the sequence number of
+                                each Appointment to it, in ascending order.
+    next_seq:                   Sequence number of the next Appointment
+                                added.
+    ids:                        HashTrie mapping each Appointment to its
+                                sequence number; Appointments hash and compare
+                                on their fields with participants as a
+                                frozenset, so membership, duplicate and
+                                removal checks are a single lookup.
+    index:                      interval index keyed by (participant, day);
+                                a HashTrie whose entries are pairs of parallel
+                                tuples (start slots, Appointments) sorted by
+                                start slot. Appointments sharing a participant
+                                and day never overlap, so a conflict check
+                                only has to inspect one neighbour per
+                                participant, no two entries start at the same
+                                slot and an entry holds at most 48
+                                Appointments.
+
+    All three HashTries are persistent, so a copy of a Calendar shares them and
+    costs O(1); adding or removing an Appointment replaces them with new
+    versions in O(log n), leaving the copies untouched.
     """
 
     def __init__(self, *appointments):
@@ -30,23 +130,23 @@ class Calendar(object):
                 raise TypeError(
                     "Positional arguments must Appointment objects")
 
-        #Enforce no two conflicting Appointment objects
-        for i, appt1 in enumerate(list(appointments)):
-            for j, appt2 in enumerate(list(appointments)):
-                if i != j:
-                    if Appointment._is_conflicting(appt1, appt2):
-                        raise ValueError(
-                            "Appointments \n" + str(appt1) + "\n and \n" +
-                            str(appt2) + "\n are conflicting.")
+        self._appointments = HashTrie()
+        self._next_seq = 0
+        self._ids = HashTrie()
+        self._index = HashTrie()
 
-        #remove duplicates and set
-        l_appointments = list(appointments)
-        self._appointments = []
+        #loop through with list instead of set to keep order; enforce no two
+        #conflicting Appointment objects against the index as we go
+        for appointment in appointments:
+            conflict = self._index_conflict(appointment)
+            if conflict is not None:
+                raise ValueError(
+                    "Appointments \n" + str(appointment) + "\n and \n" +
+                    str(conflict) + "\n are conflicting.")
 
-        #loop through with list instead of set to keep order
-        for appointment in l_appointments:
-            if appointment not in self._appointments:
-                self._appointments.append(appointment)
+            #remove duplicates
+            if appointment not in self._ids:
+                self._append(appointment)
 
         self._is_Calendar = True
 
@@ -58,9 +158,8 @@ class Calendar(object):
         if not hasattr(other, "_is_Calendar"):
             raise TypeError("both == operands must be Calendar objects")
 
-        intersection_length = len(
-            set(self._appointments) & set(other._appointments))
-        union_length = len(set(self._appointments) | set(other._appointments))
+        intersection_length = len(set(self) & set(other))
+        union_length = len(set(self) | set(other))
 
         #if count of intersection is same as count of both lists they're the
         #same list
@@ -90,17 +189,40 @@ class Calendar(object):
                     other._name + " is in conflict with Calendar")
 
             if other not in self:
-                self._appointments.append(other)
+                self._append(other)
 
         #handle addition of Calendar
         if calendar_cond:
-            if self._is_calendar_conflicting(other):
+            merged, conflicts = self.merge(other)
+            if conflicts:
                 raise ValueError("Cannot add conflicting Calendars")
 
-            for appointment in other:
-                if appointment not in self:
-                    self._appointments.append(appointment)
+            self._appointments = merged._appointments
+            self._next_seq = merged._next_seq
+            self._ids = merged._ids
+            self._index = merged._index
+
+        return self
+
+    def __isub__(self, other):
+        """
+        Implement -= operator for Calendar.
+        Remove an Appointment equal to other from this Calendar.
+        """
+
+        if not hasattr(other, "_is_Appointment"):
+            raise TypeError(
+                "Only Appointment objects may be removed from a Calendar "
+                "object.")
+
+        seq = self._ids.get(other)
+        if seq is None:
+            raise ValueError(other._name + " is not in Calendar")
 
+        appointment = self._appointments.get(seq)
+        self._appointments = self._appointments.remove(seq)
+        self._ids = self._ids.remove(appointment)
+        self._index_remove(appointment)
         return self
 
     def __ne__(self, other):
@@ -111,15 +233,24 @@ class Calendar(object):
         """Implement len(Calendar)."""
         return len(self._appointments)
 
-    def __getitem__(self, key):
-        """Implement indexing for Calendar object."""
-        try:
-            return self._appointments[key]
-        except TypeError:
+    def _nth(self, key):
+        """
+        Return (sequence number, Appointment) of the Appointment at index key
+        in order of addition, counting from the end if key is negative.
+        """
+        if not isinstance(key, (int, long)):
             raise TypeError("Index must be an int")
+
+        index = key + len(self) if key < 0 else key
+        try:
+            return self._appointments.nth(index)
         except IndexError:
             raise IndexError("invalid index: " + str(key))
 
+    def __getitem__(self, key):
+        """Implement indexing for Calendar object."""
+        return self._nth(key)[1]
+
     def __setitem__(self, key, value):
         """
         Implement Calendar[key] = value; needed to ensure no conflicts added.
@@ -129,52 +260,120 @@ class Calendar(object):
             raise TypeError("value parameter must be an Appointment object")
 
         #Ensure valid key while setting
-        try:
-            self._appointments[key]
-        except TypeError:
-            raise TypeError("Index must be an int")
-        except IndexError:
-            raise IndexError("invalid index: " + str(key))
+        seq, old_value = self._nth(key)
 
-        non_key_appts = []
-        for i, appt in enumerate(self._appointments):
-            if i != key:
-                non_key_appts.append(appt)
+        #value may only equal the Appointment it replaces
+        if self._ids.get(value, seq) != seq:
+            raise ValueError("Cannot add duplicate Appointment to Calendar")
 
-        for appt in non_key_appts:
-            if Appointment._is_conflicting(value, appt):
-                raise ValueError(
-                    str(value) + "\n conflicts with \n" + str(appt) +
-                    "\n already in Calendar")
-        
-        for appt in non_key_appts:
-            if value == appt:
-                raise ValueError(
-                    "Cannot add duplicate Appointment to Calendar")
+        #take the replaced Appointment out of the index while checking value
+        self._index_remove(old_value)
+        conflict = self._index_conflict(value)
+        if conflict is not None:
+            self._index_add(old_value)
+            raise ValueError(
+                str(value) + "\n conflicts with \n" + str(conflict) +
+                "\n already in Calendar")
 
-        self._appointments[key] = value
+        self._appointments = self._appointments.set(seq, value)
+        self._ids = self._ids.remove(old_value).set(value, seq)
+        self._index_add(value)
 
     def __iter__(self):
         """Implement iterator for Calendar."""
-        for appointment in self._appointments:
+        for appointment in self._appointments.values():
             yield appointment
 
     def __contains__(self, item):
         """Implement "in" operator for Calendar object."""
-        for appointment in self:
-            if appointment == item:
-                return True
+        if not hasattr(item, "_is_Appointment"):
+            for appointment in self:
+                if appointment == item:
+                    return True
+            return False
 
-        return False
+        return item in self._ids
 
     def __deepcopy__(self, memo):
-        """Implement copy.deepcopy for Calendar object."""
-        from copy import deepcopy
+        """
+        Implement copy.deepcopy for Calendar object; Appointments are
+        immutable and the HashTries persistent, so the copy shares them.
+        """
         new_calendar = Calendar()
-        for appointment in self:
-            new_calendar += deepcopy(appointment)
+        new_calendar._appointments = self._appointments
+        new_calendar._next_seq = self._next_seq
+        new_calendar._ids = self._ids
+        new_calendar._index = self._index
         return new_calendar
 
+    def _append(self, appointment):
+        """Add appointment after every Appointment in this Calendar."""
+        self._appointments = self._appointments.set(
+            self._next_seq, appointment)
+        self._ids = self._ids.set(appointment, self._next_seq)
+        self._index_add(appointment)
+        self._next_seq += 1
+
+    def _index_add(self, appointment):
+        """Add appointment to the interval index of this Calendar."""
+        for participant in appointment._participants:
+            index_key = (participant, appointment._day)
+            starts, appts = self._index.get(index_key, ((), ()))
+            i = bisect_left(starts, appointment._start)
+            self._index = self._index.set(index_key, (
+                starts[:i] + (appointment._start,) + starts[i:],
+                appts[:i] + (appointment,) + appts[i:]))
+
+    def _index_remove(self, appointment):
+        """
+        Remove appointment from the interval index of this Calendar; it is
+        the only entry of each of its buckets starting at its start slot.
+        """
+        for participant in appointment._participants:
+            index_key = (participant, appointment._day)
+            starts, appts = self._index.get(index_key)
+            if len(starts) == 1:
+                self._index = self._index.remove(index_key)
+            else:
+                i = bisect_left(starts, appointment._start)
+                self._index = self._index.set(index_key, (
+                    starts[:i] + starts[i + 1:], appts[:i] + appts[i + 1:]))
+
+    def _find(self, appointment):
+        """
+        Return the Appointment in this Calendar equal to appointment or None
+        if there is no such Appointment.
+        """
+        seq = self._ids.get(appointment)
+        if seq is None:
+            return None
+        return self._appointments.get(seq)
+
+    def _index_conflict(self, appointment):
+        """
+        Return an Appointment in this Calendar conflicting with appointment or
+        None if there is no such Appointment.
+
+        Appointments indexed under the same (participant, day) never overlap,
+        so for each participant only the latest Appointment starting before
+        appointment ends can overlap it.
+        """
+        for participant in appointment._participants:
+            bucket = self._index.get((participant, appointment._day))
+            if not bucket:
+                continue
+
+            starts, appts = bucket
+            i = bisect_left(starts, appointment._end)
+            if i:
+                candidate = appts[i - 1]
+                if candidate._end > appointment._start:
+                    #an equal Appointment overlaps but doesn't conflict
+                    if candidate != appointment:
+                        return candidate
+
+        return None
+
     def _is_appointment_conflicting(self, appointment):
         """
         Determine if Appointment object appointment conflicts with any
@@ -190,11 +389,7 @@ class Calendar(object):
                 "appointment parameter must be an Appointment object")
 
         #if appointment conflicts with anything in this Calendar
-        for calendar_appointment in self:
-            if Appointment._is_conflicting(calendar_appointment, appointment):
-                return True
-
-        return False
+        return self._index_conflict(appointment) is not None
 
     def _is_calendar_conflicting(self, other):
         """Determine if self and other are conflicting."""
@@ -202,71 +397,189 @@ class Calendar(object):
         if not hasattr(other, "_is_Calendar"):
             raise TypeError("both parameters must be Calendar objects.")
 
-        #if any pair of appointments is conflicting, calendars conflict
-        for appt1 in self:
-            for appt2 in other:
-                if Appointment._is_conflicting(appt1, appt2):
-                    return True
+        return bool(self.merge(other)[1])
 
-        return False
+    def merge(self, other):
+        """
+        Merge Calendar other into a copy of this Calendar in
+        O((n + m) log(n + m)), e.g., to reconcile a snapshot with a Calendar
+        caught up from a peer.
+
+        Return (merged Calendar, conflicts) where conflicts lists the
+        (Appointment of self, Appointment of other) pairs that overlap and
+        share a participant; the merged Calendar holds every Appointment of
+        self followed by those of other in neither a conflict nor self.
+
+        The Appointments of both are sorted by (participant, day, start) and
+        swept once; neither Calendar conflicts with itself, so an Appointment
+        can only overlap the latest Appointment of the other Calendar swept
+        before it under the same participant and day.
+        """
+
+        if not hasattr(other, "_is_Calendar"):
+            raise TypeError("other parameter must be a Calendar object.")
+
+        calendars = (list(self), list(other))
+        entries = []
+        for side, appointments in enumerate(calendars):
+            for i, appointment in enumerate(appointments):
+                for participant in appointment._participants:
+                    entries.append((participant, appointment._day,
+                                    appointment._start, side, i))
+        entries.sort()
+
+        conflicts, conflicting, group = [], set(), None
+        for participant, day, start, side, i in entries:
+            if (participant, day) != group:
+                group, latest = (participant, day), [None, None]
+
+            appointment = calendars[side][i]
+            candidate = latest[1 - side]
+            latest[side] = appointment
+            if candidate is None or candidate._end <= start:
+                continue
+
+            #an equal Appointment overlaps but doesn't conflict
+            if candidate != appointment:
+                pair = (appointment, candidate) if side == 0 else \
+                    (candidate, appointment)
+                if pair not in conflicting:
+                    conflicting.add(pair)
+                    conflicts.append(pair)
+
+        #other Appointments in a conflict are left out of the merge
+        left_out = set([appt for appt_self, appt in conflicts])
+        merged = copy.deepcopy(self)
+        for appointment in calendars[1]:
+            if appointment not in left_out and appointment not in self._ids:
+                merged._append(appointment)
+
+        return merged, conflicts
 
     def get_appointment_names(self):
         """Return sorted list of Appointment names in this Calendar object."""
-        return sorted([appt._name for appt in self._appointments])
+        return sorted([appt._name for appt in self])
 
     @staticmethod
     def serialize(calendar):
-        """Return a string representation of the calendar with appointments seperated by a hash delimiter"""
-        if calendar:
-            return "#".join([str(appt) for appt in calendar._appointments])
-        else:
+        """
+        Return a compact binary representation of calendar for the wire.
+
+        Layout (version 1): magic, version byte, varint count of the interned
+        name table followed by length-prefixed names, then a varint count of
+        Appointments each packed as varint name index, day byte, start and end
+        half-hour slot bytes and a varint-prefixed list of zigzag varint
+        participant ids.
+        """
+        if calendar is None:
             return None
 
-    @staticmethod
-    def deserialize(serial_msg):
-        """Return a Calendar object parsed from a serialized string"""
-        if not serial_msg:
-            return serial_msg
+        chunks = [_SERIAL_MAGIC, chr(_SERIAL_VERSION)]
+        names, name_ids = [], {}
+        for appointment in calendar:
+            if appointment._name not in name_ids:
+                name_ids[appointment._name] = len(names)
+                names.append(appointment._name)
 
-        if type(serial_msg) != str:
-            return serial_msg
+        _pack_varint(len(names), chunks)
+        for name in names:
+            _pack_varint(len(name), chunks)
+            chunks.append(name)
 
-        appt_list = serial_msg.split("#")
-        appt_for_calendar = []
-        for appt_str in appt_list:
-            
-            first_str = appt_str.split(" on ")
-            appt_name = first_str[0].split("Appointment ")[1][1:-1]
+        _pack_varint(len(calendar), chunks)
+        for appointment in calendar:
+            _pack_appointment(
+                appointment, name_ids[appointment._name], chunks)
 
-            second_str = first_str[1].split(" with ")
-            user_list = second_str[1].split(" and ")
-            users_final = []
+        return "".join(chunks)
 
-            for part in user_list:
-                users = part.split(" ")
-                for part in users:
-                    if len(part) == 2:
-                        users_final.append(int(part[:-1]))
-                    else:
-                        users_final.append(int(part))
+    @staticmethod
+    def is_serialized(serial_msg):
+        """Determine if serial_msg looks like the output of serialize."""
+        return type(serial_msg) == str and serial_msg[:3] == _SERIAL_MAGIC
 
+    @staticmethod
+    def deserialize(serial_msg, trusted=False):
+        """
+        Return a Calendar object parsed from the output of serialize.
 
-            dates_part_1 = first_str[1].split(" from ")
-            times = dates_part_1[1].split(" to ")
-            start_time = times[0]
-            end_time = times[1].split(" with ")[0]
-            appointment_day = dates_part_1[0]
+        If trusted is True (i.e. serial_msg came from a known peer, which only
+        ever serializes valid Calendars) Appointments and Calendar are rebuilt
+        without re-validation. Otherwise every Appointment goes through its
+        constructor and the Calendar is checked for conflicts.
 
+        Raise ValueError if serial_msg is not a valid serialized Calendar.
+        """
+        if not serial_msg:
+            return serial_msg
+
+        if type(serial_msg) != str:
+            return serial_msg
 
-            start_time_hour, start_time_minute = [ int(comp_time) for comp_time in start_time.split(":") ]
-            end_time_hour, end_time_minute = [ int(comp_time) for comp_time in end_time.split(":")]
-            start_time_final = datetime.time(start_time_hour, start_time_minute)
-            end_time_final = datetime.time(end_time_hour, end_time_minute)
+        if not Calendar.is_serialized(serial_msg):
+            raise ValueError("serial_msg is not a serialized Calendar")
 
-            appointment = Appointment(appt_name, appointment_day, start_time_final, end_time_final, users_final)
-            appt_for_calendar.append(appointment)
+        if ord(serial_msg[3]) != _SERIAL_VERSION:
+            raise ValueError(
+                "Unsupported Calendar serialization version " +
+                str(ord(serial_msg[3])))
 
-        return Calendar(*appt_for_calendar)
+        try:
+            offset = 4
+            num_names, offset = _unpack_varint(serial_msg, offset)
+            names = []
+            for i in range(num_names):
+                length, offset = _unpack_varint(serial_msg, offset)
+                if offset + length > len(serial_msg):
+                    raise ValueError("truncated name table")
+                names.append(serial_msg[offset:offset + length])
+                offset += length
+
+            num_appointments, offset = _unpack_varint(serial_msg, offset)
+            appointments = []
+            for i in range(num_appointments):
+                appointment, offset = _unpack_appointment(
+                    serial_msg, offset, names, trusted)
+                appointments.append(appointment)
+        except (IndexError, struct.error):
+            raise ValueError("serial_msg is a malformed serialized Calendar")
+
+        if offset != len(serial_msg):
+            raise ValueError("serial_msg has trailing bytes")
+
+        if trusted:
+            return Calendar._from_trusted(appointments)
+
+        return Calendar(*appointments)
+
+    @staticmethod
+    def _from_trusted(appointments):
+        """
+        Build a Calendar from a list of Appointments already known to be
+        duplicate and conflict free, skipping validation.
+        """
+        calendar = Calendar()
+        buckets = {}
+        for seq, appointment in enumerate(appointments):
+            for participant in appointment._participants:
+                buckets.setdefault((participant, appointment._day), []).append(
+                    (appointment._start, appointment))
+
+        #build the HashTries at once instead of by insertion
+        calendar._appointments = HashTrie.from_items(enumerate(appointments))
+        calendar._next_seq = len(calendar._appointments)
+        calendar._ids = HashTrie.from_items(
+            [(appt, seq) for seq, appt in enumerate(appointments)])
+        index = []
+        for index_key, entries in buckets.items():
+            #starts within a bucket are distinct, so only they are compared
+            entries.sort(key=lambda entry: entry[0])
+            index.append((index_key, (
+                tuple([start for start, appt in entries]),
+                tuple([appt for start, appt in entries]))))
+        calendar._index = HashTrie.from_items(index)
+
+        return calendar
 
     def __str__(self):
         """Implement str(Calendar) ofr Calendar object."""
@@ -0,0 +1,204 @@
+"""Single-threaded event loop running a Node's components as coroutines."""
+
+import os
+import time
+import heapq
+import fcntl
+import select
+import logging
+import itertools
+import collections
+
+class EventLoop(object):
+    """
+    EventLoop class.
+
+    max_tasks:  Maximum number of coroutines running at once.
+    ready:      Tasks to resume on the next iteration with the value to send
+                into them.
+    timers:     Heap of (deadline, sequence number, task) for tasks sleeping
+                or waiting with a timeout.
+    readers:    Tasks waiting until an object with a fileno() is readable.
+    queues:     Tasks waiting until a Queue is nonempty; only puts made by
+                the loop's own coroutines (or followed by wakeup()) are seen.
+
+    A coroutine is a generator; it suspends itself by yielding one of:
+        EventLoop.sleep(seconds)
+        EventLoop.readable(fileobj, timeout=None)
+        EventLoop.queued(queue, timeout=None)
+        another generator, which is run to completion first.
+    and is resumed with True once the condition holds or False on timeout
+    (always False after a sleep). A task raising an exception is logged and
+    dropped. Every task keeps a stack of the generators it is running, so a task is
+    one entry in the loop however deep its calls go.
+    """
+
+    def __init__(self, max_tasks=16):
+        """Construct EventLoop object."""
+        if type(max_tasks) != int:
+            raise TypeError("max_tasks must be an int")
+        if max_tasks < 1:
+            raise ValueError("max_tasks must be positive")
+
+        self._max_tasks = max_tasks
+        self._num_tasks = 0
+        self._ready = collections.deque()
+        self._timers = []
+        self._sequence = itertools.count()
+        self._readers = {}
+        self._queues = {}
+        self._stopped = False
+
+        #a byte on this pipe wakes the loop from another thread
+        self._wake_r, self._wake_w = os.pipe()
+        for fd in (self._wake_r, self._wake_w):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self._is_EventLoop = True
+
+    @staticmethod
+    def sleep(seconds):
+        """Return the request to resume a coroutine after seconds."""
+        return ("sleep", None, seconds)
+
+    @staticmethod
+    def readable(fileobj, timeout=None):
+        """Return the request to resume a coroutine once fileobj's readable."""
+        return ("readable", fileobj, timeout)
+
+    @staticmethod
+    def queued(queue, timeout=None):
+        """Return the request to resume a coroutine once queue is nonempty."""
+        return ("queued", queue, timeout)
+
+    def spawn(self, coroutine):
+        """
+        Schedule generator coroutine as a new task.
+
+        Raise ValueError if max_tasks tasks are running already.
+        """
+        if not hasattr(coroutine, "send"):
+            raise TypeError("coroutine must be a generator")
+        if self._num_tasks >= self._max_tasks:
+            raise ValueError(
+                "EventLoop already runs " + str(self._max_tasks) + " tasks")
+
+        self._num_tasks += 1
+        self._ready.append(([coroutine], None))
+
+    def wakeup(self):
+        """Wake the loop up from another thread; thread-safe."""
+        try:
+            os.write(self._wake_w, "x")
+        except OSError:
+            pass
+
+    def stop(self):
+        """Make run() return after the current iteration; thread-safe."""
+        self._stopped = True
+        self.wakeup()
+
+    def _step(self, task, value):
+        """Resume task with value until it waits on something or ends."""
+        while True:
+            try:
+                request = task[-1].send(value)
+            except StopIteration:
+                task.pop()
+                if not task:
+                    self._num_tasks -= 1
+                    return
+                value = True
+                continue
+            except Exception:
+                #like an uncaught exception in a thread, only end this task
+                logging.exception("EventLoop task failed")
+                self._num_tasks -= 1
+                return
+
+            #a yielded generator runs as a call within the same task
+            if hasattr(request, "send"):
+                task.append(request)
+                value = None
+                continue
+
+            kind, target, timeout = request
+            waiter = [task, True]
+            if timeout is not None:
+                deadline = time.time() + timeout
+                heapq.heappush(
+                    self._timers, (deadline, next(self._sequence), waiter))
+            if kind == "readable":
+                self._readers.setdefault(target, []).append(waiter)
+            elif kind == "queued":
+                self._queues.setdefault(target, []).append(waiter)
+            elif timeout is None:
+                raise ValueError("sleep needs a number of seconds")
+            return
+
+    def _resume(self, waiter, value):
+        """Make a waiting task ready unless it was resumed already."""
+        if waiter[1]:
+            waiter[1] = False
+            self._ready.append((waiter[0], value))
+
+    def _select_timeout(self):
+        """Return how long the loop may block waiting for I/O."""
+        if self._ready:
+            return 0.0
+        for queue, waiters in self._queues.items():
+            if not queue.empty():
+                return 0.0
+        while self._timers and not self._timers[0][2][1]:
+            heapq.heappop(self._timers)
+        if self._timers:
+            return max(0.0, self._timers[0][0] - time.time())
+        return None
+
+    def run(self):
+        """Run tasks until every task ended or stop() was called."""
+        while self._num_tasks and not self._stopped:
+            while self._ready:
+                task, value = self._ready.popleft()
+                self._step(task, value)
+
+            #the last task may just have ended; don't block in select then
+            if not self._num_tasks or self._stopped:
+                break
+
+            #drop waits that were already resumed
+            for table in (self._readers, self._queues):
+                for target, waiters in table.items():
+                    waiters = [waiter for waiter in waiters if waiter[1]]
+                    if waiters:
+                        table[target] = waiters
+                    else:
+                        del table[target]
+
+            readable = select.select(
+                self._readers.keys() + [self._wake_r], [], [],
+                self._select_timeout())[0]
+            if self._wake_r in readable:
+                try:
+                    while os.read(self._wake_r, 4096):
+                        pass
+                except OSError:
+                    pass
+            for target in readable:
+                for waiter in self._readers.get(target, []):
+                    self._resume(waiter, True)
+            for queue, waiters in self._queues.items():
+                if not queue.empty():
+                    for waiter in waiters:
+                        self._resume(waiter, True)
+
+            now = time.time()
+            while self._timers and self._timers[0][0] <= now:
+                self._resume(heapq.heappop(self._timers)[2], False)
+
+        self._stopped = False
+
+    def close(self):
+        """Close the wakeup pipe."""
+        os.close(self._wake_r)
+        os.close(self._wake_w)
@@ -0,0 +1,270 @@
+"""Persistent hash array mapped trie used by Calendar."""
+
+import itertools
+
+_BITS = 5
+_DEPTH = 6
+_SHIFT = _BITS * (_DEPTH - 1)
+_MASK = (1 << (_BITS * _DEPTH)) - 1
+
+
+def _hash(key):
+    """Return the 30 bit hash of key the trie is keyed on."""
+    return hash(key) & _MASK
+
+
+def _count(child):
+    """Return the number of keys under child, a _Node or a leaf."""
+    if type(child) is _Node:
+        return child.count
+    return len(child[1])
+
+
+class _Node(object):
+    """
+    Node of a HashTrie.
+
+    bitmap:     Bit i is set if the node has a child for the 5 bits i of the
+                hash at its depth.
+    count:      Number of keys in the subtrie.
+    children:   Tuple of the children in bit order; a child is a _Node or a
+                leaf, i.e., a (hash, pairs) tuple where pairs is a tuple of
+                the (key, value) pairs whose keys share that hash.
+    """
+
+    __slots__ = ("bitmap", "count", "children")
+
+    def __init__(self, bitmap, count, children):
+        """Construct a _Node object."""
+        self.bitmap = bitmap
+        self.count = count
+        self.children = children
+
+
+_EMPTY = _Node(0, 0, ())
+
+
+def _split(leaf1, leaf2, depth):
+    """Return a _Node at depth holding two leaves of different hashes."""
+    shift = _SHIFT - _BITS * depth
+    index1 = (leaf1[0] >> shift) & 31
+    index2 = (leaf2[0] >> shift) & 31
+    count = len(leaf1[1]) + len(leaf2[1])
+    if index1 == index2:
+        return _Node(1 << index1, count, (_split(leaf1, leaf2, depth + 1),))
+    if index1 > index2:
+        leaf1, leaf2, index1, index2 = leaf2, leaf1, index2, index1
+    return _Node((1 << index1) | (1 << index2), count, (leaf1, leaf2))
+
+
+def _set(node, depth, h, key, value):
+    """
+    Return (copy of node with key mapped to value, number of keys added);
+    only the path down to key is copied.
+    """
+    bit = 1 << ((h >> (_SHIFT - _BITS * depth)) & 31)
+    #the number of children before bit gives its position
+    position = bin(node.bitmap & (bit - 1)).count("1")
+    children = node.children
+    if not node.bitmap & bit:
+        leaf = (h, ((key, value),))
+        return _Node(node.bitmap | bit, node.count + 1,
+                        children[:position] + (leaf,) + children[position:]), 1
+
+    child = children[position]
+    if type(child) is _Node:
+        child, added = _set(child, depth + 1, h, key, value)
+    elif child[0] != h:
+        child, added = _split(child, (h, ((key, value),)), depth + 1), 1
+    else:
+        pairs, added = child[1], 1
+        for i, (other_key, other_value) in enumerate(pairs):
+            if other_key is key or other_key == key:
+                pairs, added = pairs[:i] + ((key, value),) + pairs[i + 1:], 0
+                break
+        else:
+            pairs += ((key, value),)
+        child = (h, pairs)
+
+    children = children[:position] + (child,) + children[position + 1:]
+    return _Node(node.bitmap, node.count + added, children), added
+
+
+def _remove(node, depth, h, key):
+    """
+    Return node without key, a leaf if that leaves a single leaf below a
+    node other than the root, or None if nothing is left below it.
+
+    Raise KeyError if key is not in node.
+    """
+    bit = 1 << ((h >> (_SHIFT - _BITS * depth)) & 31)
+    if not node.bitmap & bit:
+        raise KeyError(key)
+
+    position = bin(node.bitmap & (bit - 1)).count("1")
+    child = node.children[position]
+    if type(child) is _Node:
+        child = _remove(child, depth + 1, h, key)
+    elif child[0] != h:
+        raise KeyError(key)
+    else:
+        pairs = tuple([pair for pair in child[1]
+                        if not (pair[0] is key or pair[0] == key)])
+        if len(pairs) == len(child[1]):
+            raise KeyError(key)
+        child = (h, pairs) if pairs else None
+
+    bitmap, children = node.bitmap, node.children
+    if child is None:
+        bitmap &= ~bit
+        children = children[:position] + children[position + 1:]
+    else:
+        children = children[:position] + (child,) + children[position + 1:]
+
+    if depth and not children:
+        return None
+    if depth and len(children) == 1 and type(children[0]) is not _Node:
+        return children[0]
+    return _Node(bitmap, node.count - 1, children)
+
+
+def _build(leaves, depth):
+    """Return a _Node at depth holding leaves, a list sorted by hash."""
+    shift = _SHIFT - _BITS * depth
+    bitmap, count, children = 0, 0, []
+    for index, group in itertools.groupby(
+            leaves, lambda leaf: (leaf[0] >> shift) & 31):
+        group = list(group)
+        if len(group) == 1:
+            child = group[0]
+        else:
+            child = _build(group, depth + 1)
+        bitmap |= 1 << index
+        count += _count(child)
+        children.append(child)
+    return _Node(bitmap, count, tuple(children))
+
+
+def _items(node):
+    """Yield the (key, value) pairs under node in hash order."""
+    for child in node.children:
+        if type(child) is _Node:
+            for pair in _items(child):
+                yield pair
+        else:
+            for pair in child[1]:
+                yield pair
+
+
+class HashTrie(object):
+    """
+    HashTrie class; an immutable map from hashable keys to values.
+
+    root:   _Node the keys hang off by 5 bit pieces of their hash, most
+            significant first, as in a hash array mapped trie.
+
+    set and remove return a new HashTrie sharing every node with this one
+    except the O(log n) ones on the path to the key, so versions of a map
+    are cheap to keep. Items are kept in order of hash; as ints hash to
+    themselves, nonnegative int keys below 2**30 are kept in ascending
+    order, which nth() indexes into.
+    """
+
+    __slots__ = ("_root",)
+
+    def __init__(self, root=_EMPTY):
+        """Construct a HashTrie object; empty unless given a root _Node."""
+        self._root = root
+
+    def __getstate__(self):
+        """Pickle the items of this HashTrie; it has no __dict__."""
+        return tuple(self.items())
+
+    def __setstate__(self, state):
+        """Restore a pickled HashTrie."""
+        self._root = HashTrie.from_items(state)._root
+
+    @staticmethod
+    def from_items(items):
+        """
+        Return a HashTrie of the (key, value) pairs items, which must have
+        distinct keys; built at once in O(n log n) rather than by n sets.
+        """
+        pairs = {}
+        for key, value in items:
+            pairs.setdefault(hash(key) & _MASK, []).append((key, value))
+        leaves = sorted([(h, tuple(same_hash))
+                            for h, same_hash in pairs.items()])
+        return HashTrie(_build(leaves, 0))
+
+    def __len__(self):
+        """Implement len(HashTrie)."""
+        return self._root.count
+
+    def __iter__(self):
+        """Implement iterator over the keys of HashTrie."""
+        for key, value in _items(self._root):
+            yield key
+
+    def __contains__(self, key):
+        """Implement "in" operator for the keys of HashTrie."""
+        missing = []
+        return self.get(key, missing) is not missing
+
+    def get(self, key, default=None):
+        """Return the value of key, or default if key is not in the map."""
+        h = hash(key) & _MASK
+        node, shift = self._root, _SHIFT
+        while True:
+            bit = 1 << ((h >> shift) & 31)
+            if not node.bitmap & bit:
+                return default
+            child = node.children[bin(node.bitmap & (bit - 1)).count("1")]
+            if type(child) is _Node:
+                node, shift = child, shift - _BITS
+                continue
+            if child[0] == h:
+                for other_key, value in child[1]:
+                    if other_key is key or other_key == key:
+                        return value
+            return default
+
+    def set(self, key, value):
+        """Return a HashTrie mapping key to value and otherwise like this."""
+        return HashTrie(_set(self._root, 0, _hash(key), key, value)[0])
+
+    def remove(self, key):
+        """
+        Return a HashTrie without key and otherwise like this one.
+
+        Raise KeyError if key is not in the map.
+        """
+        return HashTrie(_remove(self._root, 0, _hash(key), key))
+
+    def items(self):
+        """Return a generator of the (key, value) pairs in hash order."""
+        return _items(self._root)
+
+    def values(self):
+        """Return a generator of the values in hash order."""
+        return (value for key, value in _items(self._root))
+
+    def nth(self, index):
+        """
+        Return the (key, value) pair at index in hash order.
+
+        Raise IndexError if index is not within 0 and len(HashTrie) - 1.
+        """
+        if not 0 <= index < self._root.count:
+            raise IndexError("HashTrie index out of range")
+
+        node = self._root
+        while True:
+            for child in node.children:
+                count = _count(child)
+                if index < count:
+                    break
+                index -= count
+            if type(child) is not _Node:
+                return child[1][index]
+            node = child
@@ -2,16 +2,24 @@
 
 import os
 import sys
+import copy
 import time
+import random
 import thread
+import threading
+import Queue
 import pickle
-import socket
 import logging
-from Bully import bully_algorithm
+from Bully import leader_lease, leader_lease_coroutine
 from Appointment import Appointment
 from Calendar import Calendar
+from Operation import Operation
+from Batch import Batch
 from Proposer import Proposer
 from Acceptor import Acceptor
+from EventLoop import EventLoop
+from Transport import UDPTransport, TCPTransport
+from WriteAheadLog import WriteAheadLog
 
 class Node(object):
     """
@@ -23,22 +31,96 @@ class Node(object):
     proposer:       Proposer object used in Synod Algorithm; passed node_id so
                     it can create unique proposal numbers.
     acceptor:       Acceptor object used in Synod Algorithm.
-    log:            Dictionary of Calendar objects used in Paxos Algorithm;
+    log:            Dictionary of Batch objects used in Paxos Algorithm;
                     intially empty, Synod Algorithm is used to fill each entry
                     of log where integer keys represents slots and the values
-                    being the Calendar agreed upon via conscensus.
+                    being the Batch of Operations agreed upon via conscensus.
+                    calendar is the result of applying the snapshot then the
+                    log in slot order. Only slots from snapshot_slot on are
+                    kept; older ones are folded into the snapshot.
+    snapshot:       Calendar obtained by applying every slot before
+                    snapshot_slot; initially empty with snapshot_slot 0.
+    applied_slot:   First slot not applied to calendar yet, i.e., the first
+                    one missing from the snapshot and log; learning it
+                    applies it and the later slots it made contiguous, so
+                    each slot is applied once and in order.
+    last_slot:      Highest slot learned (snapshot_slot - 1 if none); gaps
+                    in the log lie between applied_slot and last_slot.
+    snapshot_slots, A new snapshot is taken, and the log and Acceptor state
+    snapshot_bytes: below it dropped, once the applied log tail holds
+                    snapshot_slots slots or snapshot_bytes bytes of serialized
+                    Batches; either limit is ignored if None.
+    catchup_to,     A gap in the log (e.g. after a restart) is filled by
+    catchup_time:   asking a peer for the missing slots, or its snapshot if
+                    they were compacted, streamed back in chunks of about
+                    chunk_bytes; catchup_to is the end of the last requested
+                    range and catchup_time when it was requested or last made
+                    progress, so a stalled request is retried after
+                    catchup_timeout seconds.
     leader:         The current leader elected via the bully algorithm;
-                    initially None and updated every ~6 seconds.
+                    initially None.
+    lease_time,     The leader sends a heartbeat every heartbeat_time seconds
+    lease_expiry:   and every heartbeat extends its lease to lease_time
+                    seconds from then; a Bully round only runs once the lease
+                    expired (at lease_expiry) or no leader is known.
+    leader_elected: Event set while a leader is known; insert and delete wait
+                    for it up to leader_timeout seconds.
+    read_lease:     (expiry, read_slot) of the leader's read lease: a
+                    majority acknowledged a heartbeat sent lease_time seconds
+                    (less lease_drift for clock drift) before expiry, and
+                    their Acceptors nack every other Proposer until then, so
+                    the leader serves reads alone once it applied every slot
+                    before read_slot (after the highest they accepted).
+    heartbeat_acks: Highest slot accepted by each Node that acknowledged the
+                    heartbeat this leader sent at a time, per send time.
+    leader_applied: (applied slot, arrival time) the last heartbeat of the
+                    leader carried; bounds the staleness of follower reads.
+    multi_paxos:    If True, the Proposer runs in Multi-Paxos mode, i.e.,
+                    skips the prepare phase for consecutive log slots while
+                    it stays leader.
+    batch_size,     Batching and pipelining settings of the Proposer; see
+    batch_window,   Proposer.
+    pipeline_depth:
+    transport:      Transport this Node, its Proposer and its Acceptor send
+                    and receive Paxos messages through; an instance of
+                    transport_class, UDPTransport (one shared UDP socket) by
+                    default or TCPTransport (a persistent connection per
+                    peer) for reliable delivery.
+    bully_transport: TCPTransport with a persistent connection per peer on
+                    the TCP ports of the IP table, used by Bully; messages
+                    to a peer that is down are dropped.
+    wal:            WriteAheadLog at wal_path the Acceptor logs its state and
+                    commits to before replying, fsyncing groups of up to
+                    wal_group_size records at once; None if wal_path is None.
+    state_path:     File every compaction checkpoints this Node's state to,
+                    emptying the WAL; wal_path with a .pkl extension (the
+                    file load() read from if loaded), None without a WAL.
+    lock:           Held by the learner while it changes the log, snapshot
+                    or calendar, and by save().
+    applied_cond:   Condition of lock notified after every commit the
+                    learner handled; read() waits on it.
     """
 
     _ip_filename = "./IP_translations.txt"
-
-    def __init__(self, node_id):
+    _chunk_bytes = 3000
+    _catchup_timeout = 1.0
+    _leader_timeout = 10.0
+    _lease_drift = 0.1
+
+    def __init__(self, node_id, multi_paxos=False, batch_size=1,
+                    batch_window=0.0, pipeline_depth=None, wal_path=None,
+                    wal_group_size=64, snapshot_slots=1000,
+                    snapshot_bytes=None, transport_class=UDPTransport):
         """Construct a Node object."""
         if type(node_id) != int:
             raise TypeError("node_id must be an int")
         if node_id < 0:
             raise ValueError("node id must be a nonnegative integer")
+        for limit in (snapshot_slots, snapshot_bytes):
+            if limit is not None and type(limit) != int:
+                raise TypeError("snapshot limits must be ints or None")
+            if limit is not None and limit < 1:
+                raise ValueError("snapshot limits must be positive")
 
         try:
             Node._ip_table = Node._make_ip_table()
@@ -47,71 +129,409 @@ class Node(object):
 
         self._node_id = node_id
         self._calendar = Calendar()
-        self._proposer = Proposer(node_id,self._ip_table)
-        self._acceptor = Acceptor(self._ip_table)
+        self._transport = transport_class(self._ip_table, node_id)
+        self._bully_transport = TCPTransport(
+            self._ip_table, node_id, port_index=1, drop_unsent=True)
+        self._proposer = Proposer(
+            node_id, self._ip_table, multi_paxos, batch_size, batch_window,
+            pipeline_depth, self._transport)
+        self._wal, self._state_path = None, None
+        if wal_path is not None:
+            self._wal = WriteAheadLog(wal_path, wal_group_size)
+            self._state_path = os.path.splitext(wal_path)[0] + ".pkl"
+            if self._wal.is_empty():
+                Node._log_header(self._wal, node_id)
+        self._acceptor = Acceptor(self._ip_table, self._transport, self._wal)
         self._log = {}
+        self._log_bytes = 0
+        self._snapshot = Calendar()
+        self._snapshot_slot = 0
+        self._applied_slot = 0
+        self._last_slot = -1
+        self._snapshot_slots = snapshot_slots
+        self._snapshot_bytes = snapshot_bytes
+        self._catchup_to = 0
+        self._catchup_time = 0.0
+        self._snapshot_chunks = {}
         self._leader = None
+        self._lease_time = 3.0
+        self._lease_expiry = 0.0
+        self._leader_elected = threading.Event()
+        self._read_lease = (0.0, 0)
+        self._heartbeat_acks = {}
+        self._leader_applied = (0, 0.0)
+        self._lock = thread.allocate_lock()
+        self._applied_cond = threading.Condition(self._lock)
         self._terminate = False
         self._is_Node = True
 
     def insert(self, appointment):
-        """Insert an Appointment into this Node's Calendar."""
-        #First create new Calendar with new appointment
-        from copy import deepcopy
-        new_calendar = deepcopy(self._calendar)
-        new_calendar += appointment
-
-        if self._log.keys():
-            next_log_slot = max(self._log.keys()) + 1
-        else:
-            next_log_slot = 0
+        """
+        Insert an Appointment into this Node's Calendar; return False if no
+        leader was elected in time to propose it.
+        """
+        return self._propose(Operation("add", appointment))
 
-        #Then ask leader to propose the new Calendar
-        try:
-            leader_IP, leader_TCP, leader_UDP = self._ip_table[self._leader]
-            proposal_message = pickle.dumps(
-                ("propose", Calendar.serialize(new_calendar), next_log_slot))
-            udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            udp_socket.sendto(proposal_message, (leader_IP, leader_UDP))
-            udp_socket.close()
-        except KeyError as excinfo:
+    def delete(self, appointment):
+        """
+        Delete an Appointment in this Node's Calendar; return False if no
+        leader was elected in time to propose it.
+        """
+        return self._propose(Operation("remove", appointment))
+
+    def _propose(self, operation):
+        """
+        Ask the leader to propose operation for the next log slot, waiting
+        up to leader_timeout seconds for one to be elected if needed; return
+        whether there was one.
+        """
+        leader = self._leader
+        if leader is None:
             print "Unable to find leader, waiting until one is selected..."
-            while self._leader == None:
-                pass
-            print "Found leader, continuing...\n"
-            self.insert(appointment)
+        while leader is None:
+            if not self._leader_elected.wait(Node._leader_timeout):
+                logging.error("No leader elected; dropping " + str(operation))
+                return False
+            leader = self._leader
 
-    def delete(self, appointment):
-        """Delete an Appointment in this Node's Calendar."""
-        #First create new Calendar without appointment
-        from copy import deepcopy
-        new_calendar = Calendar()
-        for self_appointment in self._calendar:
-            if self_appointment != appointment:
-                new_calendar += deepcopy(self_appointment)
-
-        if self._log.keys():
-            next_log_slot = max(self._log.keys()) + 1
+        #Then ask leader to propose the new Calendar
+        next_log_slot = self._last_slot + 1
+        proposal_message = (
+            "propose", Operation.serialize(operation), next_log_slot)
+        self._transport.send(proposal_message, leader)
+        return True
+
+    def _set_leader(self, ID):
+        """
+        Record the Node with ID as leader, renewing its lease, or that no
+        leader is known if ID is None.
+        """
+        if ID != self._leader:
+            logging.debug("NEW LEADER IS: " + str(ID))
+        self._leader = ID
+        if ID is None:
+            self._leader_elected.clear()
         else:
-            next_log_slot = 0
+            self._lease_expiry = time.time() + self._lease_time
+            self._leader_elected.set()
 
-        #Then ask leader to propose the new Calendar
+    def _heartbeat_data(self):
+        """
+        Return the data of the heartbeats this Node sends as leader, i.e.,
+        the send time and its applied slot; it acknowledges them itself.
+        """
+        data = (time.time(), self._applied_slot)
+        ack = self._recv_heartbeat(self._node_id, data)
+        if ack is not None:
+            self._recv_heartbeat_ack(self._node_id, ack)
+        return data
+
+    def _recv_heartbeat(self, ID, data):
+        """
+        Handle the data of a heartbeat of the leader with ID; return the
+        acknowledgement to send back if its Acceptor granted the leader a
+        lease, None otherwise.
+        """
+        sent_time, applied_slot = data
+        now = time.time()
+        self._leader_applied = (applied_slot, now)
+        if not self._acceptor._grant_lease(ID, now + self._lease_time):
+            return None
+        return (sent_time, self._acceptor._last_accepted)
+
+    def _recv_heartbeat_ack(self, ID, data):
+        """
+        Handle the acknowledgement by the Node with ID of the heartbeat this
+        leader sent at a time; the first majority acknowledging it extends
+        the read lease.
+        """
+        sent_time, last_accepted = data
+        acks = self._heartbeat_acks.setdefault(sent_time, {})
+        acks[ID] = last_accepted
+        if len(acks) == len(self._ip_table) // 2 + 1:
+            expiry = sent_time + self._lease_time * (1 - Node._lease_drift)
+            read_slot = max(self._read_lease[1], max(acks.values()) + 1)
+            if expiry > self._read_lease[0]:
+                self._read_lease = (expiry, read_slot)
+
+        #acknowledgements for expired heartbeats can't extend the lease
+        for old_time in self._heartbeat_acks.keys():
+            if old_time < sent_time - self._lease_time:
+                del self._heartbeat_acks[old_time]
+
+    def read(self, linearizable=False, max_staleness=None, timeout=1.0):
+        """
+        Return a copy of this Node's Calendar and the first slot not applied
+        to it, without a Paxos round.
+
+        If linearizable, this Node must be the leader holding a read lease
+        and the Calendar reflects every write committed before the call. If
+        max_staleness is given, the Calendar reflects every write the leader
+        applied before its last heartbeat, which must have arrived at most
+        max_staleness seconds ago. Otherwise the Calendar is returned as is.
+        Raise ValueError if the read can't be served or the slots it needs
+        aren't applied within timeout seconds.
+        """
+        if max_staleness is not None and \
+                type(max_staleness) not in (int, float):
+            raise TypeError("max_staleness must be a number or None")
+        if linearizable and max_staleness is not None:
+            raise ValueError(
+                "A read is either linearizable or of bounded staleness")
+
+        now = time.time()
+        expiry, target_slot = self._read_lease
+        if linearizable:
+            if self._leader != self._node_id or now >= expiry:
+                raise ValueError(
+                    "Linearizable reads need the leader's read lease")
+            #writes this leader committed may not be applied yet
+            target_slot = max(
+                target_slot, self._proposer._committed_slot + 1)
+        elif max_staleness is not None:
+            target_slot, arrival_time = self._leader_applied
+            if now - arrival_time > max_staleness:
+                raise ValueError("No heartbeat of the leader arrived in the "
+                                    "last " + str(max_staleness) + " seconds")
+        else:
+            target_slot = 0
+
+        deadline = now + timeout
+        with self._applied_cond:
+            while self._applied_slot < target_slot:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise ValueError("Slot " + str(self._applied_slot) +
+                                        " not applied in time")
+                self._applied_cond.wait(remaining)
+
+            #another leader may have committed writes once the lease expired
+            if linearizable and time.time() >= self._read_lease[0]:
+                raise ValueError("The read lease expired during the read")
+            return copy.deepcopy(self._calendar), self._applied_slot
+
+    @staticmethod
+    def _replay_log(log, snapshot=None, snapshot_slot=0):
+        """
+        Return the Calendar obtained by applying the Batches of log in slot
+        order on top of a copy of Calendar snapshot (empty if None) taken at
+        snapshot_slot, stopping at the first slot not yet filled.
+        """
+        calendar = Calendar()
+        if snapshot is not None:
+            calendar = copy.deepcopy(snapshot)
+        slot = snapshot_slot
+        while log.get(slot) is not None:
+            for operation in log[slot].apply(calendar):
+                logging.debug(
+                    "Slot " + str(slot) + " dropped: " + str(operation))
+            slot += 1
+
+        return calendar
+
+    def _learn(self, log_slot, v):
+        """Record Batch v as chosen for log_slot and update the calendar."""
+        if log_slot < self._snapshot_slot or log_slot in self._log:
+            return
+
+        self._log[log_slot] = v
+        self._log_bytes += len(Batch.serialize(v))
+        self._last_slot = max(self._last_slot, log_slot)
+        if log_slot == self._applied_slot:
+            self._apply_log()
+
+        if log_slot < self._catchup_to:
+            self._catchup_time = time.time()
+        self._maybe_compact()
+        self._check_gaps()
+
+    def _apply_log(self):
+        """
+        Apply the slots from applied_slot on that are in the log, stopping at
+        the first one missing, to the calendar in place.
+        """
+        while self._log.get(self._applied_slot) is not None:
+            for operation in self._log[self._applied_slot].apply(
+                    self._calendar):
+                logging.debug("Slot " + str(self._applied_slot) +
+                                " dropped: " + str(operation))
+            self._applied_slot += 1
+
+    def _maybe_compact(self):
+        """Take a snapshot if the applied log tail is over either limit."""
+        applied_slot = self._applied_slot
+        num_slots = applied_slot - self._snapshot_slot
+        over_slots = self._snapshot_slots is not None and \
+            num_slots >= self._snapshot_slots
+        over_bytes = self._snapshot_bytes is not None and \
+            self._log_bytes >= self._snapshot_bytes
+        if num_slots and (over_slots or over_bytes):
+            self._compact(applied_slot)
+
+    def _compact(self, applied_slot):
+        """
+        Make the calendar (every slot before applied_slot applied) the new
+        snapshot and drop log and Acceptor state below applied_slot.
+        """
+        #the copy shares the calendar's structure, so this is O(1)
+        self._snapshot = copy.deepcopy(self._calendar)
+        self._snapshot_slot = applied_slot
+        for log_slot in self._log.keys():
+            if log_slot < applied_slot:
+                self._log_bytes -= len(Batch.serialize(self._log[log_slot]))
+                del self._log[log_slot]
+
+        #the Acceptor drops its state in its own thread
+        self._acceptor._command_queue.put(("compact", applied_slot))
+
+        #without a checkpoint the WAL would keep every record since startup
+        if self._state_path is not None:
+            self._checkpoint(self._state_path)
+
+    def _install_snapshot(self, snapshot_slot, snapshot):
+        """
+        Adopt Calendar snapshot a peer took at snapshot_slot if it covers
+        slots not applied here yet.
+        """
+        if snapshot_slot <= self._applied_slot:
+            return
+
+        #the snapshot taken by _compact is a copy, so apply the log to it
+        self._calendar = snapshot
+        self._compact(snapshot_slot)
+        self._applied_slot = snapshot_slot
+        self._last_slot = max(self._last_slot, snapshot_slot - 1)
+        self._apply_log()
+        self._catchup_time = time.time()
+        self._check_gaps()
+
+    def _check_gaps(self):
+        """
+        Ask a peer for the slots missing below the last learned one; called
+        on every commit and every catchup_timeout seconds without one.
+        """
+        applied_slot, last_slot = self._applied_slot, self._last_slot
+        if applied_slot >= last_slot:
+            return
+
+        #don't ask again while an earlier request still makes progress
+        expired = time.time() - self._catchup_time >= Node._catchup_timeout
+        if last_slot <= self._catchup_to and not expired:
+            return
+
+        #slots no peer sent in time may never have been chosen (e.g. their
+        #Proposer crashed); the leader fills them with no-ops
+        if last_slot <= self._catchup_to and self._leader == self._node_id:
+            missing = tuple([log_slot
+                                for log_slot in range(applied_slot, last_slot)
+                                if log_slot not in self._log])
+            self._proposer._command_queue.put(("fill", missing))
+
+        peers = [ID for ID in self._ip_table if ID != self._node_id]
+        if self._leader in peers:
+            peer = self._leader
+        elif peers:
+            peer = random.choice(peers)
+        else:
+            return
+
+        self._catchup_to = last_slot
+        self._catchup_time = time.time()
+        self._transport.send(("catchup", applied_slot, last_slot), peer)
+
+    def _serve_catchup(self, from_slot, to_slot, ID):
+        """
+        Stream the slots from from_slot up to to_slot known here to the Node
+        with ID, preceded by the snapshot if from_slot was compacted.
+        """
+        if from_slot < self._snapshot_slot:
+            data = Calendar.serialize(self._snapshot)
+            chunks = [data[i:i + Node._chunk_bytes]
+                        for i in range(0, len(data), Node._chunk_bytes)]
+            for index, chunk in enumerate(chunks):
+                transmission = ("catchup_snapshot", self._snapshot_slot,
+                                (index, len(chunks), chunk))
+                self._transport.send(transmission, ID)
+            from_slot = self._snapshot_slot
+
+        slots, size = [], 0
+        for log_slot in range(from_slot, to_slot):
+            if self._log.get(log_slot) is None:
+                continue
+
+            serial_v = Batch.serialize(self._log[log_slot])
+            slots.append((log_slot, serial_v))
+            size += len(serial_v)
+            if size >= Node._chunk_bytes:
+                self._transport.send(
+                    ("catchup_slots", from_slot, tuple(slots)), ID)
+                slots, size = [], 0
+
+        if slots:
+            self._transport.send(
+                ("catchup_slots", from_slot, tuple(slots)), ID)
+
+    def _recv_catchup_snapshot(self, snapshot_slot, chunk_info):
+        """
+        Reassemble snapshot chunks; hand a complete snapshot to the learner.
+
+        Only chunks of the newest snapshot seen are buffered.
+        """
+        index, num_chunks, chunk = chunk_info
+        if snapshot_slot not in self._snapshot_chunks:
+            if self._snapshot_chunks and \
+                    snapshot_slot < max(self._snapshot_chunks.keys()):
+                return
+            self._snapshot_chunks = {snapshot_slot: {}}
+
+        chunks = self._snapshot_chunks[snapshot_slot]
+        chunks[index] = chunk
+        if len(chunks) < num_chunks:
+            return
+
+        del self._snapshot_chunks[snapshot_slot]
+        data = "".join([chunks[i] for i in range(num_chunks)])
         try:
-            leader_IP, leader_TCP, leader_UDP = self._ip_table[self._leader]
-            proposal_message = pickle.dumps(
-                ("propose", Calendar.serialize(new_calendar), next_log_slot))
-            udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            udp_socket.sendto(proposal_message, (leader_IP, leader_UDP))
-            udp_socket.close()
-        except KeyError as excinfo:
-            print "Unable to find leader, waiting until one is selected..."
-            while self._leader == None:
-                pass
-            print "Found leader, continuing...\n"
-            self.delete(appointment)
+            snapshot = Calendar.deserialize(data, trusted=True)
+        except ValueError as excinfo:
+            logging.error(excinfo.message)
+            return
+        self._acceptor._commits_queue.put((snapshot_slot, snapshot))
+
+    @staticmethod
+    def _log_header(wal, node_id):
+        """Start empty WriteAheadLog wal with a durable record of node_id."""
+        wal.append(("node", node_id))
+        wal.sync()
 
-    def paxos(self):
-        """Engage this Node in Paxos algorithm."""
+    @staticmethod
+    def _replay_wal(node, records):
+        """
+        Reapply WriteAheadLog records to the log and Acceptor of node, then
+        rebuild its calendar.
+        """
+        for record in records:
+            if record[0] == "commit":
+                serial_v, log_slot = record[1:]
+                if log_slot >= node._snapshot_slot:
+                    node._log[log_slot] = Batch.deserialize(
+                        serial_v, trusted=True)
+            elif record[0] != "node":
+                node._acceptor._replay(record)
+
+        node._log_bytes = sum(
+            [len(Batch.serialize(v)) for v in node._log.values()])
+        node._last_slot = max(node._log.keys() + [node._snapshot_slot - 1])
+        node._calendar = copy.deepcopy(node._snapshot)
+        node._applied_slot = node._snapshot_slot
+        node._apply_log()
+
+    def paxos(self, event_loop=None):
+        """
+        Engage this Node in Paxos algorithm; the receive loop, Proposer,
+        Acceptor and learner each get a thread, or a task of EventLoop
+        event_loop if given.
+        """
         def _parse_message(message):
             """
             Parse UDP pickled tuple message.
@@ -119,7 +539,9 @@ class Node(object):
             """
 
             valid_message_types = [
-                "propose", "prepare", "promise", "accept", "ack", "commit"]
+                "propose", "prepare", "promise", "accept", "ack", "commit",
+                "prepare_all", "promise_all", "nack", "catchup",
+                "catchup_slots", "catchup_snapshot"]
 
             message_type, message_args = message[0], message[1:]
 
@@ -128,182 +550,298 @@ class Node(object):
                 logging.error("Invalid message type")
                 return
 
-            if 3 <= len(message_args) <= 4:
+            if 3 <= len(message_args) <= 5:
                 arg_0_is_int = type(message_args[0]) == int
-                arg_0_is_calendar = hasattr(message_args[0], "_is_Calendar")
-                arg_1_is_calendar = hasattr(message_args[1], "_is_Calendar")
-                if not arg_0_is_calendar:
-                    arg_0_is_None = message_args[0] == None
-                else:
-                    arg_0_is_None = False
-                if not arg_1_is_calendar:
-                    arg_1_is_None = message_args[1] == None
-                else:
-                    arg_1_is_None = False
+                arg_0_is_operation = hasattr(message_args[0], "_is_Operation")
+                arg_0_is_batch = hasattr(message_args[0], "_is_Batch")
+                arg_1_is_batch = hasattr(message_args[1], "_is_Batch")
+                arg_0_is_None = message_args[0] is None
+                arg_1_is_None = message_args[1] is None
 
                 #handle prepare messages
                 if message_type == "propose":
-                    if arg_0_is_calendar:
-                        #If in this conditional, we are the leader.
-                        #First we have to fill any empty log slots
-                        #'''
-                        log_slots = self._log.keys()
-                        proposed_slot = message[2]
-                        for i in range(proposed_slot):
-                            if i not in self._log.keys():
-                                #dummy_message = ("propose", Calendar(), i, self._node_id)
-                                #self._proposer._command_queue.append(dummy_message)
-                                #time.sleep(.1)
-                                slot_calendar = self._acceptor._accVals[i]
-                                self._log[i] = slot_calendar
-                        #'''
-                        #Then we can add this new proposal
-                        self._proposer._command_queue.append(message)
+                    if arg_0_is_operation:
+                        #If in this conditional, we are the leader; gaps
+                        #in our log get filled by the learner's catch-up,
+                        #so we can add this new proposal right away
+                        self._proposer._command_queue.put(message)
                     else:
                         logging.error(
                             "Propose message must be of form "
-                            "'propose' Calendar")
+                            "'propose' Operation")
 
                 #handle prepare messages
-                elif message_type == "prepare":
+                elif message_type == "prepare" or message_type == "prepare_all":
                     if arg_0_is_int:
-                        self._acceptor._command_queue.append(message)
+                        #another Proposer with a higher ballot ends our
+                        #Multi-Paxos leadership
+                        if message[-1] != self._node_id:
+                            self._proposer._observe_ballot(message_args[0])
+                        self._acceptor._command_queue.put(message)
+                    else:
+                        logging.error(
+                            "Prepare message must be of form "
+                            "'" + message_type + "' int")
+                
+                #handle promise messages covering all slots from some slot on
+                elif message_type == "promise_all":
+                    if arg_0_is_int and type(message_args[1]) == tuple:
+                        self._proposer._command_queue.put(message)
                     else:
                         logging.error(
-                            "Prepare message must be of form 'prepare' int")
+                            "Promise_all message must be of form "
+                            "'promise_all' int tuple")
                 
+                #handle nack messages
+                elif message_type == "nack":
+                    if arg_0_is_int and type(message_args[1]) == int and \
+                            type(message_args[2]) == int and \
+                            type(message_args[3]) == int:
+                        self._proposer._command_queue.put(message)
+                    else:
+                        logging.error(
+                            "Nack message must be of form "
+                            "'nack' int int int int")
+
+                #handle catch-up requests; the learner serves them so it
+                #reads a consistent log and snapshot
+                elif message_type == "catchup":
+                    if arg_0_is_int and type(message_args[1]) == int:
+                        self._acceptor._commits_queue.put(message)
+                    else:
+                        logging.error(
+                            "Catchup message must be of form "
+                            "'catchup' int int")
+
+                #handle chunks of slots streamed back by a catch-up
+                elif message_type == "catchup_slots":
+                    if arg_0_is_int and type(message_args[1]) == tuple:
+                        for log_slot, serial_v in message_args[1]:
+                            try:
+                                v = Batch.deserialize(serial_v, trusted=True)
+                            except ValueError as excinfo:
+                                logging.error(excinfo.message)
+                                continue
+                            self._acceptor._commits_queue.put((log_slot, v))
+                    else:
+                        logging.error(
+                            "Catchup_slots message must be of form "
+                            "'catchup_slots' int tuple")
+
+                #handle chunks of a snapshot streamed back by a catch-up
+                elif message_type == "catchup_snapshot":
+                    if arg_0_is_int and type(message_args[1]) == tuple and \
+                            len(message_args[1]) == 3:
+                        self._recv_catchup_snapshot(*message_args[:2])
+                    else:
+                        logging.error(
+                            "Catchup_snapshot message must be of form "
+                            "'catchup_snapshot' int tuple")
+
                 #handle promise messages
                 elif message_type == "promise":
-                    if (arg_0_is_int and arg_1_is_calendar) or (arg_0_is_None and arg_1_is_None):
-                        self._proposer._command_queue.append(message)
+                    if (arg_0_is_int and arg_1_is_batch) or (arg_0_is_None and arg_1_is_None):
+                        self._proposer._command_queue.put(message)
                     else:
                         logging.error(
                             "Promise message must be of form "
-                            "'promise' int Calendar")
+                            "'promise' int Batch")
 
                 #handle accept messages
                 elif message_type == "accept":
-                    if arg_0_is_int and arg_1_is_calendar:
-                        self._acceptor._command_queue.append(message)
+                    if arg_0_is_int and arg_1_is_batch:
+                        self._acceptor._command_queue.put(message)
                     else:
                         print ' '.join([str(i) for i in message])
                         logging.error(
                             "Accept message must be of form "
-                            "'accept' int Calendar")
+                            "'accept' int Batch")
 
                 #handle ack messages
                 elif message_type == "ack":
-                    if arg_0_is_int and arg_1_is_calendar:
-                        self._proposer._command_queue.append(message)
+                    if arg_0_is_int and arg_1_is_batch:
+                        self._proposer._command_queue.put(message)
                     else:
                         logging.error(
                             "Ack message must be of form "
-                            "'ack' int Calendar")
+                            "'ack' int Batch")
 
                 #handle commit messages
                 elif message_type == "commit":
-                    if arg_0_is_calendar:
-                        self._acceptor._command_queue.append(message)
+                    if arg_0_is_batch:
+                        self._acceptor._command_queue.put(message)
                     else:
                         logging.error(
-                            "Commit message must be of form 'commit' Calendar")
+                            "Commit message must be of form 'commit' Batch")
 
             else:
                 logging.error("Invalid message parameters")
                 return
 
+        def _handle_commit(self, commit):
+            """
+            Handle an entry of the Acceptor commits queue; besides commits it
+            carries catch-up requests and snapshots received from peers.
+            """
+            if commit[0] == "catchup":
+                self._serve_catchup(*commit[1:])
+                return
+
+            (log_slot, v) = commit
+            if hasattr(v, "_is_Calendar"):
+                self._install_snapshot(log_slot, v)
+            else:
+                self._learn(log_slot, v)
+
         def _learner(self):
-            """Poll the Acceptor commits queue to update Node's log."""
+            """Block on the Acceptor commits queue to update Node's log."""
             while True:
-                if self._acceptor._commits_queue:
-                    (log_slot, v) = self._acceptor._commits_queue.pop()
-                    self._log[log_slot] = v
-                    self._calendar = self._log[max(self._log.keys())]
-
-                if self._terminate:
+                try:
+                    commit = self._acceptor._commits_queue.get(
+                        timeout=Node._catchup_timeout)
+                except Queue.Empty:
+                    #a stalled catch-up is retried even if nothing commits
+                    with self._lock:
+                        self._check_gaps()
+                    continue
+
+                if commit is None:
                     break
+                with self._applied_cond:
+                    _handle_commit(self, commit)
+                    self._applied_cond.notify_all()
 
-                time.sleep(.001)
-
-        def _shut_down(self):
-            """."""
+        def _learner_coroutine(self):
+            """Serve the Acceptor commits queue as a coroutine."""
+            commits_queue = self._acceptor._commits_queue
             while True:
-                if self._terminate:
-                    self._proposer._terminate = True
-                    self._acceptor._terminate = True
-                    break
+                arrived = yield EventLoop.queued(
+                    commits_queue, Node._catchup_timeout)
+                if not arrived:
+                    with self._lock:
+                        self._check_gaps()
+                while not commits_queue.empty():
+                    commit = commits_queue.get_nowait()
+                    if commit is None:
+                        return
+                    with self._applied_cond:
+                        _handle_commit(self, commit)
+                        self._applied_cond.notify_all()
+
+        def _handle_data(self, data, sender_ID):
+            """
+            Decode and dispatch data received from the Node with sender_ID;
+            return False once the termination message arrived.
+            """
+            if data == "terminate":
+                self._transport.close()
+                self._proposer.terminate()
+                self._acceptor.terminate()
+                return False
+
+            message = pickle.loads(data)
+            #bind sender_ID to message
+            message = message + (sender_ID,)
+
+            #construct deserailized version of message; peers in the IP
+            #table only send valid Operations so skip re-validation
+            new_message = []
+            for field in message:
+                codec = None
+                if Operation.is_serialized(field):
+                    codec = Operation
+                elif Batch.is_serialized(field):
+                    codec = Batch
+
+                if codec is not None:
+                    try:
+                        new_message.append(
+                            codec.deserialize(field, trusted=True))
+                    except ValueError as excinfo:
+                        logging.error(excinfo.message)
+                        return True
+                else:
+                    new_message.append(field)
+
+            _parse_message(tuple(new_message))
+            return True
+
+        def _bind(self):
+            """
+            Bind the transport first so e.g. every datagram this Node sends
+            leaves from its well-known UDP port; a TCPTransport listens on
+            the same port number.
+            """
+            UDP_PORT = self._ip_table[self._node_id][2]
+            self._transport.bind(UDP_PORT)
 
         def _do_paxos(self):
             """Do Paxos algorithm for this Node."""
+            _bind(self)
+
             #Begin running the Acceptor and Proposer in the background
             thread.start_new_thread(self._proposer.start, ())
             thread.start_new_thread(self._acceptor.start, ())
             thread.start_new_thread(_learner, (self,))
-            thread.start_new_thread(_shut_down, (self,))
 
-            IP, UDP_PORT = '0.0.0.0', self._ip_table[self._node_id][2]
-            
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) 
-            sock.bind((IP, UDP_PORT))
             while True:
-                data, addr = sock.recvfrom(4096) # buffer size is 1024 bytes
-                
-                if data == "terminate":
-                    sock.close()
+                data, sender_ID = self._transport.recv()
+                if not _handle_data(self, data, sender_ID):
                     break
 
-                #Quick lookup of ID of sender from IP received
-                sender_ID = filter(
-                    lambda row: row[1][0] == addr[0],
-                    self._ip_table.items())[0][0]
-                
-                message = pickle.loads(data)
-                #bind sender_ID to message
-                message = message + (sender_ID,)
-
-                #construct deserailized version of message
-                new_message = []
-                for field in message:
-                    if type(field) == str:
-                        try:
-                            deserialized_calendar = Calendar.deserialize(field)
-                            new_message.append(deserialized_calendar)
-                        except:
-                            new_message.append(field)
-                    else:
-                        new_message.append(field)
-
-                new_message = tuple(new_message)
-                _parse_message(new_message)
-
-
-        thread.start_new_thread(_do_paxos, (self,))
-
-    def elect_leader(self, poll_time=6, timeout=3):
-        """Engage this Node in leader selection."""
-        def _do_leader_election(self, poll_time, timeout):
-            """Do leader election as new thread."""
-            IP, TCP_PORT = "0.0.0.0", self._ip_table[self._node_id][1]
-
-            recv_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            recv_socket.bind((IP, TCP_PORT))
-            #backlog; 1 for each Node besides self
-            recv_socket.listen(4)
-            prev_leader = None
-
+        def _receiver_coroutine(self):
+            """Receive and dispatch every message waiting on the transport."""
             while True:
-                thread.start_new_thread(bully_algorithm, (self, recv_socket, timeout))
-                time.sleep(poll_time)
-                if self._leader != prev_leader:
-                    logging.debug("NEW LEADER IS: " + str(self._leader))
-                    prev_leader = self._leader
-
-                if self._terminate:
-                    break
-
-            recv_socket.close()
+                yield EventLoop.readable(self._transport)
+                while True:
+                    received = self._transport.recv(0)
+                    if received is None:
+                        break
+                    if not _handle_data(self, *received):
+                        return
+
+        if event_loop is None:
+            thread.start_new_thread(_do_paxos, (self,))
+        else:
+            _bind(self)
+            event_loop.spawn(self._proposer.run())
+            event_loop.spawn(self._acceptor.run())
+            event_loop.spawn(_learner_coroutine(self))
+            event_loop.spawn(_receiver_coroutine(self))
+
+    def elect_leader(self, heartbeat_time=1.0, lease_time=3.0, timeout=3,
+                        event_loop=None):
+        """
+        Engage this Node in leader selection; in a new thread, or a task of
+        EventLoop event_loop if given. The leader sends heartbeats every
+        heartbeat_time seconds and the others elect a new one if none came
+        for lease_time seconds.
+        """
+        if lease_time <= heartbeat_time:
+            raise ValueError("lease_time must exceed heartbeat_time")
+        self._lease_time = lease_time
 
-        thread.start_new_thread(_do_leader_election, (self, poll_time, timeout))
+        def _do_leader_election(self, heartbeat_time, timeout):
+            """Do leader election as new thread."""
+            TCP_PORT = self._ip_table[self._node_id][1]
+            self._bully_transport.bind(TCP_PORT)
+            leader_lease(self, self._bully_transport, heartbeat_time, timeout)
+            self._bully_transport.close()
+
+        def _leader_election_coroutine(self, heartbeat_time, timeout):
+            """Do leader election as a coroutine."""
+            yield leader_lease_coroutine(
+                self, self._bully_transport, heartbeat_time, timeout)
+            self._bully_transport.close()
+
+        if event_loop is None:
+            thread.start_new_thread(
+                _do_leader_election, (self, heartbeat_time, timeout))
+        else:
+            TCP_PORT = self._ip_table[self._node_id][1]
+            self._bully_transport.bind(TCP_PORT)
+            event_loop.spawn(
+                _leader_election_coroutine(self, heartbeat_time, timeout))
 
     def terminate(self):
         """Initiate termination protocol; close all threads."""
@@ -311,18 +849,55 @@ class Node(object):
         self._terminate = True
        
         #Send special termination message to self
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        my_ip_info = self._ip_table[self._node_id]
-        my_IP, my_UDP_PORT = my_ip_info[0], my_ip_info[2]
-        s.sendto("terminate", (my_IP, my_UDP_PORT))
-        s.close()
+        self._transport.send_raw("terminate", self._node_id)
 
         #Sleep for a second to ensure everything closes before main
         time.sleep(1)
             
+    def _checkpoint(self, state_path):
+        """
+        Atomically replace the file at state_path with this Node's snapshot,
+        log tail and Acceptor, then empty the WAL the saved state covers.
+
+        The caller holds this Node's lock so the learner is idle; the
+        Acceptor's lock is taken so its state and WAL hold still.
+        """
+        def _write_state():
+            """Pickle this Node's state to a temporary file, then rename it."""
+            log = dict(self._log)
+
+            #commits the Acceptor logged that the learner hasn't learned yet
+            commits_queue = self._acceptor._commits_queue
+            with commits_queue.mutex:
+                pending = list(commits_queue.queue)
+            for commit in pending:
+                if commit is not None and hasattr(commit[1], "_is_Batch") \
+                        and commit[0] >= self._snapshot_slot:
+                    log.setdefault(commit[0], commit[1])
+
+            snapshot = (
+                self._snapshot_slot, Calendar.serialize(self._snapshot))
+            state = (self._node_id, snapshot, log, self._acceptor)
+            temp_path = state_path + ".tmp"
+            with open(temp_path, 'wb') as f:
+                pickle.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(temp_path, state_path)
+
+        #once the state is durable the WAL records it covers can go
+        with self._acceptor._lock:
+            if self._wal is None:
+                _write_state()
+            else:
+                self._wal.checkpoint(_write_state)
+                Node._log_header(self._wal, self._node_id)
+
     @staticmethod
     def save(Node, path="./", filename="state.pkl"):
-        """Save this Node's log and Acceptor to stable storage."""
+        """
+        Save this Node's snapshot, log tail and Acceptor to stable storage.
+        """
         if not hasattr(Node, "_is_Node"):
             raise TypeError("Node parameter must be a Node object")
 
@@ -335,40 +910,59 @@ class Node(object):
         if not os.path.exists(path):
             raise ValueError("path provided does not exist")
 
-        import pickle
-        with open(path + filename, 'w') as f:
-            state = (Node._node_id, Node._log, Node._acceptor)
-            pickle.dump(state, f)
+        with Node._lock:
+            Node._checkpoint(path + filename)
 
     @staticmethod
-    def load(path="./", filename="state.pkl"):
-        """
-        Load log and Acceptor from stable storage if path and filename exist.
+    def load(path="./", filename="state.pkl", node_id=None, **kwargs):
         """
+        Load snapshot, log tail and Acceptor from stable storage if path and
+        filename exist, then replay the WriteAheadLog at wal_path on top of them if given.
 
-        def _rebuild_calendar(node, log):
-            """Rebuild the calendar of node by reconstructing it from log."""
-            #Get the latest entry in the log for most up-to-date Calendar
-            node._calendar = log[max(log.keys())]
-
+        Raise ValueError if the state and WAL belong to different Nodes, or
+        to another Node than node_id if given. Any other keyword arguments
+        are passed on to the Node constructor.
+        """
         if type(filename) != str or type(path) != str:
             raise TypeError("path and filename must be strings")
 
         if filename[-4:] != ".pkl":
             raise ValueError("filename must have .pkl extension")
 
-        if not os.path.exists(path+filename):
+        records = []
+        if kwargs.get("wal_path") is not None:
+            records = WriteAheadLog.read(kwargs["wal_path"])
+
+        if os.path.exists(path + filename):
+            with open(path + filename, 'r') as f:
+                saved_id, snapshot, log, acceptor = pickle.load(f)
+        elif records:
+            #crashed before ever saving; the WAL header names the Node
+            snapshot = (0, Calendar.serialize(Calendar()))
+            saved_id, log, acceptor = records[0][1], {}, None
+        else:
             raise ValueError("path provided does not exist")
 
-        with open(path + filename, 'r') as f:
-            state = pickle.load(f)
-            node_id, log, acceptor = state
-            node = Node(node_id)
-            node._log = log
+        if records and records[0] != ("node", saved_id):
+            raise ValueError(
+                "WAL at " + kwargs["wal_path"] + " belongs to another Node")
+        if node_id is not None and node_id != saved_id:
+            raise ValueError(
+                "saved state belongs to Node " + str(saved_id))
+
+        node = Node(saved_id, **kwargs)
+        node._snapshot_slot = snapshot[0]
+        node._snapshot = Calendar.deserialize(snapshot[1], trusted=True)
+        node._log = log
+        if node._wal is not None:
+            node._state_path = path + filename
+        if acceptor is not None:
             node._acceptor = acceptor
-            _rebuild_calendar(node, log)
+            acceptor._transport = node._transport
+            acceptor._wal = node._wal
+        Node._replay_wal(node, records)
 
-            return node
+        return node
 
     @staticmethod
     def _make_ip_table():
@@ -400,14 +994,24 @@ class Node(object):
                     "Invalid show argument; show needs argument "
                     "{calendar,log,acceptor,proposer,all}")
 
-            #Handle showing the calendar
+            #Handle showing the calendar; "-l" reads it linearizably, which
+            #only the leader can do
             if argv[1] == "calendar":
-                print node._calendar
+                if len(argv) > 3 or argv[2:] not in ([], ["-l"]):
+                    raise ValueError(
+                        "Invalid show arguments; show calendar supports only "
+                        "a single optional flag argument \"-l\"")
+                calendar, applied_slot = node.read(linearizable=len(argv) == 3)
+                print calendar
+                print "Applied through slot " + str(applied_slot - 1)
             
             #Handle showing the log
             elif argv[1] == "log":
 
                 print "Log:"
+                if node._snapshot_slot:
+                    print "Slots 0-" + str(node._snapshot_slot - 1) + \
+                        " in snapshot"
                 #copy the log into a list ordered by slot number
                 ordered_slots = sorted(node._log.items(), key=lambda x: x[0])
                 
@@ -415,14 +1019,15 @@ class Node(object):
                 if len(argv) == 2:
                     for slot in ordered_slots:
                         print "Slot " + str(slot[0]) + ' ' + str(slot[1])
-                #Short flag is thrown, just print names of Appointments in each
-                #Calendar slot
+                #Short flag is thrown, just print kind and name of the
+                #Appointment of each Operation in each Batch slot
                 elif len(argv) == 3:
                     if argv[2] == "-s":
                         for slot in ordered_slots:
-                            log_string = "Slot " + str(slot[0]) + " Calendar: \t"
-                            log_string += ', '.join(
-                                slot[1].get_appointment_names())
+                            log_string = "Slot " + str(slot[0]) + " Batch: \t"
+                            log_string += ', '.join([
+                                op._kind + ' ' + op._appointment._name
+                                for op in slot[1]])
                             print log_string
                         print
                     else:
@@ -606,36 +1211,39 @@ def main():
     
     set_verbosity(4)
 
-    N = Node(int(sys.argv[1]))
-
-    
-    '''
-    N._log[0] = c1
-    N._log[1] = c2
-    N._log[2] = c3
-    N._log[3] = c4
-    N._log[4] = c5
-    '''
-    N._calendar = c
+    #"-m" after the node id runs the Proposer in Multi-Paxos mode and "-t"
+    #sends Paxos messages over persistent TCP connections instead of UDP
+    #Nodes sharing a directory keep separate state files
+    node_id = int(sys.argv[1])
+    state_filename = "state" + str(node_id) + ".pkl"
+    node_kwargs = {"multi_paxos": "-m" in sys.argv[2:],
+                    "wal_path": "./state" + str(node_id) + ".wal"}
+    if "-t" in sys.argv[2:]:
+        node_kwargs["transport_class"] = TCPTransport
 
     #try to load a previous state of this Node
-    #'''
-    try:
-        N = Node.load()
-    except ValueError:
-        pass
-    except IOError:
-        pass
-    #'''
-
-    N.elect_leader(poll_time=6, timeout=3)
-    N.paxos()
+    if os.path.exists(state_filename) or \
+            os.path.exists(node_kwargs["wal_path"]):
+        N = Node.load(
+            filename=state_filename, node_id=node_id, **node_kwargs)
+    else:
+        N = Node(node_id, **node_kwargs)
+
+    #"-e" runs the whole Node on a single EventLoop thread
+    if "-e" in sys.argv[2:]:
+        event_loop = EventLoop()
+        N.elect_leader(event_loop=event_loop)
+        N.paxos(event_loop=event_loop)
+        thread.start_new_thread(event_loop.run, ())
+    else:
+        N.elect_leader()
+        N.paxos()
 
     print("@> Node Started")
     while True:
         message = raw_input('')
         if message == "quit":
-            Node.save(N)
+            Node.save(N, filename=state_filename)
             N.terminate()
             break
         else:
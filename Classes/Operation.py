@@ -0,0 +1,123 @@
+"""Operation class; the value agreed upon for each Paxos log slot."""
+
+import struct
+from Appointment import Appointment
+from Calendar import _pack_varint, _unpack_varint, _pack_appointment
+from Calendar import _unpack_appointment
+
+_SERIAL_MAGIC = "\x00PO"
+_SERIAL_VERSION = 1
+
+
+class Operation(object):
+    """
+    Operation class.
+
+    kind:           "add" or "remove"; what to do with appointment.
+    appointment:    Appointment object added to or removed from the Calendar
+                    materialized from all previous log slots.
+
+    Log slots hold Operations rather than whole Calendars so the size of each
+    Paxos message and log entry is independent of the size of the Calendar.
+    Whether an Operation can be applied is only decided when the learner
+    applies it in slot order, so every Node reaches the same decision.
+    """
+
+    _kinds = ["add", "remove"]
+
+    def __init__(self, kind, appointment):
+        """Construct Operation object."""
+        if kind not in Operation._kinds:
+            raise ValueError("kind must be one of " + str(Operation._kinds))
+        if not hasattr(appointment, "_is_Appointment"):
+            raise TypeError("appointment must be an Appointment object")
+
+        self._kind = kind
+        self._appointment = appointment
+        self._is_Operation = True
+
+    def apply(self, calendar):
+        """
+        Apply this Operation to Calendar object calendar in place.
+
+        Return True if calendar was changed; False if this Operation had to be
+        dropped, i.e., an add conflicting with or already in calendar or a
+        remove of an Appointment not in calendar.
+        """
+        if self._kind == "add":
+            if self._appointment in calendar:
+                return False
+            if calendar._is_appointment_conflicting(self._appointment):
+                return False
+            calendar += self._appointment
+            return True
+
+        if self._appointment not in calendar:
+            return False
+        calendar -= self._appointment
+        return True
+
+    @staticmethod
+    def serialize(operation):
+        """
+        Return a compact binary representation of operation for the wire.
+
+        Layout (version 1): magic, version byte, kind byte, length-prefixed
+        Appointment name then the Appointment packed as in Calendar.serialize.
+        """
+        if operation is None:
+            return None
+
+        appointment = operation._appointment
+        chunks = [_SERIAL_MAGIC, chr(_SERIAL_VERSION),
+                    chr(Operation._kinds.index(operation._kind))]
+        _pack_varint(len(appointment._name), chunks)
+        chunks.append(appointment._name)
+        _pack_appointment(appointment, 0, chunks)
+        return "".join(chunks)
+
+    @staticmethod
+    def is_serialized(serial_msg):
+        """Determine if serial_msg looks like the output of serialize."""
+        return type(serial_msg) == str and serial_msg[:3] == _SERIAL_MAGIC
+
+    @staticmethod
+    def deserialize(serial_msg, trusted=False):
+        """
+        Return an Operation object parsed from the output of serialize.
+
+        If trusted is True the Appointment is rebuilt without re-validation.
+
+        Raise ValueError if serial_msg is not a valid serialized Operation.
+        """
+        if not Operation.is_serialized(serial_msg):
+            raise ValueError("serial_msg is not a serialized Operation")
+
+        if ord(serial_msg[3]) != _SERIAL_VERSION:
+            raise ValueError(
+                "Unsupported Operation serialization version " +
+                str(ord(serial_msg[3])))
+
+        try:
+            kind = Operation._kinds[ord(serial_msg[4])]
+            length, offset = _unpack_varint(serial_msg, 5)
+            if offset + length > len(serial_msg):
+                raise ValueError("truncated Appointment name")
+            name = serial_msg[offset:offset + length]
+            appointment, offset = _unpack_appointment(
+                serial_msg, offset + length, [name], trusted)
+        except (IndexError, struct.error):
+            raise ValueError("serial_msg is a malformed serialized Operation")
+
+        if offset != len(serial_msg):
+            raise ValueError("serial_msg has trailing bytes")
+
+        return Operation(kind, appointment)
+
+    def __str__(self):
+        """Implement str(Operation)."""
+        return self._kind + ' ' + str(self._appointment)
+
+    def __repr__(self):
+        """Implement repr(Operation)."""
+        return self.__str__()
@@ -1,6 +1,10 @@
 """Proposer class for Paxos Calendar."""
 import time
-from Calendar import Calendar
+import Queue
+import random
+from Batch import Batch
+from EventLoop import EventLoop
+from Transport import UDPTransport
 
 class Proposer(object):
     """
@@ -9,179 +13,594 @@ class Proposer(object):
     uid:                        Unique id (id of Node containing this Proposer
                                 is a good choice); used as number to increment.
     current_proposal_number:    Proposal number that was most recently used 
+    highest_ballot:             Highest ballot of another Proposer seen in a
+                                nack or prepare; the next ballot used jumps
+                                straight past it.
+    attempts:                   Number of nacked attempts per log slot still
+                                in flight.
+    retries:                    Time each nacked log slot is due to be
+                                prepared again; the delay is drawn uniformly
+                                up to backoff_base * 2 ** attempts (capped at
+                                backoff_max) so dueling Proposers drift
+                                apart.
+    deadlines:                  Time each log slot in flight is retried by if
+                                its prepare or accept didn't gather a
+                                majority within phase_timeout seconds, e.g.
+                                because a message was lost;
+                                next_deadline is at most the earliest so the
+                                deadlines are only scanned once one passed.
+    promise_queues:             Promises per log slot still waiting on a
+                                majority for the ballot in my_proposals; a
+                                slot is retired once its accept is sent.
+    ack_queues:                 Acks per log slot still waiting on a majority;
+                                a slot is retired once its commit is sent.
+    multi_paxos:                If True, run a single prepare covering every
+                                log slot >= n and then send only accept
+                                messages for later slots until a higher ballot
+                                is observed (Multi-Paxos); otherwise run a
+                                prepare for every log slot.
+    leader_ballot:              Ballot of the prepare covering all slots >=
+                                leader_slot in multi_paxos mode; None if this
+                                Proposer hasn't sent one or has stepped down.
+    leading:                    True once a majority promised leader_ballot.
+    batch_size:                 Maximum number of proposed Operations grouped
+                                into the Batch proposed for one log slot.
+    batch_window:               Seconds a proposed Operation may wait for
+                                others to fill its Batch before the Batch is
+                                proposed anyway.
+    pipeline_depth:             Maximum number of this Proposer's log slots
+                                in flight (proposed but not yet committed);
+                                None for no limit.
+    pending:                    Proposed Operations not yet in a Batch.
+    next_slot:                  Next log slot this Proposer will assign.
+    committed_slot:             Highest log slot this Proposer sent commit for;
+                                -1 if none.
+    transport:                  Transport shared with the Node; a private
+                                UDPTransport is made from ip_table if None.
     """
 
-    def __init__(self, uid, ip_table):
+    _backoff_base = 0.01
+    _backoff_max = 1.0
+    _phase_timeout = 1.0
+
+    def __init__(self, uid, ip_table, multi_paxos=False, batch_size=1,
+                    batch_window=0.0, pipeline_depth=None, transport=None):
         """Construct Proposer object."""
         if type(uid) != int:
             raise TypeError("uid must be an integer")
+        if type(multi_paxos) != bool:
+            raise TypeError("multi_paxos must be a bool")
+        if type(batch_size) != int:
+            raise TypeError("batch_size must be an int")
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        if type(batch_window) not in (int, float):
+            raise TypeError("batch_window must be a number")
+        if batch_window < 0:
+            raise ValueError("batch_window must be nonnegative")
+        if pipeline_depth is not None:
+            if type(pipeline_depth) != int:
+                raise TypeError("pipeline_depth must be an int or None")
+            if pipeline_depth < 1:
+                raise ValueError("pipeline_depth must be positive")
 
         self._uid = uid
         self._current_proposal_number = uid
-        self._command_queue = []
-        self._committed_slots = []
+        self._highest_ballot = -1
+        self._attempts = {}
+        self._retries = {}
+        self._deadlines = {}
+        self._next_deadline = float("inf")
+        self._command_queue = Queue.Queue()
         self._my_proposals = {}
-        from collections import defaultdict
-        self._promise_queues = defaultdict(dict)
-        self._ack_queues = defaultdict(dict)
+        self._promise_queues = {}
+        self._ack_queues = {}
         self._ip_table = ip_table
+        if transport is None:
+            transport = UDPTransport(ip_table)
+        self._transport = transport
+        self._multi_paxos = multi_paxos
+        self._leader_ballot = None
+        self._leader_slot = None
+        self._leader_promises = {}
+        self._leading = False
+        self._batch_size = batch_size
+        self._batch_window = batch_window
+        self._pipeline_depth = pipeline_depth
+        self._pending = []
+        self._pending_since = None
+        self._next_slot = 0
+        self._committed_slot = -1
         self._terminate = False
         self._is_Proposer = True
 
-    def _send_UDP_message(self, data, IP, UDP_PORT):
-        """Send data through UDP socket bound to (IP, UDP_PORT)."""
-        import pickle
-        import socket
-        transmission = pickle.dumps(data)
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.sendto(transmission, (IP, UDP_PORT))
-        s.close()
+    def _majority(self):
+        """Return the number of Acceptors that make up a majority."""
+        return len(self._ip_table) // 2 + 1
 
-    def _send_prepare(self, message):
-        """Send prepare message as described in Synod Algorithm."""
-        self._current_proposal_number += 10
-        m = self._current_proposal_number
+    def _next_ballot(self):
+        """
+        Return a fresh ballot above every ballot used or seen so far; ballots
+        of this Proposer stay uid modulo 10.
+        """
+        m = self._current_proposal_number + 10
+        if self._highest_ballot >= m:
+            m += (self._highest_ballot - m) // 10 * 10 + 10
+        self._current_proposal_number = m
+        return m
+
+    def _requeue(self, batch):
+        """Put the Operations of batch, which lost its slot, back in front."""
+        if not self._pending:
+            self._pending_since = time.time()
+        self._pending = list(batch) + self._pending
+
+    def _recv_propose(self, message):
+        """
+        Queue the Operation of a propose message for the next Batch.
 
-        calendar, log_slot = message[1], message[2]
+        Propose message form: ("propose", operation, log_slot, sender_ID)
+        where log_slot is the first slot missing from the sender's log; this
+        Proposer assigns slots itself so concurrent proposals never collide.
+        """
+        operation, log_slot = message[1], message[2]
+        if not self._pending:
+            self._pending_since = time.time()
+        self._pending.append(operation)
+        self._next_slot = max(self._next_slot, log_slot)
+        self._flush()
+
+    def _flush(self):
+        """
+        Propose Batches of pending Operations for fresh log slots while a
+        Batch is full or its window has passed and the pipeline has room.
+        """
+        while self._pending:
+            full = len(self._pending) >= self._batch_size
+            waited = time.time() - self._pending_since
+            if not full and waited < self._batch_window:
+                return
+            if self._pipeline_depth is not None:
+                if len(self._my_proposals) >= self._pipeline_depth:
+                    return
+
+            batch = Batch(self._pending[:self._batch_size])
+            self._pending = self._pending[self._batch_size:]
+            log_slot = self._next_slot
+            self._next_slot += 1
+            self._send_prepare(batch, log_slot)
+
+    def _flush_timeout(self):
+        """
+        Return seconds until pending Operations must be flushed or a nacked
+        slot retried; None if only a new message (e.g. an ack freeing the
+        pipeline) can trigger either.
+        """
+        timeouts = []
+        if self._retries:
+            timeouts.append(min(self._retries.values()) - time.time())
+        if self._deadlines:
+            timeouts.append(self._next_deadline - time.time())
+
+        pipeline_full = self._pipeline_depth is not None and \
+            len(self._my_proposals) >= self._pipeline_depth
+        if self._pending and not pipeline_full:
+            waited = time.time() - self._pending_since
+            timeouts.append(self._batch_window - waited)
+
+        if not timeouts:
+            return None
+        return max(0.0, min(timeouts))
+
+    def _send_prepare(self, batch, log_slot, single=False):
+        """
+        Send prepare message as described in Synod Algorithm; a prepare for
+        log_slot alone even in multi_paxos mode if single is True.
+        """
+        self._set_deadline(log_slot)
+        if self._multi_paxos and not single:
+            self._send_prepare_all(batch, log_slot)
+            return
+
+        m = self._next_ballot()
 
         #If this Proposer's Node is the leader ,we need to store a copy of
         #proposal it put forth for itself or on behalf of someone else
-        self._my_proposals[log_slot] = (m, calendar)
+        self._my_proposals[log_slot] = (m, batch)
+        self._promise_queues[log_slot] = {}
 
         transmission = ("prepare", m, log_slot)
-        for ID, IP_info in self._ip_table.items():
-            IP, UDP_PORT = IP_info[0], IP_info[2]
-            self._send_UDP_message(transmission, IP, UDP_PORT)
+        self._transport.broadcast(transmission)
+
+    def _send_prepare_all(self, batch, log_slot):
+        """
+        Propose batch for a log slot in multi_paxos mode.
+
+        If a prepare covering the slot was already sent only send accept (or
+        hold the proposal until the covering prepare gathers a majority);
+        otherwise send a prepare covering the slot and every slot after it.
+        """
+        leader_cond = self._leader_ballot is not None
+        if leader_cond and log_slot >= self._leader_slot:
+            m = self._leader_ballot
+            self._my_proposals[log_slot] = (m, batch)
+            if self._leading:
+                self._send_accept(m, batch, log_slot)
+            return
+
+        #hold the proposal until a nacked prepare is retried
+        if self._retries:
+            self._my_proposals[log_slot] = (None, batch)
+            return
+
+        m = self._next_ballot()
+        self._my_proposals[log_slot] = (m, batch)
+
+        #the new ballot also covers every other slot still in flight
+        log_slot = min(self._my_proposals.keys())
+        for slot, (ballot, slot_batch) in self._my_proposals.items():
+            self._my_proposals[slot] = (m, slot_batch)
+
+        self._leader_ballot, self._leader_slot = m, log_slot
+        self._leader_promises = {}
+        self._leading = False
+
+        transmission = ("prepare_all", m, log_slot)
+        self._transport.broadcast(transmission)
+
+    def _recv_promise_all(self, message):
+        """
+        Receive promise for a prepare covering all slots >= log_slot.
+
+        Promise message form:
+            ("promise_all", m, accepted, log_slot, sender_ID)
+        where accepted is a tuple of (slot, accNum, serialized accVal) for
+        every slot >= log_slot the sender has accepted a value for.
+        """
+        m, accepted, log_slot, sender_ID = message[1:]
+        if m != self._leader_ballot or self._leading:
+            return
+
+        self._leader_promises[sender_ID] = accepted
+        if len(self._leader_promises) < self._majority():
+            return
+
+        self._leading = True
+
+        #any slot a majority member accepted a value for must be re-proposed
+        #with the highest-numbered such value
+        highest = {}
+        for slot_values in self._leader_promises.values():
+            for slot, accNum, accVal in slot_values:
+                if slot not in highest or accNum > highest[slot][0]:
+                    highest[slot] = (accNum, accVal)
+
+        for slot, (accNum, accVal) in highest.items():
+            if slot < self._leader_slot:
+                continue
+            if slot in self._my_proposals:
+                own_batch = self._my_proposals[slot][1]
+                if Batch.serialize(own_batch) != accVal:
+                    self._requeue(own_batch)
+            self._my_proposals[slot] = (
+                m, Batch.deserialize(accVal, trusted=True))
+            self._next_slot = max(self._next_slot, slot + 1)
+
+        for slot, (ballot, batch) in self._my_proposals.items():
+            if ballot == m and slot >= self._leader_slot:
+                self._send_accept(m, batch, slot)
+
+    def _recv_fill(self, message):
+        """
+        Propose a no-op Batch for every given log slot not in flight here;
+        the Node's learner asks its leader's Proposer to when a gap in the
+        log can't be caught up from peers.
+
+        Fill message form: ("fill", log_slots)
+
+        Each slot gets its own prepare with a fresh ballot, so a value some
+        Acceptor accepted for it is found and chosen instead of the no-op; a
+        Multi-Paxos leader's accept could overwrite a value chosen under its
+        own ballot whose commit was lost.
+        """
+        for log_slot in message[1]:
+            if log_slot not in self._my_proposals:
+                self._send_prepare(Batch.noop(), log_slot, single=True)
+
+    def _observe_ballot(self, m):
+        """
+        Report ballot m seen in another Proposer's prepare; called from the
+        Node's thread so it is handled in the Proposer's own.
+        """
+        self._command_queue.put(("observe", m))
+
+    def _step_down(self, m):
+        """
+        Step down from multi_paxos leadership if ballot m is higher than
+        ours; the slots in flight are prepared again after a backoff.
+        """
+        self._highest_ballot = max(self._highest_ballot, m)
+        if self._leader_ballot is not None and m > self._leader_ballot:
+            self._leader_ballot, self._leader_slot = None, None
+            self._leader_promises = {}
+            self._leading = False
+            self._promise_queues, self._ack_queues = {}, {}
+            if self._my_proposals:
+                self._schedule_retry(min(self._my_proposals.keys()))
 
     def _recv_promise(self, message):
         """
         Receive promise message.
 
-        Promise message form: ("promise", accNum, accVal, log_slot, sender_ID)
+        Promise message form:
+            ("promise", accNum, accVal, log_slot, m, sender_ID)
+        where m is the ballot of the prepare being answered.
+
+        Send accept exactly once, as soon as a majority promised m.
         """
-        accNum, accVal, log_slot, sender_ID = message[1:]
-        self._promise_queues[log_slot][sender_ID] = (accNum, accVal)
+        accNum, accVal, log_slot, m, sender_ID = message[1:]
+
+        #ignore promises for retired slots or superseded ballots
+        if log_slot not in self._promise_queues:
+            return
+        if self._my_proposals[log_slot][0] != m:
+            return
+
+        slot_queue = self._promise_queues[log_slot]
+        slot_queue[sender_ID] = (accNum, accVal)
+        if len(slot_queue) < self._majority():
+            return
+
+        del self._promise_queues[log_slot]
+
+        #choose value of the highest-numbered accepted proposal if any,
+        #otherwise this Proposer's own value
+        own_batch = self._my_proposals[log_slot][1]
+        v, max_accNum = own_batch, None
+        for accNum, accVal in slot_queue.values():
+            if accNum is not None and accVal is not None:
+                if max_accNum is None or accNum > max_accNum:
+                    v, max_accNum = accVal, accNum
+
+        #another Proposer's value holds the slot; ours needs a new one
+        if v is not own_batch:
+            if Batch.serialize(v) != Batch.serialize(own_batch):
+                self._requeue(own_batch)
+            self._my_proposals[log_slot] = (m, v)
+
+        self._send_accept(m, v, log_slot)
 
     def _send_accept(self, m, v, log_slot):
         """Send accept message as described in Synod Algorithm."""
-        transmission = ("accept", m, Calendar.serialize(v), log_slot)
-        for ID, IP_info in self._ip_table.items():
-            IP, UDP_PORT = IP_info[0], IP_info[2]
-            self._send_UDP_message(transmission, IP, UDP_PORT)
+        self._set_deadline(log_slot)
+        self._ack_queues[log_slot] = {}
+        transmission = ("accept", m, Batch.serialize(v), log_slot)
+        self._transport.broadcast(transmission)
 
     def _recv_ack(self, message):
-        """Receive ack message."""
+        """
+        Receive ack message.
+
+        Send commit exactly once, as soon as a majority acked the ballot of
+        the accept for this slot.
+        """
         accNum, accVal, log_slot, sender_ID = message[1:]
-        self._ack_queues[log_slot][sender_ID] = accVal
+
+        #ignore acks for retired slots or superseded ballots
+        if log_slot not in self._ack_queues:
+            return
+        if self._my_proposals[log_slot][0] != accNum:
+            return
+
+        slot_queue = self._ack_queues[log_slot]
+        slot_queue[sender_ID] = accVal
+        if len(slot_queue) < self._majority():
+            return
+
+        del self._ack_queues[log_slot]
+        del self._my_proposals[log_slot]
+        self._attempts.pop(log_slot, None)
+        self._deadlines.pop(log_slot, None)
+        self._committed_slot = max(self._committed_slot, log_slot)
+        self._send_commit(accVal, log_slot)
+
+        #the committed slot may have made room in the pipeline
+        self._flush()
+
+    def _recv_nack(self, message):
+        """
+        Receive nack message; abandon the ballot it rejects and retry the
+        slot after a randomized exponential backoff.
+
+        Nack message form:
+            ("nack", highest, log_slot, compacted_slot, m, sender_ID)
+        where highest is the ballot the sender promised instead of m, and
+        compacted_slot the slot the sender compacted its state up to.
+        """
+        highest, log_slot, compacted_slot, m = message[1:5]
+        self._highest_ballot = max(self._highest_ballot, highest)
+
+        #the slot was chosen long ago; propose its Batch again further on
+        if log_slot < compacted_slot:
+            if log_slot in self._my_proposals and \
+                    self._my_proposals[log_slot][0] == m:
+                self._move_past(compacted_slot)
+            return
+
+        #every in-flight slot rides on the rejected Multi-Paxos ballot
+        if self._multi_paxos:
+            if m == self._leader_ballot:
+                self._step_down(highest)
+            return
+
+        if log_slot not in self._my_proposals:
+            return
+        if self._my_proposals[log_slot][0] != m:
+            return
+        self._promise_queues.pop(log_slot, None)
+        self._ack_queues.pop(log_slot, None)
+        self._schedule_retry(log_slot)
+
+    def _move_past(self, compacted_slot):
+        """
+        Requeue the Batches of the slots in flight below compacted_slot,
+        which peers compacted after choosing some value, and propose them
+        again from compacted_slot on.
+
+        A Batch that was in fact chosen in its old slot is applied twice; its
+        second adds are then dropped as conflicts.
+        """
+        for log_slot in sorted(self._my_proposals.keys(), reverse=True):
+            if log_slot >= compacted_slot:
+                continue
+            self._requeue(self._my_proposals.pop(log_slot)[1])
+            for table in (self._promise_queues, self._ack_queues,
+                            self._retries, self._attempts, self._deadlines):
+                table.pop(log_slot, None)
+
+        self._next_slot = max(self._next_slot, compacted_slot)
+        if self._multi_paxos and self._leader_slot is not None and \
+                self._leader_slot < compacted_slot and not self._leading:
+            self._leader_ballot, self._leader_slot = None, None
+        self._flush()
+
+    def _schedule_retry(self, log_slot):
+        """Prepare log_slot again after a randomized exponential backoff."""
+        if log_slot in self._retries:
+            return
+        attempts = self._attempts.get(log_slot, 0) + 1
+        self._attempts[log_slot] = attempts
+        backoff = min(
+            Proposer._backoff_max, Proposer._backoff_base * 2 ** attempts)
+        self._retries[log_slot] = time.time() + random.uniform(0, backoff)
+
+    def _set_deadline(self, log_slot):
+        """Give log_slot phase_timeout seconds to gather a majority."""
+        deadline = time.time() + Proposer._phase_timeout
+        self._deadlines[log_slot] = deadline
+        self._next_deadline = min(self._next_deadline, deadline)
+
+    def _expire(self):
+        """Schedule a retry of every log slot whose deadline has passed."""
+        now = time.time()
+        if now < self._next_deadline:
+            return
+
+        self._next_deadline = float("inf")
+        for log_slot, deadline in self._deadlines.items():
+            if deadline > now:
+                self._next_deadline = min(self._next_deadline, deadline)
+                continue
+            del self._deadlines[log_slot]
+            if log_slot not in self._my_proposals:
+                continue
+
+            self._promise_queues.pop(log_slot, None)
+            self._ack_queues.pop(log_slot, None)
+            #an unanswered Multi-Paxos prepare must be sent again
+            if self._multi_paxos and not self._leading:
+                self._leader_ballot, self._leader_slot = None, None
+            self._schedule_retry(log_slot)
+
+    def _retry(self):
+        """
+        Prepare again every nacked or expired log slot whose backoff has
+        passed.
+        """
+        self._expire()
+        now = time.time()
+        for log_slot, due in self._retries.items():
+            if due > now:
+                continue
+            del self._retries[log_slot]
+            #a Multi-Paxos prepare covers whatever is still in flight; a
+            #leader only sends the slot's accept again
+            if self._multi_paxos and self._my_proposals and \
+                    not self._leading:
+                log_slot = min(self._my_proposals.keys())
+            if log_slot in self._my_proposals:
+                self._send_prepare(self._my_proposals[log_slot][1], log_slot)
 
     def _send_commit(self, v, log_slot):
         """Send commit message as described in Synod Algorithm."""
-        transmission = ("commit", Calendar.serialize(v), log_slot)
-        for ID, IP_info in self._ip_table.items():
-            IP, UDP_PORT = IP_info[0], IP_info[2]
-            self._send_UDP_message(transmission, IP, UDP_PORT)
+        transmission = ("commit", Batch.serialize(v), log_slot)
+        self._transport.broadcast(transmission)
+
+    def _handle(self, message):
+        """Serve a single message taken from the queue."""
+        if self._retries or self._deadlines:
+            self._retry()
+
+        message_command_type = message[0]
+        debug_str = "Proposer; "
+        if message_command_type == "propose":
+            #print debug_str + "type: propose " + str(message[2])
+            self._recv_propose(message)
+        if message_command_type == "promise":
+            #print debug_str + "type: promise with slot = " + str(message[3])
+            self._recv_promise(message)
+        if message_command_type == "promise_all":
+            self._recv_promise_all(message)
+        if message_command_type == "ack":
+            #print debug_str + "type: ack with slot = "  + str(message[3]) + " from " + str(message[4])
+            self._recv_ack(message)
+        if message_command_type == "nack":
+            self._recv_nack(message)
+        if message_command_type == "observe":
+            self._step_down(message[1])
+        if message_command_type == "fill":
+            self._recv_fill(message)
 
     def start(self):
         """Start the Proposer; serve messages in it's queue."""
-        def _listen_to_promises(self):
-            "Begin listening for majority of promises on each log slot"
-            import math
-            while True:
-                log_slots = self._promise_queues.keys()
-                num_nodes = len(self._ip_table.keys())
-                majority = int(math.ceil(float(num_nodes) / 2.0))
-                
-                #for log slots for which there has been at least one promise
-                for slot in log_slots:
-                    #get the queue for particular log slot and calulate number
-                    #of Acceptors that promised
-                    slot_queue = self._promise_queues[slot]
-                    num_promises = len(slot_queue.keys())
-
-                    #other_ids = [node_id for node_id in slot_queue.keys() if node_id != self._uid]
-
-                    #if this Proposer has received a majority of responses
-                    #send accept(m, v, log_slot)
-                    if num_promises >= majority:
-                        #try to choose largest accNum accVal pair
-                        m, v = -1, -1
-                        for node_id in slot_queue.keys():#other_ids:
-                            accNum, accVal = slot_queue[node_id]
-                            if accNum != None and accVal != None:
-                                if accNum > m:
-                                    m, v = self._my_proposals[slot][0], accVal
-
-                        #Either only this Proposer's Node is up or everyone
-                        #answered None, either way choose this Proposer's value
-                        if not hasattr(v, "_is_Calendar"):
-                            m, v = self._my_proposals[slot]
-
-                        #if slot not in self._committed_slots:
-                        self._send_accept(m, v, slot)
-
-                if self._terminate:
-                    break
-
-                time.sleep(.1)
-
-        def _listen_to_acks(self):
-            "Begin listening for majority of promises on each log slot"
-            import math
-            while True:
-                log_slots = self._promise_queues.keys()
-                num_nodes = len(self._ip_table.keys())
-                majority = int(math.ceil(float(num_nodes) / 2.0))
-                
-                #for log slots for which there has been at least one promise
-                for slot in log_slots:
-                    #get the queue for particular log slot and calulate number
-                    #of Acceptors that acked
-                    slot_queue = self._ack_queues[slot]
-                    num_acks = len(slot_queue.keys())
-
-                    #if this Proposer has received a majority of responses
-                    #send commit(v, log_slot)
-                    if num_acks >= majority:
-
-                        #Optimization
-                        if slot not in self._committed_slots:
-                            v = slot_queue[slot_queue.keys()[0]]
-                            self._send_commit(v, slot)
-                            self._committed_slots.append(slot)
-
-                if self._terminate:
-                    break
-
-                time.sleep(.1)
-
-        import thread
-        thread.start_new_thread(_listen_to_promises, (self,))
-        thread.start_new_thread(_listen_to_acks, (self,))
-
+        #block until a message arrives or pending Operations are due;
+        #None is queued by terminate()
         while True:
-            if self._command_queue:
-                message = self._command_queue.pop()
-                message_command_type = message[0]
-                debug_str = "Proposer; "
-                if message_command_type == "propose":
-                    #print debug_str + "type: propose " + str(message[2])
-                    self._send_prepare(message)
-                if message_command_type == "promise":
-                    #print debug_str + "type: promise with slot = " + str(message[3])
-                    self._recv_promise(message)
-                if message_command_type == "ack":
-                    #print debug_str + "type: ack with slot = "  + str(message[3]) + " from " + str(message[4])
-                    self._recv_ack(message)
-
-            if self._terminate:
+            try:
+                message = self._command_queue.get(
+                    timeout=self._flush_timeout())
+            except Queue.Empty:
+                self._retry()
+                self._flush()
+                continue
+
+            if message is None:
                 break
 
-            time.sleep(.001)
+            self._handle(message)
+
+    def run(self):
+        """Serve the queue like start(), as a coroutine for an EventLoop."""
+        while True:
+            arrived = yield EventLoop.queued(
+                self._command_queue, self._flush_timeout())
+            if not arrived:
+                self._retry()
+                self._flush()
+                continue
+
+            while not self._command_queue.empty():
+                message = self._command_queue.get_nowait()
+                if message is None:
+                    return
+                self._handle(message)
+
+    def terminate(self):
+        """Stop the Proposer started with start()."""
+        self._terminate = True
+        self._command_queue.put(None)
 
     def __str__(self):
         """Implement str(Proposer)."""
         ret_str = "Proposer:\n\tUnique ID: " + str(self._uid) + '\n\t'
         ret_str += "Current Proposal number: " + str(self._current_proposal_number)
+        ret_str += "\n\tSlots in flight: " + str(len(self._my_proposals))
+        ret_str += ", pending Operations: " + str(len(self._pending))
+        ret_str += ", awaiting retry: " + str(len(self._retries))
+        if self._multi_paxos:
+            ret_str += "\n\tLeader ballot: " + str(self._leader_ballot)
+            ret_str += " for slots >= " + str(self._leader_slot)
+            ret_str += " (leading)" if self._leading else ""
         return ret_str
 
     def __repr__(self):
@@ -0,0 +1,573 @@
+"""
+Transports shared by a Node and its Proposer and Acceptor, and by Bully.
+
+Every transport is constructed from the Node's ID-to-IP translation table
+(port_index picks the port of each entry its peers listen on) and provides:
+    bind(PORT):             start receiving on PORT.
+    recv(timeout):          block for the next message; return its data and
+                            the sender's ID, or None after timeout seconds.
+    send_raw(data, ID):     send string data to the Node with ID.
+    send(message, ID):      send pickled message to the Node with ID.
+    broadcast(message):     send pickled message to every Node, self included.
+    close():                stop sending and receiving.
+    fileno():               return a file descriptor that is readable while
+                            recv(0) may return a message, so a bound
+                            transport can be waited on with select (e.g. by
+                            an EventLoop).
+"""
+
+import os
+import time
+import Queue
+import pickle
+import select
+import socket
+import fcntl
+import struct
+import thread
+import logging
+import itertools
+
+_FRAGMENT_MAGIC = "\x00PF"
+_FRAGMENT_HEADER = struct.Struct(">IHH")
+_LENGTH = struct.Struct(">I")
+
+class UDPTransport(object):
+    """
+    UDPTransport class.
+
+    ip_table:   ID-to-IP translation table of the Node; UDP addresses of every
+                peer are resolved once at construction.
+    address_table: Reverse of the resolved addresses used to identify the
+                sender of a datagram.
+    socket:     Single long-lived UDP socket every datagram is sent through;
+                once bound via bind() it is also the Node's receive socket, so
+                all datagrams of a Node leave from its well-known address.
+    partial:    Fragments of messages being reassembled, by (address,
+                message id); at most max_partial messages are buffered and
+                each is dropped if still incomplete after
+                reassembly_timeout seconds.
+
+    Data longer than max_payload bytes is split into fragments, each
+    prefixed by a magic, a message id, its index and the fragment count, so
+    no datagram exceeds the receive buffer of the Node or the network MTU.
+    """
+
+    _max_payload = 1400
+    _max_fragments = 1024
+    _max_partial = 64
+    _reassembly_timeout = 2.0
+
+    def __init__(self, ip_table, node_id=None, port_index=2):
+        """Construct UDPTransport object."""
+        self._peers = {}
+        for ID, ip_info in ip_table.items():
+            IP, UDP_PORT = ip_info[0], ip_info[port_index]
+            self._peers[ID] = (socket.gethostbyname(IP), UDP_PORT)
+
+        self._address_table = UDPTransport._make_address_table(self._peers)
+        self._socket = None
+        self._message_ids = itertools.count(1)
+        self._partial = {}
+        self._is_Transport = True
+
+    def bind(self, UDP_PORT, IP="0.0.0.0"):
+        """
+        Bind the transport socket to (IP, UDP_PORT) and return it so it can be
+        used for receiving too.
+        """
+        bound_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        bound_socket.bind((IP, UDP_PORT))
+
+        old_socket, self._socket = self._socket, bound_socket
+        if old_socket is not None:
+            old_socket.close()
+
+        return bound_socket
+
+    @staticmethod
+    def _make_address_table(peers):
+        """
+        Create the reverse of peers used to identify the sender of a
+        datagram; maps (IP, UDP_PORT) to ID for every Node and also IP to ID
+        for IPs hosting a single Node.
+        """
+        table, ip_counts = {}, {}
+        for ID, (IP, UDP_PORT) in peers.items():
+            table[(IP, UDP_PORT)] = ID
+            ip_counts[IP] = ip_counts.get(IP, 0) + 1
+
+        for ID, (IP, UDP_PORT) in peers.items():
+            if ip_counts[IP] == 1:
+                table[IP] = ID
+
+        return table
+
+    @staticmethod
+    def _lookup_sender(address_table, addr):
+        """
+        Return the ID of the Node that sent a datagram from addr, an (IP, port)
+        pair, or None if it can't be identified.
+
+        Nodes send from their bound UDP port so (IP, port) identifies them
+        even when several share a host; datagrams sent before a Node bound
+        its port fall back to the IP if only one Node lives there.
+        """
+        sender_ID = address_table.get(addr)
+        if sender_ID is None:
+            sender_ID = address_table.get(addr[0])
+        return sender_ID
+
+    def recv(self, timeout=None):
+        """
+        Block until a whole message from a known Node arrives on the bound
+        socket and return (data, sender ID); return None once timeout
+        seconds pass.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while True:
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.time())
+                if not select.select([self._socket], [], [], remaining)[0]:
+                    return None
+
+            datagram, addr = self._socket.recvfrom(4096)
+
+            #large messages arrive as fragments; wait for the last one
+            data = self.reassemble(datagram, addr)
+            if data is None:
+                continue
+
+            sender_ID = UDPTransport._lookup_sender(self._address_table, addr)
+            if sender_ID is None:
+                logging.error(
+                    "Dropping message from unknown address " + str(addr))
+                continue
+
+            return data, sender_ID
+
+    def close(self):
+        """Close the transport socket."""
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def fileno(self):
+        """Return the file descriptor of the bound socket."""
+        return self._socket.fileno()
+
+    def _get_socket(self):
+        """Return the transport socket, creating an unbound one if needed."""
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        return self._socket
+
+    def _sendto(self, data, address):
+        """Send raw string data to address; UDP is best effort so log errors."""
+        try:
+            self._get_socket().sendto(data, address)
+        except socket.error as excinfo:
+            logging.error("UDP send to " + str(address) + " failed: " +
+                            str(excinfo))
+
+    def _fragment(self, data):
+        """Return the list of datagrams data has to be sent as."""
+        if len(data) <= UDPTransport._max_payload:
+            return [data]
+
+        size = UDPTransport._max_payload
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        if len(chunks) > UDPTransport._max_fragments:
+            logging.error("Dropping message of " + str(len(data)) +
+                            " bytes; too large to send")
+            return []
+
+        #Proposer, Acceptor and Node threads all send; count() is atomic
+        message_id = next(self._message_ids) % 2 ** 32
+        return [_FRAGMENT_MAGIC +
+                    _FRAGMENT_HEADER.pack(message_id, i, len(chunks)) +
+                    chunk for i, chunk in enumerate(chunks)]
+
+    def reassemble(self, datagram, address):
+        """
+        Return the data of a message once datagram, received from address,
+        completes it; None while fragments are missing. Datagrams that
+        aren't fragments are returned as is.
+        """
+        if datagram[:3] != _FRAGMENT_MAGIC:
+            return datagram
+
+        offset = 3 + _FRAGMENT_HEADER.size
+        if len(datagram) < offset:
+            return None
+        message_id, index, count = _FRAGMENT_HEADER.unpack_from(datagram, 3)
+        if index >= count or count > UDPTransport._max_fragments:
+            return None
+
+        #drop messages that timed out, then the oldest if still full
+        now = time.time()
+        for key, (started, _, _) in self._partial.items():
+            if now - started > UDPTransport._reassembly_timeout:
+                del self._partial[key]
+
+        key = (address, message_id)
+        if key not in self._partial:
+            if len(self._partial) >= UDPTransport._max_partial:
+                oldest = min(self._partial.items(), key=lambda x: x[1][0])
+                del self._partial[oldest[0]]
+            self._partial[key] = (now, count, {})
+
+        started, expected_count, chunks = self._partial[key]
+        if count != expected_count:
+            return None
+        chunks[index] = datagram[offset:]
+        if len(chunks) < count:
+            return None
+
+        del self._partial[key]
+        return "".join([chunks[i] for i in range(count)])
+
+    def send_raw(self, data, ID):
+        """
+        Send raw string data to the Node with ID.
+
+        Raise KeyError if ID isn't in the IP table.
+        """
+        address = self._peers[ID]
+        for datagram in self._fragment(data):
+            self._sendto(datagram, address)
+
+    def send(self, message, ID):
+        """
+        Send pickled message to the Node with ID.
+
+        Raise KeyError if ID isn't in the IP table.
+        """
+        self.send_raw(pickle.dumps(message, pickle.HIGHEST_PROTOCOL), ID)
+
+    def broadcast(self, message):
+        """Send pickled message to every Node in the IP table, self included."""
+        datagrams = self._fragment(
+            pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+        for address in self._peers.values():
+            for datagram in datagrams:
+                self._sendto(datagram, address)
+
+
+class TCPTransport(object):
+    """
+    TCPTransport class.
+
+    ip_table:       ID-to-IP translation table of the Node; addresses of
+                    every peer are resolved once at construction.
+    node_id:        ID of the owning Node, announced as the first frame of
+                    every connection it opens so the peer knows the sender.
+    outboxes:       Queue of frames per peer, each drained by a writer thread
+                    that keeps one connection open, reconnects with
+                    exponential backoff after an error, and coalesces every
+                    queued frame into a single write; at most max_queued
+                    frames wait per peer, later ones are dropped.
+    drop_unsent:    If True, frames a writer fails to send because its peer
+                    is down are dropped, with the frames queued while it
+                    backs off, instead of being sent on reconnection; for
+                    messages that are stale by then, e.g. Bully's.
+    inbox:          Queue of (data, sender ID) read from every connection;
+                    messages to self are put here directly.
+    signal:         Nonblocking pipe written to for every message put in the
+                    inbox, made by the first call to fileno(); recv() empties
+                    it before reading the inbox.
+
+    Every message is framed by its 4 byte big-endian length.
+    """
+
+    _max_queued = 10000
+    _max_frame = 64 * 1024 * 1024
+    _reconnect_delay = 0.05
+    _max_reconnect_delay = 2.0
+
+    def __init__(self, ip_table, node_id, port_index=2, drop_unsent=False):
+        """Construct TCPTransport object."""
+        if type(node_id) != int:
+            raise TypeError("node_id must be an int")
+        if type(drop_unsent) != bool:
+            raise TypeError("drop_unsent must be a bool")
+
+        self._peers = {}
+        for ID, ip_info in ip_table.items():
+            IP, PORT = ip_info[0], ip_info[port_index]
+            self._peers[ID] = (socket.gethostbyname(IP), PORT)
+
+        self._node_id = node_id
+        self._drop_unsent = drop_unsent
+        self._outboxes = {}
+        self._outboxes_lock = thread.allocate_lock()
+        self._inbox = Queue.Queue()
+        self._listen_socket = None
+        self._connections = []
+        self._signal = None
+        self._closed = False
+        self._is_Transport = True
+
+    def bind(self, PORT, IP="0.0.0.0"):
+        """Listen for peer connections on (IP, PORT)."""
+        listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_socket.bind((IP, PORT))
+        listen_socket.listen(len(self._peers))
+        self._listen_socket = listen_socket
+        thread.start_new_thread(self._accept_loop, (listen_socket,))
+        return listen_socket
+
+    def _accept_loop(self, listen_socket):
+        """Accept peer connections until closed."""
+        while not self._closed:
+            try:
+                conn, addr = listen_socket.accept()
+            except socket.error:
+                break
+            self._connections.append(conn)
+            thread.start_new_thread(self._read_loop, (conn,))
+
+    @staticmethod
+    def _recv_exact(conn, num_bytes):
+        """Return num_bytes read from conn; None if it closes first."""
+        chunks, remaining = [], num_bytes
+        while remaining:
+            chunk = conn.recv(min(remaining, 65536))
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return "".join(chunks)
+
+    def _recv_frame(self, conn):
+        """Return the next frame read from conn; None if it closes first."""
+        header = TCPTransport._recv_exact(conn, _LENGTH.size)
+        if header is None:
+            return None
+        length = _LENGTH.unpack(header)[0]
+        if length > TCPTransport._max_frame:
+            return None
+        return TCPTransport._recv_exact(conn, length)
+
+    def _read_loop(self, conn):
+        """Put every frame read from a peer connection into the inbox."""
+        try:
+            hello = self._recv_frame(conn)
+            sender_ID = int(hello) if hello is not None else None
+            if sender_ID not in self._peers:
+                logging.error("Dropping connection from unknown Node " +
+                                str(hello))
+                return
+
+            while not self._closed:
+                data = self._recv_frame(conn)
+                if data is None:
+                    break
+                self._deliver(data, sender_ID)
+        except (socket.error, ValueError):
+            pass
+        finally:
+            conn.close()
+            if conn in self._connections:
+                self._connections.remove(conn)
+
+    def _deliver(self, data, sender_ID):
+        """Put a message in the inbox and mark the signal pipe readable."""
+        self._inbox.put((data, sender_ID))
+        signal = self._signal
+        if signal is not None:
+            try:
+                os.write(signal[1], "x")
+            except OSError:
+                #the pipe is full, so it's readable already
+                pass
+
+    def fileno(self):
+        """
+        Return the read end of the signal pipe, which is readable while
+        messages may wait in the inbox.
+        """
+        with self._outboxes_lock:
+            if self._signal is None:
+                signal = os.pipe()
+                for fd in signal:
+                    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+                    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+                self._signal = signal
+                #messages delivered before the pipe existed
+                if not self._inbox.empty():
+                    os.write(signal[1], "x")
+        return self._signal[0]
+
+    def recv(self, timeout=None):
+        """
+        Block until a message arrives and return (data, sender ID); return
+        None once timeout seconds pass.
+        """
+        #empty the signal first so a message delivered meanwhile re-arms it
+        signal = self._signal
+        if signal is not None:
+            try:
+                while os.read(signal[0], 4096):
+                    pass
+            except OSError:
+                pass
+
+        try:
+            if timeout == 0:
+                return self._inbox.get_nowait()
+            return self._inbox.get(timeout=timeout)
+        except Queue.Empty:
+            return None
+
+    def _connect(self, ID):
+        """Open a connection to the Node with ID and introduce ourself."""
+        conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.connect(self._peers[ID])
+            hello = str(self._node_id)
+            conn.sendall(_LENGTH.pack(len(hello)) + hello)
+        except socket.error:
+            conn.close()
+            raise
+        return conn
+
+    def _write_loop(self, ID, outbox):
+        """Write the frames queued for the Node with ID until closed."""
+        conn, delay = None, TCPTransport._reconnect_delay
+        while not self._closed:
+            frame = outbox.get()
+            if frame is None:
+                break
+
+            #coalesce everything queued meanwhile into one write
+            frames = [frame]
+            while True:
+                try:
+                    frame = outbox.get_nowait()
+                except Queue.Empty:
+                    break
+                if frame is None:
+                    break
+                frames.append(frame)
+            data = "".join(frames)
+
+            while not self._closed:
+                try:
+                    #peers never write back, so a readable connection was
+                    #closed by the peer; a write would silently be lost
+                    if conn is not None and \
+                            select.select([conn], [], [], 0)[0]:
+                        conn.close()
+                        conn = None
+                    if conn is None:
+                        conn = self._connect(ID)
+                    conn.sendall(data)
+                    delay = TCPTransport._reconnect_delay
+                    break
+                except socket.error:
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+                    time.sleep(delay)
+                    delay = min(delay * 2, TCPTransport._max_reconnect_delay)
+                    if self._drop_unsent:
+                        frame = TCPTransport._drop_queued(outbox)
+                        break
+
+            if frame is None:
+                break
+
+        if conn is not None:
+            conn.close()
+
+    @staticmethod
+    def _drop_queued(outbox):
+        """
+        Drop every frame queued in outbox; return None if the writer's stop
+        marker was among them.
+        """
+        frame = ""
+        while frame is not None:
+            try:
+                frame = outbox.get_nowait()
+            except Queue.Empty:
+                break
+        return frame
+
+    def _outbox(self, ID):
+        """Return the outbox of the Node with ID, starting its writer."""
+        outbox = self._outboxes.get(ID)
+        if outbox is None:
+            with self._outboxes_lock:
+                outbox = self._outboxes.get(ID)
+                if outbox is None:
+                    outbox = Queue.Queue(TCPTransport._max_queued)
+                    self._outboxes[ID] = outbox
+                    thread.start_new_thread(self._write_loop, (ID, outbox))
+        return outbox
+
+    def send_raw(self, data, ID):
+        """
+        Send raw string data to the Node with ID.
+
+        Raise KeyError if ID isn't in the IP table.
+        """
+        if ID not in self._peers:
+            raise KeyError(ID)
+        if ID == self._node_id:
+            self._deliver(data, ID)
+            return
+
+        try:
+            self._outbox(ID).put_nowait(_LENGTH.pack(len(data)) + data)
+        except Queue.Full:
+            logging.error("Send queue to Node " + str(ID) +
+                            " is full; dropping message")
+
+    def send(self, message, ID):
+        """
+        Send pickled message to the Node with ID.
+
+        Raise KeyError if ID isn't in the IP table.
+        """
+        self.send_raw(pickle.dumps(message, pickle.HIGHEST_PROTOCOL), ID)
+
+    def broadcast(self, message):
+        """Send pickled message to every Node in the IP table, self included."""
+        data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+        for ID in self._peers:
+            self.send_raw(data, ID)
+
+    def close(self):
+        """Stop the writers and close every connection."""
+        self._closed = True
+        for outbox in self._outboxes.values():
+            try:
+                outbox.put_nowait(None)
+            except Queue.Full:
+                pass
+
+        if self._listen_socket is not None:
+            try:
+                self._listen_socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self._listen_socket.close()
+            self._listen_socket = None
+
+        for conn in list(self._connections):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+        if self._signal is not None:
+            os.close(self._signal[0])
+            os.close(self._signal[1])
+            self._signal = None
@@ -0,0 +1,125 @@
+"""Append-only write-ahead log for Acceptor state and committed log slots."""
+
+import os
+import zlib
+import struct
+import pickle
+import threading
+
+_HEADER = struct.Struct(">II")
+
+class WriteAheadLog(object):
+    """
+    WriteAheadLog class.
+
+    path:           File records are appended to; created if missing.
+    group_size:     Maximum number of records made durable by a single
+                    fsync; 1 means fsync after every record.
+    pending:        Framed records appended since the last sync; not durable
+                    until sync() returns.
+    num_syncs:      Number of fsyncs done so far.
+
+    Each record is a pickled tuple framed by its length and CRC32 so a torn
+    write at the tail (i.e. a crash mid-append) is detected and discarded on
+    replay.
+    """
+
+    def __init__(self, path, group_size=64):
+        """Construct WriteAheadLog object."""
+        if type(path) != str:
+            raise TypeError("path must be a string")
+        if type(group_size) != int:
+            raise TypeError("group_size must be an int")
+        if group_size < 1:
+            raise ValueError("group_size must be positive")
+
+        #drop a torn tail so new records don't land behind garbage
+        records, length = WriteAheadLog._scan(path)
+        if os.path.exists(path) and os.path.getsize(path) != length:
+            with open(path, "r+b") as f:
+                f.truncate(length)
+
+        self._path = path
+        self._group_size = group_size
+        self._pending = []
+        self._num_syncs = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        self._is_WriteAheadLog = True
+
+    def append(self, record):
+        """Buffer record (a picklable tuple) for the next sync."""
+        payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        crc = zlib.crc32(payload) & 0xffffffff
+        with self._lock:
+            self._pending.append(_HEADER.pack(len(payload), crc) + payload)
+
+    def is_full(self):
+        """Determine if enough records are pending to force a sync."""
+        return len(self._pending) >= self._group_size
+
+    def sync(self):
+        """Write pending records and make them durable with one fsync."""
+        with self._lock:
+            if not self._pending:
+                return
+            self._file.write("".join(self._pending))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = []
+            self._num_syncs += 1
+
+    def checkpoint(self, write_snapshot):
+        """
+        Call write_snapshot() then empty the log; no record can be appended in
+        between, so every record is either reflected in the snapshot or kept.
+        """
+        with self._lock:
+            write_snapshot()
+            self._pending = []
+            self._file.close()
+            self._file = open(self._path, "wb")
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Sync and close the log."""
+        self.sync()
+        self._file.close()
+
+    def is_empty(self):
+        """Determine if the log holds no records, durable or pending."""
+        with self._lock:
+            return not self._pending and \
+                os.fstat(self._file.fileno()).st_size == 0
+
+    @staticmethod
+    def read(path):
+        """
+        Return the list of records in the log at path, dropping a torn or
+        corrupt tail; return an empty list if there's no log at path.
+        """
+        return WriteAheadLog._scan(path)[0]
+
+    @staticmethod
+    def _scan(path):
+        """
+        Return the records of the log at path and the length of the prefix
+        of the file holding them intact.
+        """
+        if not os.path.exists(path):
+            return [], 0
+
+        with open(path, "rb") as f:
+            data = f.read()
+
+        records, offset = [], 0
+        while offset + _HEADER.size <= len(data):
+            length, crc = _HEADER.unpack_from(data, offset)
+            start, end = offset + _HEADER.size, offset + _HEADER.size + length
+            payload = data[start:end]
+            if len(payload) != length or zlib.crc32(payload) & 0xffffffff != crc:
+                break
+            records.append(pickle.loads(payload))
+            offset = end
+
+        return records, offset
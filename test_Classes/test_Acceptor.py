@@ -0,0 +1,126 @@
+"""Tests for Acceptor."""
+
+import time
+from Paxos.Classes.Appointment import Appointment
+from Paxos.Classes.Operation import Operation
+from Paxos.Classes.Batch import Batch
+from Paxos.Classes.Acceptor import Acceptor
+
+class _RecordingTransport(object):
+    """Transport keeping every message sent instead of sending it."""
+
+    def __init__(self):
+        self._sent = []
+
+    def send(self, message, ID):
+        self._sent.append((message[0], message[-1]))
+
+def _make_acceptor():
+    """Return an Acceptor recording what it sends."""
+    ip_table = {0: ["127.0.0.1", 9000, 10000]}
+    return Acceptor(ip_table, _RecordingTransport())
+
+def test__recv_prepare():
+    """Test promises are tracked per log slot."""
+    acceptor = _make_acceptor()
+    v = Batch([Operation("add", Appointment(
+        "yo", "saturday", "12:30pm", "1:30pm", [1]))])
+
+    #a prepare for slot 10 doesn't reject an accept for slot 9
+    acceptor._recv_prepare(("prepare", 5, 9, 0))
+    acceptor._recv_prepare(("prepare", 7, 10, 0))
+    acceptor._recv_accept(("accept", 5, v, 9, 0))
+    assert acceptor._accNums[9] == 5
+    assert acceptor._transport._sent == [
+        ("promise", 5), ("promise", 7), ("ack", 9)]
+
+    #a lower ballot for the same slot is nacked with the promised one
+    acceptor._recv_prepare(("prepare", 6, 10, 0))
+    acceptor._recv_accept(("accept", 6, v, 10, 0))
+    assert acceptor._accNums[10] is None
+    assert acceptor._transport._sent[3:] == [("nack", 6), ("nack", 6)]
+
+    #a duplicate prepare is neither promised nor nacked again
+    acceptor._recv_prepare(("prepare", 7, 10, 0))
+    assert len(acceptor._transport._sent) == 5
+
+def test__recv_prepare_all():
+    """Test Multi-Paxos prepares promise every slot from a watermark on."""
+    acceptor = _make_acceptor()
+    acceptor._recv_prepare(("prepare", 9, 4, 0))
+
+    #slot 4 already promised more
+    acceptor._recv_prepare_all(("prepare_all", 8, 2, 0))
+    assert acceptor._watermark_ballot == -1
+    assert acceptor._transport._sent[-1] == ("nack", 8)
+
+    acceptor._recv_prepare_all(("prepare_all", 10, 2, 0))
+    assert acceptor._promised(1) == -1
+    assert acceptor._promised(4) == 10
+    assert acceptor._promised(1000) == 10
+
+    #moving the watermark up keeps the promise on the slots it skips
+    acceptor._recv_prepare_all(("prepare_all", 12, 6, 0))
+    assert acceptor._promised(3) == 10
+    assert acceptor._promised(6) == 12
+    assert [sent[0] for sent in acceptor._transport._sent] == [
+        "promise", "nack", "promise_all", "promise_all"]
+
+def test__compact():
+    """Test state below a compacted slot is dropped and its ballots nacked."""
+    acceptor = _make_acceptor()
+    v = Batch([Operation("add", Appointment(
+        "yo", "saturday", "12:30pm", "1:30pm", [1]))])
+    acceptor._recv_prepare(("prepare", 5, 3, 0))
+    acceptor._recv_accept(("accept", 5, v, 3, 0))
+    acceptor._recv_prepare(("prepare", 5, 4, 0))
+
+    acceptor._recv_compact(("compact", 4))
+    assert acceptor._accVals.keys() == [4]
+    assert acceptor._maxPrepares.keys() == [4]
+
+    #every kind of ballot for a compacted slot is nacked
+    del acceptor._transport._sent[:]
+    acceptor._recv_prepare(("prepare", 7, 3, 0))
+    acceptor._recv_accept(("accept", 7, v, 3, 0))
+    acceptor._recv_prepare_all(("prepare_all", 7, 3, 0))
+    assert acceptor._transport._sent == [("nack", 7)] * 3
+    assert acceptor._accNums.get(3) is None
+
+def test__raise_watermark():
+    """Test watermarks skipping slots keep no per-slot state for them."""
+    acceptor = _make_acceptor()
+    acceptor._raise_watermark(10, 0)
+    acceptor._raise_watermark(12, 10 ** 9)
+    assert acceptor._maxPrepares == {}
+    assert acceptor._promised(5) == 10
+    assert acceptor._promised(10 ** 9) == 12
+
+    #a watermark below the current one covers every slot from it on
+    acceptor._raise_watermark(14, 5)
+    assert acceptor._watermarks == [(0, 10), (5, 14)]
+    assert acceptor._promised(4) == 10
+    assert acceptor._promised(10 ** 9) == 14
+
+    #watermarks only covering compacted slots are dropped
+    acceptor._compact(6)
+    assert acceptor._watermarks == [(5, 14)]
+    assert acceptor._promised(7) == 14
+
+def test__grant_lease():
+    """Test prepares of other Nodes are nacked while a lease runs."""
+    acceptor = _make_acceptor()
+    assert acceptor._grant_lease(2, time.time() + 60)
+    assert not acceptor._grant_lease(1, time.time() + 60)
+
+    acceptor._recv_prepare(("prepare", 11, 0, 1))
+    acceptor._recv_prepare_all(("prepare_all", 21, 0, 1))
+    acceptor._recv_prepare(("prepare", 12, 0, 2))
+    assert acceptor._transport._sent == [
+        ("nack", 11), ("nack", 21), ("promise", 12)]
+
+    #the holder renews its lease; once it expired anyone may get one
+    assert acceptor._grant_lease(2, 0.0)
+    assert acceptor._lease[1] > time.time()
+    acceptor._lease = (2, time.time() - 1)
+    assert acceptor._grant_lease(1, time.time() + 60)
@@ -78,11 +78,10 @@ def test___ne__():
 
 def test__key():
     """Test key function for Appointment."""
-    from datetime import time
     name, day, start, end, participants = "a", "Friday", "1:00pm", "2:00pm", [1]
     A1 = Appointment(name, day, start, end, participants)
 
-    assert A1._key() == (name, day, time(13, 0), time(14, 0), (1,))
+    assert A1._key() == (name, 5, 26, 28, frozenset([1]))
 
 def test___hash__():
     """Test hashing for Appointment object."""
@@ -91,6 +90,23 @@ def test___hash__():
     A2 = Appointment(name, day, start, end, participants)
     assert hash(A1) == hash(A2)
 
+    #participant order doesn't matter to equality, so neither to the hash
+    A3 = Appointment(name, day, start, end, [2, 1])
+    A4 = Appointment(name, day, start, end, [1, 2, 1])
+    assert A3 == A4
+    assert hash(A3) == hash(A4)
+
+def test___slots__():
+    """Test Appointments are compact and survive pickling."""
+    import pickle
+    name, day, start, end, participants = "a", "Friday", "1:00pm", "2:00pm", [1]
+    A1 = Appointment(name, day, start, end, participants)
+    assert not hasattr(A1, "__dict__")
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        A2 = pickle.loads(pickle.dumps(A1, protocol))
+        assert A2 == A1
+        assert hash(A2) == hash(A1)
+
 def test__parse_time():
     """Test static function _parse_time()."""
     from datetime import time
@@ -118,12 +134,26 @@ def test__parse_time():
     test_ValueError("1:07am")
     test_ValueError("1:00gm")
     test_ValueError("1:00m")
+    test_ValueError(time(1, 15))
+    test_ValueError(time(1, 30, 5))
+    test_ValueError(time(1, 30, 0, 1))
 
     assert Appointment._parse_time("12:00pm") == time(12, 0)
     assert Appointment._parse_time("0:00am") == time(0, 0)
     assert Appointment._parse_time("1:30am") == time(1, 30)
     assert Appointment._parse_time("1:30pm") == time(13, 30)
     assert Appointment._parse_time("11:30pm") == time(23, 30)
+    assert Appointment._parse_time(time(23, 30)) == time(23, 30)
+    assert Appointment._parse_time("01:30pm") == time(13, 30)
+    assert Appointment._parse_time("12:30am") == time(0, 30)
+    assert Appointment._parse_time("0:30pm") == time(12, 30)
+
+    #legal strings and times map onto the 48 half-hour slots
+    assert Appointment._parse_slot("0:00am") == 0
+    assert Appointment._parse_slot("11:30pm") == 47
+    assert Appointment._parse_slot(time(13, 30)) == 27
+    assert Appointment._parse_time("1:30am") is \
+        Appointment._parse_time(time(1, 30))
 
 def test__is_conflicting():
     """Test Appointment._is_conflicting() static function."""
@@ -0,0 +1,63 @@
+"""Tests for Batch."""
+
+import pickle
+import pytest
+from Paxos.Classes.Appointment import Appointment
+from Paxos.Classes.Calendar import Calendar
+from Paxos.Classes.Operation import Operation
+from Paxos.Classes.Batch import Batch
+
+def test___init__():
+    """Test construction of Batch object."""
+    a1 = Appointment("yo","saturday","12:30pm","1:30pm", [1, 2, 3])
+
+    with pytest.raises(TypeError) as excinfo:
+        Batch(Operation("add", a1))
+    with pytest.raises(TypeError) as excinfo:
+        Batch([a1])
+    with pytest.raises(ValueError) as excinfo:
+        Batch([])
+
+    assert len(Batch([Operation("add", a1), Operation("remove", a1)])) == 2
+
+def test_apply():
+    """Test Batch.apply() applies Operations in order."""
+    a1 = Appointment("yo","saturday","12:30pm","1:30pm", [1, 2, 3])
+    a1_conf = Appointment("yo_conf","saturday","1:00pm","2:00pm", [3])
+    a2 = Appointment("yerboi","saturday","1:30am","11:30am", [1, 4, 5])
+
+    c = Calendar(a2)
+    add_conf = Operation("add", a1_conf)
+    batch = Batch([Operation("add", a1), add_conf, Operation("remove", a2)])
+    assert batch.apply(c) == [add_conf]
+    assert c == Calendar(a1)
+
+def test_serialize():
+    """Test binary serialization round trip of Batch objects."""
+    def test_ValueError(serial_msg):
+        """Test ValueError raising during Batch.deserialize()."""
+        with pytest.raises(ValueError) as excinfo:
+            Batch.deserialize(serial_msg)
+
+    a1 = Appointment("yo","saturday","12:30pm","1:30pm", [1, 2, 3])
+    a2 = Appointment("yo","Friday","1:30am","11:30am", [1, 400, -5])
+    batch = Batch([Operation("add", a1), Operation("remove", a2)])
+    serial_msg = Batch.serialize(batch)
+
+    assert Batch.is_serialized(serial_msg)
+    assert not Batch.is_serialized(Operation.serialize(Operation("add", a1)))
+    assert Batch.serialize(None) is None
+
+    for trusted in (False, True):
+        batch_copy = Batch.deserialize(serial_msg, trusted=trusted)
+        assert [op._kind for op in batch_copy] == ["add", "remove"]
+        assert [op._appointment for op in batch_copy] == [a1, a2]
+        assert Batch.serialize(batch_copy) is serial_msg
+
+    #the cached form is reused but never pickled
+    assert Batch.serialize(batch) is serial_msg
+    assert pickle.loads(pickle.dumps(batch))._serial is None
+
+    test_ValueError("commit")
+    test_ValueError(serial_msg[:-1])
+    test_ValueError(serial_msg + "\x00")
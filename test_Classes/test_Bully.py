@@ -0,0 +1,92 @@
+"""Tests for the Bully Algorithm's message handling."""
+
+import time
+from Paxos.Classes.Bully import _handle_message, _handle_timeout
+from Paxos.Classes.Bully import _handle_idle_message, _election_due
+
+class _RecordingTransport(object):
+    """Transport keeping every message sent, with its destination."""
+
+    def __init__(self):
+        self._sent = []
+
+    def send(self, message, ID):
+        self._sent.append((message, ID))
+
+class _Node(object):
+    """Just what Bully needs of a Node."""
+
+    def __init__(self, node_id, num_nodes):
+        self._node_id = node_id
+        self._ip_table = dict((ID, None) for ID in range(num_nodes))
+        self._leader = None
+        self._lease_expiry = 0.0
+        self._granted = True
+        self._acks = []
+
+    def _set_leader(self, ID):
+        self._leader = ID
+        self._lease_expiry = time.time() + 3.0
+
+    def _recv_heartbeat(self, ID, data):
+        if self._granted:
+            return (data, -1)
+
+    def _recv_heartbeat_ack(self, ID, data):
+        self._acks.append((ID, data))
+
+def test__handle_message():
+    """Test OKAYs only count for the round of the Election they answer."""
+    node, transport = _Node(1, 3), _RecordingTransport()
+
+    #an Election from a lower Node is answered for the round it's from
+    assert _handle_message(node, transport, 0, "Election", 4, 7) == \
+        "Election"
+    assert transport._sent == [((1, "OKAY", 4), 0)]
+    assert _handle_message(node, transport, 2, "Election", 4, 7) is None
+
+    #an OKAY answering an earlier round is stale
+    assert _handle_message(node, transport, 2, "OKAY", 6, 7) is None
+    assert not _handle_timeout(node, transport, True, 7)
+    assert _handle_message(node, transport, 2, "OKAY", 7, 7) == "OKAY"
+
+    assert _handle_message(node, transport, 2, "Coordinator", 3, 7) == \
+        "Coordinator"
+    assert node._leader == 2
+
+    #no OKAY in time makes this Node the leader
+    del transport._sent[:]
+    assert _handle_timeout(node, transport, False, 8)
+    assert node._leader == 1
+    assert sorted(transport._sent) == [
+        ((1, "Coordinator", 8), 0), ((1, "Coordinator", 8), 2)]
+
+def test__handle_idle_message():
+    """Test Heartbeats renew leases and only bullying starts a round."""
+    node, transport = _Node(1, 3), _RecordingTransport()
+    assert _election_due(node)
+
+    assert not _handle_idle_message(node, transport, 2, "Heartbeat", 4.0)
+    assert node._leader == 2
+    assert transport._sent == [((1, "HeartbeatAck", (4.0, -1)), 2)]
+    assert not _election_due(node)
+    node._lease_expiry = time.time() - 1
+    assert _election_due(node)
+
+    #a lower Node claiming to lead or holding an election is bullied
+    assert _handle_idle_message(node, transport, 0, "Heartbeat", None)
+    assert _handle_idle_message(node, transport, 0, "Election", 5)
+    assert transport._sent[1:] == [((1, "OKAY", 5), 0)]
+    assert not _handle_idle_message(node, transport, 2, "OKAY", 5)
+
+    #Heartbeats are only acknowledged if a lease was granted
+    node._granted = False
+    assert not _handle_idle_message(node, transport, 2, "Heartbeat", 5.0)
+    assert len(transport._sent) == 2
+    assert not _handle_idle_message(node, transport, 0, "HeartbeatAck", 1)
+    assert node._acks == [(0, 1)]
+
+    #the leader's own lease never runs out
+    node._set_leader(1)
+    node._lease_expiry = time.time() - 1
+    assert not _election_due(node)
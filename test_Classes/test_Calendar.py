@@ -211,8 +211,8 @@ def test___iter__():
 
     c1 = Calendar(a1, a2, a3)
 
-    assert [appt for appt in c1] == c1._appointments
-    assert [i for i in iter(c1)] == c1._appointments
+    assert [appt for appt in c1] == [c1[i] for i in range(len(c1))]
+    assert [i for i in iter(c1)] == [a1, a2, a3]
     
     for i, appt in enumerate(c1):
         if i == 0: 
@@ -242,6 +242,31 @@ def test___contains__():
     assert a2 in c1
     assert a3 not in c1
 
+def test__find():
+    """Test duplicates are found by hash, participants unordered."""
+    a1 = Appointment("yo","saturday","12:30pm","1:30pm", [1, 2, 3])
+    a1_copy = Appointment("yo","Saturday","12:30pm","1:30pm", [3, 1, 2])
+    a2 = Appointment("yerboi","saturday","1:30am","11:30am", [1, 4, 5])
+    a3 = Appointment("yo","saturday","12:30pm","1:30pm", [1, 2])
+
+    c1 = Calendar(a1, a2, a1_copy)
+    assert len(c1) == 2
+    assert c1._find(a1_copy) is a1
+    assert c1._find(a3) is None
+    assert a1_copy in c1
+    assert a3 not in c1
+
+    c1 += a1_copy
+    assert len(c1) == 2
+    with pytest.raises(ValueError) as excinfo:
+        c1[1] = a1_copy
+    c1[0] = a1_copy
+    assert c1._find(a1) is a1_copy
+
+    c1 -= a1
+    assert len(c1) == 1
+    assert a1_copy not in c1 and c1._find(a1) is None
+
 def test___deepcopy__():
     """Implement copy.deepcopy for Calendar object."""
     from copy import deepcopy
@@ -254,11 +279,18 @@ def test___deepcopy__():
     c_copy = deepcopy(c)
     assert c == c_copy
     assert c is not c_copy
-    appts = c._appointments
-    appts_copy = c_copy._appointments
-    for i in range(len(appts)):
-        assert appts[i] == appts_copy[i]
-        assert appts[i] is not appts_copy[i]
+
+    #Appointments are immutable so the copy shares them, and its structure
+    for i in range(len(c)):
+        assert c[i] is c_copy[i]
+    assert c_copy._appointments is c._appointments
+
+    #changing either leaves the other alone
+    c_copy -= a2
+    c += Appointment("late","saturday","11:00pm","11:30pm", [1])
+    assert [appt._name for appt in c_copy] == ["yo", "we out here", "bluv"]
+    assert len(c) == 5
+    assert a2 in c and a2 not in c_copy
 
 def test__is_appointment_conflicting():
     """Test Calendar's _is_appointment_conflicting() function."""
@@ -313,3 +345,143 @@ def test__is_calendar_conflicting():
     #test disjoint but conflicting calendars
     assert c1._is_calendar_conflicting(c4)
     assert c4._is_calendar_conflicting(c1)
+
+def test_merge():
+    """Test Calendar's merge() function against pairwise conflict checks."""
+    import random
+    a1 = Appointment("yo","saturday","12:30pm","1:30pm", [1, 2, 3])
+    a2 = Appointment("yerboi","Friday","1:30am","11:30am", [1, 4, 5])
+    a4 = Appointment("bluv","Thursday","11:30am","12:30pm", [2, 6])
+    a5 = Appointment("yo_conflict","saturday","12:30pm","1:30pm", [1, 2, 6])
+
+    c1 = Calendar(a1, a2)
+    c2 = Calendar(a4, a5)
+    with pytest.raises(TypeError) as excinfo:
+        c1.merge(None)
+
+    merged, conflicts = c1.merge(c2)
+    assert conflicts == [(a1, a5)]
+    assert list(merged) == [a1, a2, a4]
+    assert list(c1) == [a1, a2]
+
+    #shared (but equal) Appointments are merged once
+    merged, conflicts = c1.merge(Calendar(a2, a4))
+    assert conflicts == []
+    assert list(merged) == [a1, a2, a4]
+
+    #random Calendars of a few participants over one day
+    random.seed(7)
+    for trial in range(20):
+        calendars = []
+        for side in range(2):
+            calendar = Calendar()
+            for i in range(40):
+                start = random.randrange(47)
+                appointment = Appointment._from_trusted(
+                    str(random.randrange(3)), 0, start,
+                    random.randrange(start + 1, min(start + 6, 48) + 1),
+                    frozenset(random.sample(range(5), random.randint(1, 2))))
+                if not calendar._is_appointment_conflicting(appointment):
+                    calendar += appointment
+            calendars.append(calendar)
+
+        c1, c2 = calendars
+        expected = [(appt1, appt2) for appt1 in c1 for appt2 in c2
+                    if appt1 != appt2 and
+                    Appointment._is_conflicting(appt1, appt2)]
+        merged, conflicts = c1.merge(c2)
+        assert len(conflicts) == len(expected)
+        assert set(conflicts) == set(expected)
+        assert set(merged) == set(c1) | set([
+            appt2 for appt2 in c2 if appt2 not in [
+                appt for pair in expected for appt in pair]])
+        assert c1._is_calendar_conflicting(c2) == bool(expected)
+
+def test__index_conflict():
+    """Test Calendar's interval index stays consistent across mutations."""
+    from copy import deepcopy
+    a1 = Appointment("yo","saturday","12:30pm","1:30pm", [1, 2, 3])
+    a2 = Appointment("yerboi","saturday","1:30am","11:30am", [1, 4, 5])
+    a3 = Appointment("we out here","saturday","11:30am","12:30pm", [1])
+    a4 = Appointment("bluv","saturday","1:30pm","3:00pm", [2, 6])
+    a5 = Appointment("spanner","saturday","11:00am","2:00pm", [6])
+    a6 = Appointment("late","saturday","11:00am","2:00pm", [7])
+
+    c1 = Calendar(a1, a2, a3)
+
+    #adjacent appointments don't conflict, overlapping ones do
+    assert c1._index_conflict(a4) is None
+    assert c1._index_conflict(a1) is None
+    assert c1._index_conflict(a5) is None
+    assert c1._index_conflict(
+        Appointment("yo_copy","saturday","1:00pm","2:00pm", [3])) is a1
+
+    #failed __setitem__ leaves the index untouched
+    c1 += a4
+    with pytest.raises(ValueError) as excinfo:
+        c1[0] = a5
+    assert c1._index_conflict(a5) is a4
+    c1[3] = a6
+    assert c1._index_conflict(a5) is None
+    assert c1._index_conflict(a4) is None
+
+    c_copy = deepcopy(c1)
+    assert c_copy._index_conflict(a1) is None
+    assert c_copy._index_conflict(a5) is None
+    c_copy += a4
+    assert len(c_copy) == 5
+    assert c_copy._index_conflict(a5) is c_copy[4]
+    assert c1._index_conflict(a5) is None
+
+def test_serialize():
+    """Test binary serialization round trip of Calendar objects."""
+    def test_ValueError(serial_msg):
+        """Test ValueError raising during Calendar.deserialize()."""
+        with pytest.raises(ValueError) as excinfo:
+            Calendar.deserialize(serial_msg)
+
+    a1 = Appointment("yo","saturday","12:30pm","1:30pm", [1, 2, 3])
+    a2 = Appointment("yo","Friday","1:30am","11:30am", [1, 400, 5])
+    a3 = Appointment("a # on b with c","Tuesday","11:30am","12:30pm", [-1])
+    a4 = Appointment("late","sunday","11:00pm","11:30pm", [2])
+
+    c = Calendar(a1, a2, a3, a4)
+    serial_msg = Calendar.serialize(c)
+
+    assert Calendar.is_serialized(serial_msg)
+    assert not Calendar.is_serialized("propose")
+    assert not Calendar.is_serialized(None)
+    assert Calendar.serialize(None) is None
+    assert Calendar.deserialize(None) is None
+
+    for trusted in (False, True):
+        c_copy = Calendar.deserialize(serial_msg, trusted=trusted)
+        assert c_copy == c
+        assert [str(appt) for appt in c_copy] == [str(appt) for appt in c]
+        assert c_copy._is_appointment_conflicting(
+            Appointment("yo_copy","saturday","1:00pm","2:00pm", [3]))
+
+    assert len(Calendar.deserialize(Calendar.serialize(Calendar()))) == 0
+
+    test_ValueError("propose")
+    test_ValueError(serial_msg[:-1])
+    test_ValueError(serial_msg + "\x00")
+    test_ValueError(serial_msg[:3] + "\x09" + serial_msg[4:])
+
+def test___isub__():
+    """Test -= operator for Calendar object."""
+    a1 = Appointment("yo","saturday","12:30pm","1:30pm", [1, 2, 3])
+    a2 = Appointment("yerboi","saturday","1:30am","11:30am", [1, 4, 5])
+    a1_conf = Appointment("yo_conf","saturday","12:30pm","1:30pm", [1, 2, 3])
+
+    c = Calendar(a1, a2)
+    with pytest.raises(TypeError) as excinfo:
+        c -= None
+    with pytest.raises(ValueError) as excinfo:
+        c -= a1_conf
+
+    c -= Appointment("yo","saturday","12:30pm","1:30pm", [3, 2, 1])
+    assert c == Calendar(a2)
+    assert not c._is_appointment_conflicting(a1_conf)
+    c += a1_conf
+    assert len(c) == 2
@@ -0,0 +1,133 @@
+"""Tests for EventLoop."""
+
+import time
+import Queue
+import socket
+import pytest
+from Paxos.Classes.EventLoop import EventLoop
+from Paxos.Classes.Transport import TCPTransport
+
+def test_EventLoop():
+    """Test EventLoop constructor and task bound."""
+    with pytest.raises(TypeError):
+        EventLoop(1.5)
+    with pytest.raises(ValueError):
+        EventLoop(0)
+
+    def _task():
+        yield EventLoop.sleep(0)
+
+    loop = EventLoop(2)
+    loop.spawn(_task())
+    loop.spawn(_task())
+    with pytest.raises(ValueError):
+        loop.spawn(_task())
+    with pytest.raises(TypeError):
+        loop.spawn(_task)
+
+    #finished tasks free their place
+    loop.run()
+    loop.spawn(_task())
+    loop.run()
+    loop.close()
+
+def test_sleep():
+    """Test sleeping tasks resume in deadline order on a single thread."""
+    events = []
+
+    def _sleeper(name, seconds):
+        yield EventLoop.sleep(seconds)
+        events.append(name)
+
+    loop = EventLoop()
+    loop.spawn(_sleeper("slow", 0.05))
+    loop.spawn(_sleeper("fast", 0.01))
+    loop.spawn(_sleeper("now", 0))
+    start = time.time()
+    loop.run()
+    assert events == ["now", "fast", "slow"]
+    assert time.time() - start >= 0.05
+    loop.close()
+
+def test_queued():
+    """Test tasks wait on queues filled by other tasks, with timeouts."""
+    queue, results = Queue.Queue(), []
+
+    def _consumer():
+        arrived = yield EventLoop.queued(queue, 0.01)
+        results.append(arrived)
+        arrived = yield EventLoop.queued(queue)
+        results.append((arrived, queue.get_nowait()))
+
+    def _producer():
+        yield EventLoop.sleep(0.05)
+        queue.put("message")
+
+    loop = EventLoop()
+    loop.spawn(_consumer())
+    loop.spawn(_producer())
+    loop.run()
+    assert results == [False, (True, "message")]
+    loop.close()
+
+def test_readable():
+    """Test tasks wait on sockets and on a TCPTransport's inbox."""
+    left, right = socket.socketpair()
+    transport = TCPTransport({0: ["127.0.0.1", 9000, 10000]}, 0)
+    results = []
+
+    def _reader():
+        arrived = yield EventLoop.readable(left, 0.01)
+        results.append(arrived)
+        arrived = yield EventLoop.readable(left)
+        results.append((arrived, left.recv(10)))
+        arrived = yield EventLoop.readable(transport)
+        results.append((arrived, transport.recv(0)))
+        results.append(transport.recv(0))
+
+    def _writer():
+        yield EventLoop.sleep(0.05)
+        right.send("data")
+        yield EventLoop.sleep(0.01)
+        transport.send_raw("message", 0)
+
+    loop = EventLoop()
+    loop.spawn(_reader())
+    loop.spawn(_writer())
+    loop.run()
+    assert results == [
+        False, (True, "data"), (True, ("message", 0)), None]
+
+    transport.close()
+    left.close()
+    right.close()
+    loop.close()
+
+def test_subcoroutines():
+    """Test yielded generators run within the calling task."""
+    events = []
+
+    def _inner(depth):
+        if depth:
+            yield _inner(depth - 1)
+        yield EventLoop.sleep(0)
+        events.append(depth)
+
+    def _outer():
+        finished = yield _inner(2)
+        events.append(finished)
+
+    def _failing():
+        yield EventLoop.sleep(0)
+        raise ValueError("task failed")
+
+    loop = EventLoop(1)
+    loop.spawn(_outer())
+    loop.run()
+    assert events == [0, 1, 2, True]
+
+    #a failing task is dropped without stopping the loop
+    loop.spawn(_failing())
+    loop.run()
+    assert loop._num_tasks == 0
+    loop.close()
@@ -0,0 +1,65 @@
+"""Tests for HashTrie."""
+
+import random
+import pytest
+from Paxos.Classes.HashTrie import HashTrie
+
+class _Key(object):
+    """Key with a chosen hash, to force collisions."""
+
+    def __init__(self, value, key_hash):
+        self._value = value
+        self._hash = key_hash
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return self._value == other._value
+
+def test_set():
+    """Test versions of a map stay unchanged by later sets and removes."""
+    random.seed(3)
+    keys = [random.randrange(-1000, 10000) for i in range(500)] + \
+        [_Key(i, i % 3) for i in range(20)]
+    trie, expected, versions = HashTrie(), {}, []
+    for step in range(5000):
+        key = random.choice(keys)
+        if random.random() < 0.6:
+            trie, expected[key] = trie.set(key, step), step
+        elif key in expected:
+            trie = trie.remove(key)
+            del expected[key]
+        else:
+            with pytest.raises(KeyError):
+                trie.remove(key)
+        if step % 500 == 0:
+            versions.append((trie, dict(expected)))
+
+    for trie, expected in versions:
+        assert len(trie) == len(expected)
+        assert dict(trie.items()) == expected
+        for key, value in expected.items():
+            assert key in trie
+            assert trie.get(key) == value
+
+def test_nth():
+    """Test int keys are kept in ascending order and indexed by nth."""
+    keys = random.sample(range(100000), 1000)
+    trie = HashTrie()
+    for key in keys:
+        trie = trie.set(key, str(key))
+
+    keys.sort()
+    assert list(trie) == keys
+    assert [trie.nth(i) for i in range(0, 1000, 7)] == [
+        (key, str(key)) for key in keys[::7]]
+    with pytest.raises(IndexError):
+        trie.nth(1000)
+    with pytest.raises(IndexError):
+        trie.nth(-1)
+
+    #replacing a value keeps the key's place
+    trie = trie.set(keys[3], "x")
+    assert trie.nth(3) == (keys[3], "x")
+    assert len(trie) == 1000
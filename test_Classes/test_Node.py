@@ -0,0 +1,246 @@
+"""Tests for Node objects; no network traffic is involved."""
+
+import time
+import pytest
+from Paxos.Classes.Appointment import Appointment
+from Paxos.Classes.Operation import Operation
+from Paxos.Classes.Batch import Batch
+from Paxos.Classes.Calendar import Calendar
+from Paxos.Classes.Node import Node
+from Paxos.Classes.WriteAheadLog import WriteAheadLog
+
+class _RecordingTransport(object):
+    """Transport keeping every message sent, with its destination."""
+
+    def __init__(self):
+        self._sent = []
+
+    def send(self, message, ID):
+        self._sent.append((message, ID))
+
+    def broadcast(self, message):
+        self._sent.append((message, None))
+
+def _make_node(tmpdir, monkeypatch, node_id=0, **kwargs):
+    """Return a Node of a 3 Node IP table written to tmpdir."""
+    ip_file = tmpdir.join("IP_translations.txt")
+    ip_file.write("".join(["%d,127.0.0.1,%d,%d\n" % (i, 9300 + i, 10300 + i)
+                            for i in range(3)]))
+    monkeypatch.setattr(Node, "_ip_filename", str(ip_file))
+    node = Node(node_id, **kwargs)
+    node._transport = _RecordingTransport()
+    return node
+
+def _batch(i, kind="add"):
+    """Return a Batch of a single Operation on Appointment number i."""
+    appointment = Appointment(
+        "a" + str(i), "monday", str(i % 11 + 1) + ":00am",
+        str(i % 11 + 1) + ":30am", [i % 3])
+    return Batch([Operation(kind, appointment)])
+
+def test__learn(tmpdir, monkeypatch):
+    """Test slots are applied in order once contiguous, whatever arrives."""
+    node = _make_node(tmpdir, monkeypatch)
+    batches = [_batch(i) for i in range(4)]
+
+    node._learn(1, batches[1])
+    node._learn(3, batches[3])
+    assert len(node._calendar) == 0
+    assert (node._applied_slot, node._last_slot) == (0, 3)
+    node._learn(0, batches[0])
+    assert len(node._calendar) == 2
+    assert node._applied_slot == 2
+    node._learn(2, batches[2])
+    assert len(node._calendar) == 4
+    assert node._applied_slot == 4
+    assert node._calendar == Node._replay_log(node._log)
+
+    #relearning a slot changes nothing; a remove applies in slot order
+    node._learn(2, batches[0])
+    node._learn(4, _batch(0, "remove"))
+    assert len(node._calendar) == 3
+    assert node._calendar == Node._replay_log(node._log)
+
+def test_save(tmpdir, monkeypatch):
+    """Test state saved atomically with the WAL round trips through load."""
+    wal_path = str(tmpdir.join("state.wal"))
+    node = _make_node(tmpdir, monkeypatch, wal_path=wal_path)
+    node._learn(0, _batch(0))
+    node._acceptor._recv_prepare(("prepare", 10, 1, 1))
+
+    #a commit logged by the Acceptor but not learned yet is saved too
+    node._acceptor._recv_commit(("commit", _batch(1), 1))
+    Node.save(node, str(tmpdir) + "/", "state.pkl")
+    assert tmpdir.join("state.pkl").check()
+    assert not tmpdir.join("state.pkl.tmp").check()
+
+    #records after the save are replayed from the WAL on top of it
+    node._acceptor._recv_prepare(("prepare", 20, 2, 1))
+    node._acceptor._recv_commit(("commit", _batch(2), 2))
+    node._acceptor._sync()
+
+    loaded = Node.load(str(tmpdir) + "/", "state.pkl", wal_path=wal_path)
+    assert loaded._node_id == 0
+    assert sorted(loaded._log.keys()) == [0, 1, 2]
+    assert len(loaded._calendar) == 3
+    assert loaded._acceptor._promised(1) == 10
+    assert loaded._acceptor._promised(2) == 20
+    assert (loaded._applied_slot, loaded._last_slot) == (3, 2)
+
+    #state of another Node is never loaded
+    with pytest.raises(ValueError):
+        Node.load(str(tmpdir) + "/", "state.pkl", node_id=1,
+                    wal_path=wal_path)
+    other_wal = str(tmpdir.join("other.wal"))
+    _make_node(tmpdir, monkeypatch, node_id=1, wal_path=other_wal)
+    with pytest.raises(ValueError):
+        Node.load(str(tmpdir) + "/", "state.pkl", wal_path=other_wal)
+
+def test__compact(tmpdir, monkeypatch):
+    """Test every snapshot_slots slots are compacted and checkpointed."""
+    wal_path = str(tmpdir.join("state.wal"))
+    node = _make_node(
+        tmpdir, monkeypatch, wal_path=wal_path, snapshot_slots=3)
+    for i in range(2):
+        node._learn(i, _batch(i))
+    node._learn(3, _batch(3))
+    assert node._snapshot_slot == 0
+    assert node._log_bytes == sum(
+        [len(Batch.serialize(v)) for v in node._log.values()])
+
+    #slot 2 makes slots 0 to 3 contiguous, which is over the limit
+    node._learn(2, _batch(2))
+    assert node._snapshot_slot == 4
+    assert node._log == {}
+    assert node._log_bytes == 0
+    assert len(node._snapshot) == 4
+    assert node._snapshot == node._calendar
+
+    #the WAL now only holds its header; the checkpoint holds the rest
+    node._wal.sync()
+    assert [record[0] for record in WriteAheadLog.read(wal_path)] == ["node"]
+    loaded = Node.load(str(tmpdir) + "/", "state.pkl", wal_path=wal_path)
+    assert loaded._snapshot_slot == 4
+    assert loaded._calendar == node._calendar
+
+def test__check_gaps(tmpdir, monkeypatch):
+    """Test gaps are caught up from peers, then filled by the leader."""
+    node = _make_node(tmpdir, monkeypatch)
+    node._leader = 1
+    node._learn(0, _batch(0))
+    node._learn(3, _batch(3))
+    assert node._transport._sent == [(("catchup", 1, 3), 1)]
+
+    #no new request while the last one may still be answered
+    node._learn(2, _batch(2))
+    assert len(node._transport._sent) == 1
+
+    #a stalled request is sent again; a leader also fills the gap itself
+    node._catchup_time = 0.0
+    node._check_gaps()
+    assert node._transport._sent[-1] == (("catchup", 1, 3), 1)
+    assert node._proposer._command_queue.empty()
+
+    node._leader, node._catchup_time = 0, 0.0
+    node._check_gaps()
+    assert node._proposer._command_queue.get_nowait() == ("fill", (1,))
+
+def test__serve_catchup(tmpdir, monkeypatch):
+    """Test a lagging Node catches up from a peer's snapshot and log."""
+    monkeypatch.setattr(Node, "_chunk_bytes", 20)
+    node = _make_node(tmpdir, monkeypatch, snapshot_slots=3)
+    for i in range(5):
+        node._learn(i, _batch(i))
+    node._learn(6, _batch(6))
+    assert node._snapshot_slot == 3
+
+    #slot 5 is missing, so a catch-up request of the node's own went out
+    del node._transport._sent[:]
+    node._serve_catchup(0, 7, 1)
+    kinds = [message[0] for message, ID in node._transport._sent]
+    assert kinds.count("catchup_snapshot") > 1
+    assert kinds[-1] == "catchup_slots"
+    assert set([ID for message, ID in node._transport._sent]) == set([1])
+
+    #nothing is streamed for what the peer has already
+    num_sent = len(node._transport._sent)
+    node._serve_catchup(4, 7, 1)
+    assert [message[2] for message, ID in node._transport._sent[num_sent:]
+            ] == [((4, Batch.serialize(node._log[4])),
+                    (6, Batch.serialize(node._log[6])))]
+
+    peer = _make_node(tmpdir, monkeypatch, node_id=1)
+    peer._learn(0, _batch(0))
+    for message, ID in node._transport._sent[:num_sent]:
+        if message[0] == "catchup_snapshot":
+            peer._recv_catchup_snapshot(*message[1:])
+    log_slot, snapshot = peer._acceptor._commits_queue.get_nowait()
+    assert log_slot == 3
+
+    peer._install_snapshot(log_slot, snapshot)
+    for message, ID in node._transport._sent[:num_sent]:
+        if message[0] == "catchup_slots":
+            for log_slot, serial_v in message[2]:
+                peer._learn(log_slot, Batch.deserialize(serial_v))
+    assert peer._snapshot_slot == 3
+    assert (peer._applied_slot, peer._last_slot) == (5, 6)
+    assert peer._calendar == node._calendar
+    assert sorted(peer._log.keys()) == [3, 4, 6]
+
+    #an older snapshot changes nothing
+    peer._install_snapshot(2, Calendar())
+    assert peer._calendar == node._calendar
+
+def test__propose(tmpdir, monkeypatch):
+    """Test proposals wait for a leader to be elected, up to a timeout."""
+    node = _make_node(tmpdir, monkeypatch)
+    monkeypatch.setattr(Node, "_leader_timeout", 0.01)
+    assert not node.insert(_batch(0)._operations[0]._appointment)
+    assert node._transport._sent == []
+
+    node._set_leader(2)
+    assert node._leader_elected.is_set()
+    assert node.delete(_batch(0)._operations[0]._appointment)
+    message, ID = node._transport._sent[0]
+    assert (message[0], message[2], ID) == ("propose", 0, 2)
+
+    node._set_leader(None)
+    assert not node._leader_elected.is_set()
+
+def test_read(tmpdir, monkeypatch):
+    """Test leader reads need a lease and follower reads a fresh heartbeat."""
+    node = _make_node(tmpdir, monkeypatch)
+    node._learn(0, _batch(0))
+    calendar, applied_slot = node.read()
+    assert (calendar, applied_slot) == (node._calendar, 1)
+    assert calendar is not node._calendar
+    with pytest.raises(ValueError):
+        node.read(linearizable=True)
+
+    #a majority acknowledging a heartbeat makes a read lease; the read
+    #waits for the highest slot they accepted
+    node._set_leader(0)
+    sent_time = node._heartbeat_data()[0]
+    assert node._read_lease[0] == 0.0
+    node._recv_heartbeat_ack(1, (sent_time, 1))
+    assert node._read_lease[0] > time.time()
+    assert node._read_lease[1] == 2
+    with pytest.raises(ValueError):
+        node.read(linearizable=True, timeout=0.01)
+    node._learn(1, _batch(1))
+    assert node.read(linearizable=True)[1] == 2
+
+    #a follower knows the leader applied slot 3 from its heartbeat
+    follower = _make_node(tmpdir, monkeypatch, node_id=1)
+    assert follower._recv_heartbeat(0, (sent_time, 3)) == (sent_time, -1)
+    with pytest.raises(ValueError):
+        follower.read(max_staleness=1.0, timeout=0.01)
+    for i in range(3):
+        follower._learn(i, _batch(i))
+    assert follower.read(max_staleness=1.0)[1] == 3
+    follower._leader_applied = (3, time.time() - 2)
+    with pytest.raises(ValueError):
+        follower.read(max_staleness=1.0)
+
+    #the follower granted node 0 a lease, so node 2's heartbeats get no ack
+    assert follower._recv_heartbeat(2, (sent_time, 3)) is None
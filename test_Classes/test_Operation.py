@@ -0,0 +1,65 @@
+"""Tests for Operation."""
+
+import pytest
+from Paxos.Classes.Appointment import Appointment
+from Paxos.Classes.Calendar import Calendar
+from Paxos.Classes.Operation import Operation
+
+def test___init__():
+    """Test construction of Operation object."""
+    a1 = Appointment("yo","saturday","12:30pm","1:30pm", [1, 2, 3])
+
+    with pytest.raises(ValueError) as excinfo:
+        Operation("update", a1)
+    with pytest.raises(TypeError) as excinfo:
+        Operation("add", None)
+
+    op = Operation("add", a1)
+    assert op._kind == "add"
+    assert op._appointment is a1
+
+def test_apply():
+    """Test Operation.apply() against a Calendar."""
+    a1 = Appointment("yo","saturday","12:30pm","1:30pm", [1, 2, 3])
+    a1_conf = Appointment("yo_conf","saturday","1:00pm","2:00pm", [3])
+    a2 = Appointment("yerboi","saturday","1:30am","11:30am", [1, 4, 5])
+
+    c = Calendar()
+    assert Operation("add", a1).apply(c)
+    assert c == Calendar(a1)
+    #duplicate and conflicting additions are dropped
+    assert not Operation("add", a1).apply(c)
+    assert not Operation("add", a1_conf).apply(c)
+    assert c == Calendar(a1)
+    assert Operation("add", a2).apply(c)
+    assert Operation("remove", a1).apply(c)
+    assert not Operation("remove", a1).apply(c)
+    assert c == Calendar(a2)
+    #removal frees the slot for the previously conflicting Appointment
+    assert Operation("add", a1_conf).apply(c)
+    assert c == Calendar(a2, a1_conf)
+
+def test_serialize():
+    """Test binary serialization round trip of Operation objects."""
+    def test_ValueError(serial_msg):
+        """Test ValueError raising during Operation.deserialize()."""
+        with pytest.raises(ValueError) as excinfo:
+            Operation.deserialize(serial_msg)
+
+    a1 = Appointment("a # on b","saturday","12:30pm","1:30pm", [1, -2, 300])
+    op = Operation("remove", a1)
+    serial_msg = Operation.serialize(op)
+
+    assert Operation.is_serialized(serial_msg)
+    assert not Operation.is_serialized(Calendar.serialize(Calendar(a1)))
+    assert Operation.serialize(None) is None
+
+    for trusted in (False, True):
+        op_copy = Operation.deserialize(serial_msg, trusted=trusted)
+        assert op_copy._kind == "remove"
+        assert op_copy._appointment == a1
+        assert str(op_copy) == str(op)
+
+    test_ValueError("propose")
+    test_ValueError(serial_msg[:-1])
+    test_ValueError(serial_msg + "\x00")
@@ -0,0 +1,239 @@
+"""Tests for Proposer."""
+
+import time
+from Paxos.Classes.Appointment import Appointment
+from Paxos.Classes.Operation import Operation
+from Paxos.Classes.Batch import Batch
+from Paxos.Classes.Proposer import Proposer
+
+class _RecordingTransport(object):
+    """Transport keeping every message sent instead of sending it."""
+
+    def __init__(self):
+        self._sent = []
+
+    def send(self, message, ID):
+        self._sent.append(message)
+
+    def broadcast(self, message):
+        self._sent.append(message)
+
+def _make_proposer(uid=0, **kwargs):
+    """Return a Proposer of a 3 Node cluster recording what it sends."""
+    ip_table = dict(
+        (i, ["127.0.0.1", 9000 + i, 10000 + i]) for i in range(3))
+    return Proposer(uid, ip_table, transport=_RecordingTransport(), **kwargs)
+
+def _operation(i):
+    """Return an add Operation of Appointment number i."""
+    return Operation("add", Appointment(
+        "a" + str(i), "monday", "1:00am", "1:30am", [i]))
+
+def _kinds(proposer):
+    """Return the types of the messages proposer sent."""
+    return [message[0] for message in proposer._transport._sent]
+
+def test__next_ballot():
+    """Test ballots stay uid modulo 10 and jump past the highest seen."""
+    proposer = _make_proposer(3)
+    assert proposer._next_ballot() == 13
+    assert proposer._next_ballot() == 23
+    proposer._highest_ballot = 57
+    assert proposer._next_ballot() == 63
+    proposer._highest_ballot = 63
+    assert proposer._next_ballot() == 73
+
+def test__recv_promise():
+    """Test accept is sent exactly once, with the highest accepted value."""
+    proposer = _make_proposer()
+    proposer._recv_propose(("propose", _operation(0), 0, 1))
+    assert proposer._transport._sent == [("prepare", 10, 0)]
+
+    #a majority is 2 promises; the third doesn't send accept again
+    other = Batch([_operation(1)])
+    proposer._recv_promise(("promise", None, None, 0, 10, 0))
+    assert _kinds(proposer) == ["prepare"]
+    proposer._recv_promise(("promise", 5, other, 0, 10, 1))
+    proposer._recv_promise(("promise", None, None, 0, 10, 2))
+    assert _kinds(proposer) == ["prepare", "accept"]
+    assert proposer._transport._sent[1][2] == Batch.serialize(other)
+
+    #the slot was taken by another value so ours is queued again
+    assert [op._appointment._name for op in proposer._pending] == ["a0"]
+
+    #promises for superseded ballots or retired slots are ignored
+    proposer._recv_promise(("promise", None, None, 0, 20, 1))
+    proposer._recv_promise(("promise", None, None, 7, 10, 1))
+    assert _kinds(proposer) == ["prepare", "accept"]
+
+def test__recv_ack():
+    """Test commit is sent exactly once and retires the slot."""
+    proposer = _make_proposer()
+    batch = Batch([_operation(0)])
+    proposer._recv_propose(("propose", _operation(0), 0, 1))
+    proposer._recv_promise(("promise", None, None, 0, 10, 0))
+    proposer._recv_promise(("promise", None, None, 0, 10, 1))
+
+    proposer._recv_ack(("ack", 10, batch, 0, 0))
+    proposer._recv_ack(("ack", 5, batch, 0, 1))
+    assert _kinds(proposer) == ["prepare", "accept"]
+    proposer._recv_ack(("ack", 10, batch, 0, 1))
+    proposer._recv_ack(("ack", 10, batch, 0, 2))
+    assert _kinds(proposer) == ["prepare", "accept", "commit"]
+    assert proposer._my_proposals == {}
+    assert proposer._ack_queues == {}
+    assert proposer._deadlines == {}
+
+def test__flush():
+    """Test Operations are batched and the pipeline depth is respected."""
+    proposer = _make_proposer(
+        batch_size=2, batch_window=60.0, pipeline_depth=1)
+
+    #a lone Operation waits for the window to fill its Batch
+    proposer._recv_propose(("propose", _operation(0), 0, 1))
+    assert proposer._transport._sent == []
+    assert 59.0 < proposer._flush_timeout() <= 60.0
+
+    proposer._recv_propose(("propose", _operation(1), 0, 1))
+    assert proposer._transport._sent == [("prepare", 10, 0)]
+    assert len(proposer._my_proposals[0][1]) == 2
+
+    #a full pipeline holds the next full Batch until a slot commits
+    proposer._recv_propose(("propose", _operation(2), 0, 1))
+    proposer._recv_propose(("propose", _operation(3), 0, 1))
+    assert len(proposer._transport._sent) == 1
+    assert len(proposer._pending) == 2
+
+    batch = proposer._my_proposals[0][1]
+    proposer._recv_promise(("promise", None, None, 0, 10, 0))
+    proposer._recv_promise(("promise", None, None, 0, 10, 1))
+    proposer._recv_ack(("ack", 10, batch, 0, 0))
+    proposer._recv_ack(("ack", 10, batch, 0, 1))
+    assert _kinds(proposer) == ["prepare", "accept", "commit", "prepare"]
+    assert proposer._transport._sent[-1] == ("prepare", 20, 1)
+    assert proposer._pending == []
+
+def test__recv_nack():
+    """Test a nacked slot is prepared again with a higher ballot."""
+    proposer = _make_proposer(1)
+    proposer._recv_propose(("propose", _operation(0), 0, 1))
+    proposer._recv_nack(("nack", 42, 0, 0, 11, 2))
+    assert 0 in proposer._retries
+    assert proposer._promise_queues == {}
+
+    proposer._retries[0] = 0.0
+    proposer._retry()
+    assert proposer._transport._sent[-1] == ("prepare", 51, 0)
+
+def test__move_past():
+    """Test slots nacked as compacted are proposed again from that slot."""
+    proposer = _make_proposer(1)
+    proposer._recv_propose(("propose", _operation(0), 0, 1))
+    proposer._recv_propose(("propose", _operation(1), 0, 1))
+
+    #a nack for a stale ballot changes nothing
+    proposer._recv_nack(("nack", -1, 0, 5, 1, 2))
+    assert sorted(proposer._my_proposals.keys()) == [0, 1]
+
+    #slot 1 is below the compacted slot too; both keep their order
+    proposer._recv_nack(("nack", -1, 0, 5, 11, 2))
+    assert [proposer._my_proposals[slot][1]._operations[0]._appointment._name
+            for slot in sorted(proposer._my_proposals.keys())] == ["a0", "a1"]
+    assert sorted(proposer._my_proposals.keys()) == [5, 6]
+    assert proposer._transport._sent[-2:] == [
+        ("prepare", 31, 5), ("prepare", 41, 6)]
+    assert sorted(proposer._deadlines.keys()) == [5, 6]
+    assert proposer._next_slot == 7
+
+def test__expire():
+    """Test a slot whose messages got lost is retried after its deadline."""
+    proposer = _make_proposer()
+    proposer._recv_propose(("propose", _operation(0), 0, 1))
+    proposer._recv_promise(("promise", None, None, 0, 10, 0))
+    assert proposer._flush_timeout() <= Proposer._phase_timeout
+
+    proposer._deadlines[0] = proposer._next_deadline = time.time() - 1
+    proposer._retry()
+    assert 0 in proposer._retries
+    assert proposer._promise_queues == {}
+
+    proposer._retries[0] = 0.0
+    proposer._retry()
+    assert proposer._transport._sent[-1] == ("prepare", 20, 0)
+    assert proposer._deadlines[0] > time.time()
+
+def test__recv_promise_all():
+    """Test a Multi-Paxos leader re-proposes the highest accepted values."""
+    proposer = _make_proposer(multi_paxos=True)
+    proposer._recv_propose(("propose", _operation(0), 0, 1))
+    assert proposer._transport._sent == [("prepare_all", 10, 0)]
+
+    low, high = Batch([_operation(1)]), Batch([_operation(2)])
+    proposer._recv_promise_all(("promise_all", 10, (
+        (0, 3, Batch.serialize(low)), (2, 4, Batch.serialize(low))), 0, 0))
+    assert not proposer._leading
+    proposer._recv_promise_all(("promise_all", 10, (
+        (0, 5, Batch.serialize(high)),), 0, 1))
+    assert proposer._leading
+
+    accepts = dict((message[3], message[2])
+                    for message in proposer._transport._sent[1:])
+    assert accepts == {
+        0: Batch.serialize(high), 2: Batch.serialize(low)}
+    assert [op._appointment._name for op in proposer._pending] == ["a0"]
+    assert proposer._next_slot == 3
+
+    #later slots skip the prepare phase; the requeued Operation goes first
+    proposer._recv_propose(("propose", _operation(3), 0, 1))
+    assert [message[::3] for message in proposer._transport._sent[-2:]] == [
+        ("accept", 3), ("accept", 4)]
+    assert proposer._my_proposals[3][1]._operations[0]._appointment._name \
+        == "a0"
+
+def test__step_down():
+    """Test a higher ballot ends leadership and held slots wait for a retry."""
+    proposer = _make_proposer(multi_paxos=True)
+    proposer._recv_propose(("propose", _operation(0), 0, 1))
+    proposer._recv_promise_all(("promise_all", 10, (), 0, 0))
+    proposer._recv_promise_all(("promise_all", 10, (), 0, 1))
+    assert proposer._leading
+
+    #a lower ballot changes nothing
+    proposer._step_down(5)
+    assert proposer._leading
+
+    proposer._step_down(31)
+    assert not proposer._leading
+    assert proposer._leader_ballot is None
+    assert 0 in proposer._retries
+
+    #new proposals are held until the retry prepares every slot in flight
+    proposer._recv_propose(("propose", _operation(1), 0, 1))
+    assert proposer._my_proposals[1][0] is None
+    num_sent = len(proposer._transport._sent)
+
+    proposer._retries[0] = 0.0
+    proposer._retry()
+    assert len(proposer._transport._sent) == num_sent + 1
+    assert proposer._transport._sent[-1] == ("prepare_all", 40, 0)
+    assert proposer._my_proposals[1][0] == 40
+
+def test__recv_fill():
+    """Test empty slots get no-ops unless a value was accepted for them."""
+    proposer = _make_proposer(multi_paxos=True)
+    proposer._recv_fill(("fill", (2, 3)))
+    assert proposer._transport._sent == [("prepare", 10, 2), ("prepare", 20, 3)]
+
+    #slots already in flight are left alone
+    proposer._recv_fill(("fill", (2,)))
+    assert len(proposer._transport._sent) == 2
+
+    accepted = Batch([_operation(0)])
+    for sender_ID in range(2):
+        proposer._recv_promise(("promise", None, None, 2, 10, sender_ID))
+    proposer._recv_promise(("promise", 5, accepted, 3, 20, 0))
+    proposer._recv_promise(("promise", None, None, 3, 20, 1))
+    assert proposer._transport._sent[2:] == [
+        ("accept", 10, Batch.serialize(Batch.noop()), 2),
+        ("accept", 20, Batch.serialize(accepted), 3)]
+    assert proposer._pending == []
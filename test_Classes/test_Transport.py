@@ -0,0 +1,169 @@
+"""Tests for UDPTransport and TCPTransport."""
+
+import time
+import pickle
+import random
+import socket
+import pytest
+from Paxos.Classes.Transport import UDPTransport, TCPTransport
+
+class _LoopbackTransport(UDPTransport):
+    """UDPTransport keeping every datagram sent instead of sending it."""
+
+    def __init__(self):
+        UDPTransport.__init__(self, {0: ["127.0.0.1", 9000, 10000]})
+        self._datagrams = []
+
+    def _sendto(self, data, address):
+        self._datagrams.append(data)
+
+def test_send_raw():
+    """Test small messages go out as a single datagram."""
+    transport = _LoopbackTransport()
+    transport.send_raw("terminate", 0)
+    assert transport._datagrams == ["terminate"]
+    assert transport.reassemble("terminate", "addr") == "terminate"
+
+def test_reassemble():
+    """Test large messages are fragmented and reassembled in any order."""
+    transport = _LoopbackTransport()
+    data = "".join([chr(random.randint(0, 255)) for i in range(10000)])
+    transport.send_raw(data, 0)
+
+    datagrams = transport._datagrams
+    assert len(datagrams) == 8
+    assert all([len(datagram) <= 4096 for datagram in datagrams])
+
+    random.shuffle(datagrams)
+    results = [transport.reassemble(datagram, "addr")
+                for datagram in datagrams]
+    assert results[:-1] == [None] * 7
+    assert results[-1] == data
+    assert transport._partial == {}
+
+    #fragments from another address don't complete the message
+    transport.send_raw(data, 0)
+    for datagram in transport._datagrams[8:-1]:
+        assert transport.reassemble(datagram, "addr") is None
+    assert transport.reassemble(transport._datagrams[-1], "other") is None
+
+def test_reassemble_bounds():
+    """Test buffered partial messages are bounded and expire."""
+    transport = _LoopbackTransport()
+    for i in range(UDPTransport._max_partial + 10):
+        transport.send_raw("x" * 2000, 0)
+        transport.reassemble(transport._datagrams[-2], "addr")
+    assert len(transport._partial) == UDPTransport._max_partial
+
+    for key, (started, count, chunks) in transport._partial.items():
+        transport._partial[key] = (
+            started - UDPTransport._reassembly_timeout - 1, count, chunks)
+    transport.send_raw("x" * 2000, 0)
+    transport.reassemble(transport._datagrams[-2], "addr")
+    assert len(transport._partial) == 1
+
+def test__lookup_sender():
+    """Test Nodes sharing an IP are told apart by port, with IP fallback."""
+    transport = UDPTransport({
+        0: ["127.0.0.1", 9000, 10000], 1: ["127.0.0.1", 9001, 10001],
+        2: ["127.0.0.2", 9002, 10002]})
+    table = transport._address_table
+    assert UDPTransport._lookup_sender(table, ("127.0.0.1", 10000)) == 0
+    assert UDPTransport._lookup_sender(table, ("127.0.0.1", 10001)) == 1
+    assert UDPTransport._lookup_sender(table, ("127.0.0.2", 10002)) == 2
+
+    #an unbound sender is known by IP only if the IP hosts a single Node
+    assert UDPTransport._lookup_sender(table, ("127.0.0.2", 40000)) == 2
+    assert UDPTransport._lookup_sender(table, ("127.0.0.1", 40000)) is None
+    assert UDPTransport._lookup_sender(table, ("10.0.0.1", 10000)) is None
+
+    #datagrams of two Nodes on one IP are attributed to the right one
+    ports = _free_ports(2, socket.SOCK_DGRAM)
+    ip_table = dict(
+        (i, ["127.0.0.1", 0, port]) for i, port in enumerate(ports))
+    t0, t1 = UDPTransport(ip_table), UDPTransport(ip_table)
+    t0.bind(ports[0], "127.0.0.1")
+    t1.bind(ports[1], "127.0.0.1")
+    t0.send_raw("from 0", 1)
+    t1.send_raw("from 1", 1)
+    assert sorted([t1.recv(1), t1.recv(1)]) == [("from 0", 0), ("from 1", 1)]
+    t0.close()
+    t1.close()
+
+def _free_ports(num_ports, kind=socket.SOCK_STREAM):
+    """Return num_ports ports of socket type kind free on localhost."""
+    sockets, ports = [], []
+    for i in range(num_ports):
+        s = socket.socket(socket.AF_INET, kind)
+        s.bind(("127.0.0.1", 0))
+        sockets.append(s)
+        ports.append(s.getsockname()[1])
+    for s in sockets:
+        s.close()
+    return ports
+
+def test_TCPTransport():
+    """Test TCPTransport delivery, ordering and reconnection."""
+    with pytest.raises(TypeError) as excinfo:
+        TCPTransport({}, None)
+
+    ports = _free_ports(2)
+    ip_table = dict(
+        (i, ["127.0.0.1", 0, port]) for i, port in enumerate(ports))
+    t0, t1 = TCPTransport(ip_table, 0), TCPTransport(ip_table, 1)
+    t0.bind(ports[0], "127.0.0.1")
+    t1.bind(ports[1], "127.0.0.1")
+
+    with pytest.raises(KeyError) as excinfo:
+        t0.send("x", 2)
+
+    #messages to self skip the network
+    t0.send_raw("terminate", 0)
+    assert t0.recv(1) == ("terminate", 0)
+
+    #many messages arrive in order, whatever the write coalescing
+    for i in range(200):
+        t0.send(("accept", i), 1)
+    t0.send_raw("x" * 100000, 1)
+    received = [t1.recv(5) for i in range(201)]
+    assert [pickle.loads(data) for data, ID in received[:200]] == [
+        ("accept", i) for i in range(200)]
+    assert received[200] == ("x" * 100000, 0)
+    assert t1.recv(0.1) is None
+
+    #a restarted peer gets later messages over a new connection
+    t1.close()
+    time.sleep(0.1)
+    t1 = TCPTransport(ip_table, 1)
+    t1.bind(ports[1], "127.0.0.1")
+    t0.broadcast("again")
+    assert pickle.loads(t0.recv(1)[0]) == "again"
+    assert pickle.loads(t1.recv(5)[0]) == "again"
+
+    t0.close()
+    t1.close()
+
+def test_drop_unsent():
+    """Test frames for a down peer are dropped instead of replayed later."""
+    ports = _free_ports(2)
+    ip_table = dict(
+        (i, ["127.0.0.1", 0, port]) for i, port in enumerate(ports))
+    with pytest.raises(TypeError) as excinfo:
+        TCPTransport(ip_table, 0, drop_unsent=1)
+
+    t0 = TCPTransport(ip_table, 0, drop_unsent=True)
+    for i in range(5):
+        t0.send(("stale", i), 1)
+    deadline = time.time() + 5
+    while not t0._outboxes[1].empty() and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(TCPTransport._reconnect_delay * 2)
+
+    t1 = TCPTransport(ip_table, 1)
+    t1.bind(ports[1], "127.0.0.1")
+    t0.send("fresh", 1)
+    assert pickle.loads(t1.recv(5)[0]) == "fresh"
+    assert t1.recv(0.1) is None
+
+    t0.close()
+    t1.close()
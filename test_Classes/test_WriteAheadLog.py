@@ -0,0 +1,73 @@
+"""Tests for WriteAheadLog."""
+
+import os
+import pytest
+from Paxos.Classes.WriteAheadLog import WriteAheadLog
+
+def test___init__(tmpdir):
+    """Test construction of WriteAheadLog object."""
+    path = str(tmpdir.join("state.wal"))
+
+    with pytest.raises(TypeError) as excinfo:
+        WriteAheadLog(None)
+    with pytest.raises(TypeError) as excinfo:
+        WriteAheadLog(path, "1")
+    with pytest.raises(ValueError) as excinfo:
+        WriteAheadLog(path, 0)
+
+    wal = WriteAheadLog(path)
+    assert wal.is_empty()
+    assert os.path.exists(path)
+
+def test_sync(tmpdir):
+    """Test records become durable in order only once synced."""
+    path = str(tmpdir.join("state.wal"))
+    wal = WriteAheadLog(path, 2)
+
+    wal.append(("prepare", 3))
+    assert not wal.is_full()
+    assert WriteAheadLog.read(path) == []
+    wal.append(("accept", 3, "\x00PB", 0))
+    assert wal.is_full()
+
+    wal.sync()
+    assert wal._num_syncs == 1
+    assert WriteAheadLog.read(path) == [("prepare", 3), ("accept", 3, "\x00PB", 0)]
+
+    #nothing pending; no extra fsync
+    wal.sync()
+    assert wal._num_syncs == 1
+
+def test_read(tmpdir):
+    """Test a torn tail is dropped on read and truncated on reopen."""
+    path = str(tmpdir.join("state.wal"))
+    assert WriteAheadLog.read(path) == []
+
+    wal = WriteAheadLog(path)
+    wal.append(("node", 1))
+    wal.append(("prepare", 5))
+    wal.close()
+    intact = os.path.getsize(path)
+
+    with open(path, "ab") as f:
+        f.write("\x00\x00\x00\x20garbage")
+    assert WriteAheadLog.read(path) == [("node", 1), ("prepare", 5)]
+
+    wal = WriteAheadLog(path)
+    assert os.path.getsize(path) == intact
+    wal.append(("prepare", 6))
+    wal.close()
+    assert WriteAheadLog.read(path) == [("node", 1), ("prepare", 5), ("prepare", 6)]
+
+def test_checkpoint(tmpdir):
+    """Test checkpoint() empties the log after writing the snapshot."""
+    path = str(tmpdir.join("state.wal"))
+    wal = WriteAheadLog(path)
+    wal.append(("prepare", 5))
+    wal.sync()
+
+    snapshots = []
+    wal.checkpoint(lambda: snapshots.append(WriteAheadLog.read(path)))
+    assert snapshots == [[("prepare", 5)]]
+    assert wal.is_empty()
+    assert WriteAheadLog.read(path) == []